@@ -2,21 +2,31 @@
 import os
 import json
 import time
+import asyncio
+import contextvars
 import logging
 from typing import Dict, List, Any, Optional
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_classic.agents import AgentExecutor, create_openai_tools_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import SystemMessage
 from langchain_classic.memory import ConversationBufferMemory
 from langchain.tools import tool
 import httpx
 
+# Модуль запускается и как скрипт (run_all.py), и как часть пакета ai_agent
+try:
+    from . import llm_cache
+except ImportError:
+    import llm_cache
+
 load_dotenv()
 
 # Конфигурация
 MODEL = os.getenv("SBER_MODEL", "Qwen/Qwen3-Next-80B-A3B-Instruct")
+# Дисковый кеш ответов LLM (llm_cache.py)
+LLM_CACHE_ENABLED = os.getenv("CAD_LLM_CACHE", "1") == "1"
 
 # Настройка логирования
 logging.basicConfig(
@@ -30,8 +40,8 @@ logging.basicConfig(
 logger = logging.getLogger("CADAgent")
 
 # ============ ИНИЦИАЛИЗАЦИЯ LLM С SBERCLOUD ============
-def get_llm():
-    """Инициализация LLM для SberCloud через LangChain"""
+def get_llm(cache=None):
+    """Инициализация LLM для SberCloud через LangChain (cache - кеш ответов, llm_cache.py)"""
     
     api_key = os.getenv("API_KEY")
     if not api_key:
@@ -45,13 +55,63 @@ def get_llm():
         max_tokens=2000,
         timeout=60.0,
         max_retries=2,
+        cache=cache,
         presence_penalty=0,
         frequency_penalty=0.1,
         model_kwargs={}
     )
 
+# ============ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ============
+def _to_json(data: Any) -> str:
+    """Компактный JSON для ответа инструмента: без отступов, меньше токенов в контексте LLM."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+# ============ HTTP КЛИЕНТ К ГЕЙТВЕЮ ============
+GATEWAY_URL = os.getenv("CAD_GATEWAY_URL", "http://localhost:8001").rstrip("/")
+
+# Один клиент с пулом keep-alive соединений на все инструменты и разговоры.
+# Клиент привязан к event loop, в котором создан: в новом loop создается новый.
+_http: Optional[httpx.AsyncClient] = None
+_http_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# id разговора текущего запроса: передается гейтвею в X-CAD-Session, чтобы у
+# каждого разговора был свой текущий документ (sessions.py)
+_conversation: contextvars.ContextVar = contextvars.ContextVar("cad_conversation", default=None)
+
+async def _add_session_header(request: httpx.Request):
+    conversation = _conversation.get()
+    if conversation is not None:
+        request.headers.setdefault("X-CAD-Session", conversation)
+        request.headers.setdefault("X-CAD-Client", conversation)
+
+def _gateway() -> httpx.AsyncClient:
+    """Общий асинхронный клиент гейтвея для текущего event loop."""
+    global _http, _http_loop
+    loop = asyncio.get_running_loop()
+    if _http is None or _http_loop is not loop:
+        _http = httpx.AsyncClient(
+            base_url=GATEWAY_URL,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            event_hooks={"request": [_add_session_header]}
+        )
+        _http_loop = loop
+    return _http
+
+async def aclose_http():
+    """Закрыть общий клиент (при остановке приложения)."""
+    global _http, _http_loop
+    if _http is not None and _http_loop is asyncio.get_running_loop():
+        await _http.aclose()
+    _http, _http_loop = None, None
+
+async def _get_json(path: str, params: Optional[Dict[str, Any]] = None, timeout: float = 30.0) -> str:
+    response = await _gateway().get(path, params=params, timeout=timeout)
+    response.raise_for_status()
+    return _to_json(response.json())
+
 # ============ ВСПОМОГАТЕЛЬНАЯ ФУНКЦИЯ ДЛЯ СОЗДАНИЯ ФИГУР ============
-def _create_shape_http(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
+async def _create_shape_http(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
     """Внутренняя функция для создания фигуры через FastAPI."""
     try:
         params = {
@@ -61,38 +121,39 @@ def _create_shape_http(shape_type: str, size: float, x: float = 0.0, y: float =
             "y": y,
             "z": z
         }
-        response = httpx.get(
-            "http://localhost:8001/api/cad/create-shape",
-            params=params,
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
+        return await _get_json("/api/cad/create-shape", params)
         
     except Exception as e:
         error_msg = f"Ошибка создания {shape_type}: {str(e)}"
         logger.error(error_msg)
         return json.dumps({"error": error_msg})
 
+# ETag последних ответов read-эндпоинтов: неизменившиеся ответы приходят как 304 без тела
+_health_etags: Dict[str, str] = {}
+
+async def _check_endpoint(path: str) -> bool:
+    """GET с If-None-Match; 200 и 304 означают, что эндпоинт работает."""
+    headers = {"If-None-Match": _health_etags[path]} if path in _health_etags else {}
+    response = await _gateway().get(path, headers=headers, timeout=5.0)
+    if "etag" in response.headers:
+        _health_etags[path] = response.headers["etag"]
+    return response.status_code in (200, 304)
+
 # ============ ИНСТРУМЕНТЫ LANGCHAIN ============
 @tool
-def get_health() -> str:
+async def get_health() -> str:
     """Проверить здоровье системы через FastAPI."""
     logger.info("Проверка здоровья системы через FastAPI")
     
     try:
-        # Проверяем FastAPI
-        fastapi_resp = httpx.get("http://localhost:8001/", timeout=5.0)
+        # FastAPI, MCP и CAD проверяются одновременно
+        fastapi_resp, mcp_ok, cad_ok = await asyncio.gather(
+            _gateway().get("/", timeout=5.0),
+            _check_endpoint("/api/mcp/status"),
+            _check_endpoint("/api/cad/documents")
+        )
         fastapi_ok = fastapi_resp.status_code == 200
         
-        # Проверяем MCP через FastAPI эндпоинт
-        mcp_resp = httpx.get("http://localhost:8001/api/mcp/status", timeout=5.0)
-        mcp_ok = mcp_resp.status_code == 200
-        
-        # Проверяем CAD через FastAPI
-        cad_resp = httpx.get("http://localhost:8001/api/cad/documents", timeout=5.0)
-        cad_ok = cad_resp.status_code == 200
-        
         result = {
             "fastapi_server": fastapi_ok,
             "mcp_server": mcp_ok,
@@ -101,7 +162,7 @@ def get_health() -> str:
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        return _to_json(result)
         
     except Exception as e:
         error_msg = f"Ошибка проверки здоровья: {str(e)}"
@@ -109,18 +170,12 @@ def get_health() -> str:
         return json.dumps({"error": error_msg})
 
 @tool
-def open_document(file_path: str) -> str:
+async def open_document(file_path: str) -> str:
     """Открыть или создать документ через FastAPI."""
     logger.info(f"Открытие документа через FastAPI: {file_path}")
     
     try:
-        response = httpx.get(
-            "http://localhost:8001/api/cad/open-document",
-            params={"file_path": file_path},
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
+        return await _get_json("/api/cad/open-document", {"file_path": file_path})
         
     except Exception as e:
         error_msg = f"Ошибка открытия документа: {str(e)}"
@@ -128,19 +183,13 @@ def open_document(file_path: str) -> str:
         return json.dumps({"error": error_msg})
 
 @tool
-def save_document(file_path: Optional[str] = None) -> str:
+async def save_document(file_path: Optional[str] = None) -> str:
     """Сохранить текущий документ через FastAPI."""
     logger.info(f"Сохранение документа через FastAPI: {file_path or 'текущий'}")
     
     try:
         params = {"file_path": file_path} if file_path else {}
-        response = httpx.get(
-            "http://localhost:8001/api/cad/save-document",
-            params=params,
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
+        return await _get_json("/api/cad/save-document", params)
         
     except Exception as e:
         error_msg = f"Ошибка сохранения документа: {str(e)}"
@@ -148,17 +197,12 @@ def save_document(file_path: Optional[str] = None) -> str:
         return json.dumps({"error": error_msg})
 
 @tool
-def close_document() -> str:
+async def close_document() -> str:
     """Закрыть текущий документ через FastAPI."""
     logger.info("Закрытие документа через FastAPI")
     
     try:
-        response = httpx.get(
-            "http://localhost:8001/api/cad/close-document",
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
+        return await _get_json("/api/cad/close-document")
         
     except Exception as e:
         error_msg = f"Ошибка закрытия документа: {str(e)}"
@@ -166,41 +210,59 @@ def close_document() -> str:
         return json.dumps({"error": error_msg})
 
 @tool
-def create_shape(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
+async def execute_plan(steps: List[Dict[str, Any]]) -> str:
+    """
+    Выполнить несколько CAD операций одним вызовом как одну транзакцию.
+    steps - список шагов {"op": операция, ...параметры}; операции: open_document(file_path),
+    create_shape(shape_type, size, x, y, z), create_complex_shape(shape_type, ...),
+    update_object(name, ...), delete_object(name), save_document(file_path), close_document().
+    При ошибке шага изменения всех шагов отменяются.
+    """
+    logger.info(f"Выполнение плана через FastAPI: шагов {len(steps)}")
+    
+    try:
+        response = await _gateway().post("/api/cad/plan", json={"steps": steps}, timeout=120.0)
+        # 409 - план откатился, в ответе результаты шагов
+        if response.status_code != 409:
+            response.raise_for_status()
+        return _to_json(response.json())
+        
+    except Exception as e:
+        error_msg = f"Ошибка выполнения плана: {str(e)}"
+        logger.error(error_msg)
+        return json.dumps({"error": error_msg})
+
+@tool
+async def create_shape(shape_type: str, size: float, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
     """Создать фигуру через FastAPI."""
     logger.info(f"Создание фигуры через FastAPI: {shape_type}")
-    return _create_shape_http(shape_type, size, x, y, z)
+    return await _create_shape_http(shape_type, size, x, y, z)
 
 @tool
-def create_cube(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
+async def create_cube(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
     """Создать куб через FastAPI."""
     logger.info(f"Создание куба через FastAPI, размер: {size}")
-    return _create_shape_http("cube", size, x, y, z)
+    return await _create_shape_http("cube", size, x, y, z)
 
 @tool
-def create_sphere(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
+async def create_sphere(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
     """Создать сферу через FastAPI."""
     logger.info(f"Создание сферы через FastAPI, диаметр: {size}")
-    return _create_shape_http("sphere", size, x, y, z)
+    return await _create_shape_http("sphere", size, x, y, z)
 
 @tool
-def create_cylinder(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
+async def create_cylinder(size: float = 10.0, x: float = 0.0, y: float = 0.0, z: float = 0.0) -> str:
     """Создать цилиндр через FastAPI."""
     logger.info(f"Создание цилиндра через FastAPI, диаметр: {size}")
-    return _create_shape_http("cylinder", size, x, y, z)
+    return await _create_shape_http("cylinder", size, x, y, z)
 
 @tool 
-def get_documents() -> str:
+async def get_documents() -> str:
     """Получить список документов через FastAPI."""
     logger.info("Получение документов через FastAPI")
     
     try:
-        response = httpx.get(
-            "http://localhost:8001/api/cad/documents",
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
+        return await _get_json("/api/cad/documents")
         
     except Exception as e:
         error_msg = f"Ошибка получения документов: {str(e)}"
@@ -208,23 +270,93 @@ def get_documents() -> str:
         return json.dumps({"error": error_msg})
 
 @tool
-def get_mcp_status() -> str:
+async def get_mcp_status() -> str:
     """Получить статус MCP через FastAPI."""
     logger.info("Получение статуса MCP через FastAPI")
     
     try:
-        response = httpx.get(
-            "http://localhost:8001/api/mcp/status",
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return json.dumps(response.json(), ensure_ascii=False, indent=2)
+        return await _get_json("/api/mcp/status")
         
     except Exception as e:
         error_msg = f"Ошибка получения статуса MCP: {str(e)}"
         logger.error(error_msg)
         return json.dumps({"error": error_msg})
 
+# ============ ПАРАЛЛЕЛЬНЫЕ ВЫЗОВЫ ИНСТРУМЕНТОВ ============
+# Как вызов упорядочивается относительно других вызовов того же шага агента.
+# Все инструменты работают с текущим документом разговора:
+#   None        - не касается документа, выполняется сразу;
+#   "shared"    - независим от других shared вызовов (фигуры получают уникальные
+#                 имена), выполняется одновременно с ними;
+#   "exclusive" - меняет сам документ (открыть, сохранить, закрыть, план): ждет
+#                 все предыдущие вызовы, следующие ждут его.
+# Инструменты, которых нет в таблице, считаются exclusive.
+TOOL_ORDERING = {
+    "get_health": None,
+    "get_mcp_status": None,
+    "get_documents": "shared",
+    "create_shape": "shared",
+    "create_cube": "shared",
+    "create_sphere": "shared",
+    "create_cylinder": "shared",
+}
+
+class DocumentLane:
+    """
+    Очередь вызовов над документом разговора: shared вызовы между двумя
+    exclusive выполняются одновременно, exclusive - строго в порядке вызова.
+    Порядок фиксирует ticket(), поэтому его надо вызывать в порядке вызовов LLM.
+    """
+    
+    def __init__(self):
+        self._exclusive: Optional[asyncio.Future] = None
+        self._shared: List[asyncio.Future] = []
+    
+    def ticket(self, ordering: Optional[str]) -> "_LaneTicket":
+        if ordering is None:
+            return _LaneTicket([], None)
+        done = asyncio.get_running_loop().create_future()
+        if ordering == "shared":
+            waits = [self._exclusive]
+            self._shared = [f for f in self._shared if not f.done()] + [done]
+        else:
+            waits = [self._exclusive, *self._shared]
+            self._exclusive, self._shared = done, []
+        return _LaneTicket([f for f in waits if f is not None], done)
+
+class _LaneTicket:
+    def __init__(self, waits: List[asyncio.Future], done: Optional[asyncio.Future]):
+        self.waits = waits
+        self.done = done
+    
+    async def __aenter__(self):
+        for future in self.waits:
+            await future
+    
+    async def __aexit__(self, *exc_info):
+        if self.done is not None and not self.done.done():
+            self.done.set_result(None)
+        return False
+
+# Очередь документа текущего запроса агента (aprocess)
+_lane: contextvars.ContextVar = contextvars.ContextVar("cad_document_lane", default=None)
+
+class ParallelToolsAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor, который выполняет вызовы инструментов одного шага
+    одновременно (асинхронный путь LangChain запускает их через gather),
+    сохраняя порядок вызовов, меняющих документ (TOOL_ORDERING).
+    """
+    
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        lane = _lane.get()
+        if lane is None:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        # Билет берется до первого await: задачи gather стартуют в порядке вызовов
+        ticket = lane.ticket(TOOL_ORDERING.get(agent_action.tool, "exclusive"))
+        async with ticket:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
 # ============ КЛАСС ПОЛНОЦЕННОГО АГЕНТА ============
 class FullCADAgent:
     """Полноценный CAD агент с памятью и продвинутыми функциями"""
@@ -235,11 +367,9 @@ class FullCADAgent:
         if not api_key:
             raise ValueError("API_KEY не найден в .env. Установите API_KEY для SberCloud")
         
-        # Инициализация LLM
-        self.llm = get_llm()
-        
         # Сбор всех инструментов
         self.tools = [
+            execute_plan,
             open_document,
             save_document,
             close_document,
@@ -252,25 +382,27 @@ class FullCADAgent:
             get_health
         ]
         
-        # Инициализация памяти
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # Инициализация LLM; повторяющиеся запросы отвечаются из дискового кеша
+        self.llm_cache = llm_cache.LLMResponseCache(MODEL, self.tools) if LLM_CACHE_ENABLED else None
+        self.llm = get_llm(cache=self.llm_cache)
+        
+        # Память разговоров: у каждого conversation_id своя история (None - разговор по умолчанию)
+        self.memories: Dict[Optional[str], ConversationBufferMemory] = {}
+        self.memory = self._memory(None)
         
         # Создание промпта
         self.prompt = ChatPromptTemplate.from_messages([
             SystemMessage(content="""Ты - профессиональный AI ассистент для CAD системы FreeCAD.
-            Используй доступные инструменты для выполнения задач. Всегда работай последовательно:
-            1. Открой документ (open_document)
-            2. Создай фигуру (create_shape, create_cube и т.д.)
-            3. Сохрани документ (save_document)
-            4. Закрой документ (close_document)
+            Используй доступные инструменты для выполнения задач. Работа с документом
+            всегда идет в порядке: открыть документ → создать/изменить фигуры → сохранить → закрыть.
+            Выполняй такую последовательность одним вызовом execute_plan; отдельные
+            инструменты (open_document, create_shape, save_document, close_document и т.д.)
+            используй, только если следующий шаг зависит от результата предыдущего.
             
             Будь точным и профессиональным. Отвечай на русском языке.
             
             Примеры команд:
-            - "Создай куб 20мм" → open_document(auto_cube.FCStd) → create_cube(size=20) → save_document() → close_document()
+            - "Создай куб 20мм" → execute_plan(steps=[{"op": "open_document", "file_path": "auto_cube.FCStd"}, {"op": "create_shape", "shape_type": "cube", "size": 20}, {"op": "save_document"}, {"op": "close_document"}])
             - "Покажи все документы" → get_documents()
             - "Проверь здоровье системы" → get_health()
             """),
@@ -286,11 +418,12 @@ class FullCADAgent:
             prompt=self.prompt
         )
         
-        # Создание исполнителя
-        self.agent_executor = AgentExecutor(
+        # Создание исполнителя. Память не привязана к нему, а передается в каждый
+        # вызов, поэтому один исполнитель обслуживает одновременные разговоры.
+        # Независимые вызовы инструментов одного шага выполняются одновременно
+        self.agent_executor = ParallelToolsAgentExecutor(
             agent=self.agent,
             tools=self.tools,
-            memory=self.memory,
             verbose=True,
             handle_parsing_errors=True,
             max_iterations=5
@@ -300,18 +433,41 @@ class FullCADAgent:
         logger.info(f"Модель: {MODEL}")
         logger.info(f"Инструментов: {len(self.tools)}")
     
-    def process(self, query: str) -> Dict[str, Any]:
-        """Обработать запрос пользователя"""
+    def _memory(self, conversation_id: Optional[str]) -> ConversationBufferMemory:
+        memory = self.memories.get(conversation_id)
+        if memory is None:
+            memory = self.memories[conversation_id] = ConversationBufferMemory(
+                memory_key="chat_history",
+                return_messages=True
+            )
+        return memory
+    
+    async def aprocess(self, query: str, conversation_id: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Обработать запрос пользователя асинхронно.
+        
+        Запросы разных разговоров (conversation_id) выполняются одновременно в
+        одном процессе; у каждого разговора своя история и свой текущий
+        документ на гейтвее (X-CAD-Session). use_cache=False - ответы модели
+        не берутся из кеша и не сохраняются в него.
+        """
         logger.info(f"📨 Запрос: {query}")
+        memory = self._memory(conversation_id)
+        token = _conversation.set(conversation_id)
+        lane_token = _lane.set(DocumentLane())
+        cache_token = llm_cache.use_cache.set(use_cache)
         
         try:
             # Запуск агента
-            result = self.agent_executor.invoke({"input": query})
+            history = memory.load_memory_variables({})["chat_history"]
+            result = await self.agent_executor.ainvoke({"input": query, "chat_history": history})
+            output = result.get("output", "Нет ответа")
+            memory.save_context({"input": query}, {"output": output})
             
             response = {
                 "success": True,
                 "query": query,
-                "response": result.get("output", "Нет ответа")
+                "response": output
             }
             
             logger.info("✅ Запрос успешно обработан")
@@ -325,10 +481,44 @@ class FullCADAgent:
                 "error": str(e),
                 "response": f"Произошла ошибка при обработке запроса: {str(e)}"
             }
+        finally:
+            llm_cache.use_cache.reset(cache_token)
+            _lane.reset(lane_token)
+            _conversation.reset(token)
     
-    def clear_memory(self):
-        """Очистить память агента"""
-        self.memory.clear()
+    def process(self, query: str, conversation_id: Optional[str] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Обработать запрос пользователя (синхронная обертка над aprocess).
+        
+        Каждый вызов работает в своем event loop, поэтому общий клиент гейтвея
+        закрывается вместе с ним. Внутри работающего event loop используйте aprocess.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("process() нельзя вызывать внутри event loop - используйте await aprocess()")
+        
+        async def run():
+            try:
+                return await self.aprocess(query, conversation_id, use_cache)
+            finally:
+                await aclose_http()
+        return asyncio.run(run())
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Статистика кеша ответов LLM."""
+        if self.llm_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.llm_cache.stats()}
+    
+    def clear_memory(self, conversation_id: Optional[str] = None):
+        """Очистить память разговора"""
+        if conversation_id is None:
+            self.memory.clear()
+        else:
+            self.memories.pop(conversation_id, None)
         logger.info("🧹 Память агента очищена")
 
 # ============ SINGLETON ДЛЯ ПРОЕКТА ============
@@ -352,24 +542,31 @@ if __name__ == "__main__":
         print(f"Инструментов: {len(agent.tools)}")
         print("=" * 60)
         
-        # Тестовый запрос
-        test_query = "Проверь здоровье системы"
-        print(f"Тестовый запрос: {test_query}")
-        result = agent.process(test_query)
-        print(f"Ответ: {result['response']}")
-        print("=" * 60)
-        
-        # Интерактивный режим
-        print("Чат с агентом (нажмите Ctrl+C для выхода)")
-        print("-" * 50)
+        async def chat():
+            # Один event loop на весь чат: общий HTTP клиент переиспользует соединения
+            try:
+                # Тестовый запрос
+                test_query = "Проверь здоровье системы"
+                print(f"Тестовый запрос: {test_query}")
+                result = await agent.aprocess(test_query)
+                print(f"Ответ: {result['response']}")
+                print("=" * 60)
+                
+                # Интерактивный режим
+                print("Чат с агентом (нажмите Ctrl+C для выхода)")
+                print("-" * 50)
+                
+                while True:
+                    user_input = (await asyncio.to_thread(input, "Вы: ")).strip()
+                    if not user_input:
+                        continue
+                    
+                    result = await agent.aprocess(user_input)
+                    print(f"🤖 Агент: {result['response']}\n")
+            finally:
+                await aclose_http()
         
-        while True:
-            user_input = input("Вы: ").strip()
-            if not user_input:
-                continue
-            
-            result = agent.process(user_input)
-            print(f"🤖 Агент: {result['response']}\n")
+        asyncio.run(chat())
             
     except Exception as e:
         print(f"❌ Ошибка инициализации: {str(e)}")
@@ -0,0 +1,147 @@
+# llm_cache.py
+"""
+Дисковый кеш ответов LLM для CAD агента.
+
+Пользователи часто повторяют запросы дословно ("Создай куб 20мм",
+"Проверь здоровье системы"), и каждый из них - полный вызов удаленной
+модели. Кеш подключается к ChatOpenAI как LangChain BaseCache (get_llm)
+и хранит ответы в diskcache.
+
+Ключ - нормализованный промпт (сообщения без служебных id и метаданных,
+с сжатыми пробелами), хеш схем инструментов и модель: ответ с вызовами
+инструментов не переиспользуется, если набор инструментов изменился.
+Инструменты из закешированного ответа все равно выполняются - кешируется
+только решение модели, а не изменения в документе.
+
+Размер кеша ограничен (CAD_LLM_CACHE_SIZE_MB), при переполнении удаляются
+давно не читавшиеся записи. Запрос может обойти кеш (use_cache=False
+в FullCADAgent.aprocess).
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence
+
+import diskcache
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+logger = logging.getLogger("CADAgent.LLMCache")
+
+CACHE_DIR = os.getenv("CAD_LLM_CACHE_DIR", ".llm_cache")
+CACHE_SIZE_MB = int(os.getenv("CAD_LLM_CACHE_SIZE_MB", "256"))
+# Срок жизни записи в секундах (0 - без срока, только вытеснение по размеру)
+CACHE_TTL = float(os.getenv("CAD_LLM_CACHE_TTL", "0"))
+
+# Поля сообщений, которые не влияют на ответ модели, но отличаются от вызова к вызову
+_VOLATILE_KEYS = {"id", "tool_call_id", "response_metadata", "usage_metadata"}
+
+# Использовать ли кеш в текущем запросе агента
+use_cache: contextvars.ContextVar = contextvars.ContextVar("cad_llm_cache", default=True)
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in _VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", value)).strip()
+    return value
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Промпт LangChain (JSON сообщений) в каноническом виде."""
+    try:
+        return json.dumps(_normalize(json.loads(prompt)), ensure_ascii=False, sort_keys=True)
+    except ValueError:
+        return _normalize(prompt)
+
+
+def tool_schema_hash(tools: Sequence[Any]) -> str:
+    """Хеш схем инструментов в том виде, в котором они уходят модели."""
+    schemas = sorted(
+        (convert_to_openai_tool(tool) for tool in tools),
+        key=lambda schema: schema["function"]["name"]
+    )
+    return hashlib.sha256(json.dumps(schemas, ensure_ascii=False, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class LLMResponseCache(BaseCache):
+    """Кеш ответов модели в diskcache с вытеснением по размеру и статистикой попаданий."""
+
+    def __init__(self, model: str, tools: Sequence[Any] = (), directory: str = CACHE_DIR,
+                 size_limit_mb: int = CACHE_SIZE_MB, ttl: float = CACHE_TTL):
+        self.model = model
+        self.tools_hash = tool_schema_hash(tools)
+        self.ttl = ttl or None
+        self.cache = diskcache.Cache(
+            directory,
+            size_limit=size_limit_mb * 1024 * 1024,
+            eviction_policy="least-recently-used"
+        )
+        self.counts = {"hit": 0, "miss": 0, "bypass": 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, result: str):
+        with self._counts_lock:
+            self.counts[result] += 1
+
+    def _key(self, prompt: str) -> str:
+        raw = "\0".join((self.model, self.tools_hash, normalize_prompt(prompt)))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[List[Generation]]:
+        if not use_cache.get():
+            self._count("bypass")
+            return None
+        try:
+            value = self.cache.get(self._key(prompt))
+        except Exception as e:
+            # Запись от несовместимой версии LangChain или поврежденный файл - это промах
+            logger.warning(f"Ошибка чтения кеша LLM: {e}")
+            value = None
+        self._count("hit" if value is not None else "miss")
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        if not use_cache.get():
+            return
+        try:
+            self.cache.set(self._key(prompt), list(return_val), expire=self.ttl)
+        except Exception as e:
+            logger.warning(f"Ошибка записи в кеш LLM: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear()
+
+    # diskcache синхронный (SQLite): в event loop - через поток, контекст запроса копируется
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[List[Generation]]:
+        return await asyncio.to_thread(self.lookup, prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        await asyncio.to_thread(self.update, prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        await asyncio.to_thread(self.clear)
+
+    def stats(self) -> Dict[str, Any]:
+        """Попадания и размер кеша."""
+        lookups = self.counts["hit"] + self.counts["miss"]
+        return {
+            **self.counts,
+            "hit_rate": round(self.counts["hit"] / lookups, 3) if lookups else 0.0,
+            "entries": len(self.cache),
+            "size_bytes": self.cache.volume(),
+            "size_limit_bytes": self.cache.size_limit,
+            "model": self.model,
+            "tools_hash": self.tools_hash
+        }
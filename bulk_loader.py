@@ -0,0 +1,221 @@
+"""
+Потоковая загрузка фигур из JSONL: одна спецификация фигуры на строку.
+
+Пример строки:
+    {"shape_type": "cube", "size": 10, "x": 0, "y": 0, "z": 0}
+    {"shape_type": "star", "num_points": 5, "inner_radius": 5, "outer_radius": 10, "height": 2}
+
+Файл читается построчно и добавляется в документ пачками ограниченного
+размера, поэтому в памяти одновременно находится не больше двух пачек.
+"""
+
+import asyncio
+import json
+import logging
+import time
+
+from common_logic import core, SIMPLE_SHAPES, COMPLEX_SHAPES
+
+logger = logging.getLogger("BulkLoader")
+
+DEFAULT_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 1000
+# Защита от "строки" без переводов строк на весь файл
+MAX_LINE_BYTES = 64 * 1024
+# Сколько ошибок валидации возвращать в отчете (остальные только считаются)
+MAX_REPORTED_ERRORS = 100
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_shape_spec(line):
+    """
+    Разобрать и провалидировать одну строку JSONL.
+    
+    Returns:
+        tuple: (shape_type, params) в формате FreeCADCore
+    
+    Raises:
+        ValueError: если строка не является корректной спецификацией фигуры
+    """
+    try:
+        spec = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Некорректный JSON: {e}")
+    return validate_shape_spec(spec)
+
+
+def validate_shape_spec(spec):
+    """
+    Провалидировать спецификацию фигуры (словарь с shape_type и параметрами).
+    
+    Returns:
+        tuple: (shape_type, params) в формате FreeCADCore
+    
+    Raises:
+        ValueError: если спецификация некорректна
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("Спецификация фигуры должна быть JSON-объектом")
+    
+    shape_type = str(spec.get("shape_type", "")).lower()
+    try:
+        if shape_type in SIMPLE_SHAPES:
+            params = {
+                "size": float(spec.get("size", 10.0)),
+                "x": float(spec.get("x", 0.0)),
+                "y": float(spec.get("y", 0.0)),
+                "z": float(spec.get("z", 0.0))
+            }
+        elif shape_type in COMPLEX_SHAPES:
+            params = {}
+            for key in COMPLEX_SHAPES[shape_type]:
+                value = spec.get(key)
+                if value is not None:
+                    value = int(value) if key in ("num_points", "teeth") else float(value)
+                params[key] = value
+        else:
+            params = {}
+    except (TypeError, ValueError):
+        raise ValueError("Параметры фигуры должны быть числами")
+    
+    error = core._validate_shape_params(shape_type, params)
+    if error:
+        raise ValueError(error)
+    return shape_type, params
+
+
+async def iter_file_chunks(file_path, chunk_size=CHUNK_SIZE):
+    """Читать файл кусками в отдельном потоке, не блокируя event loop."""
+    f = await asyncio.to_thread(open, file_path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+async def iter_lines(chunks):
+    """Разбить поток байтов на строки, не накапливая весь поток в памяти."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Строка длиннее {MAX_LINE_BYTES} байт")
+    if buffer:
+        yield buffer
+
+
+async def iter_specs(specs):
+    """Асинхронный итератор по готовому списку спецификаций (для bulk_load)."""
+    for spec in specs:
+        yield spec
+
+
+async def bulk_load(lines, batch_size=DEFAULT_BATCH_SIZE, on_progress=None, collect_names=False, on_item=None):
+    """
+    Загрузить фигуры из асинхронного потока строк JSONL.
+    
+    Пока текущая пачка строится в потоке FreeCAD, следующая читается и
+    валидируется, но в полете одновременно не больше одной пачки.
+    
+    Args:
+        lines: Асинхронный итератор строк (bytes или str) или уже разобранных словарей
+        batch_size: Размер пачки, добавляемой одним пересчетом
+        on_progress: Необязательная корутина, вызываемая со сводкой после каждой пачки
+        collect_names: Вернуть имена созданных объектов в summary["objects"]
+        on_item: Необязательная функция on_item(line_no, object_name, error) -
+            вызывается для каждой строки, как только ее пачка построена
+            (или сразу, если строка не прошла валидацию)
+    
+    Returns:
+        dict: Итоговая сводка (строки, добавлено, ошибки, пропускная способность)
+    """
+    started = time.perf_counter()
+    summary = {
+        "lines": 0,
+        "added": 0,
+        "failed": 0,
+        "batches": 0,
+        "errors": [],
+        "elapsed_sec": 0.0,
+        "shapes_per_sec": 0.0
+    }
+    if collect_names:
+        summary["objects"] = []
+    
+    def record_error(line_no, message):
+        summary["failed"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_no, "error": message})
+        if on_item:
+            on_item(line_no, None, message)
+    
+    async def finish(batch, future):
+        names, errors = await future
+        summary["added"] += len(names)
+        if collect_names:
+            summary["objects"].extend(names)
+        summary["batches"] += 1
+        failed = dict(errors)
+        created = iter(names)
+        for index, (line_no, _) in enumerate(batch):
+            if index in failed:
+                record_error(line_no, failed[index])
+            elif on_item:
+                on_item(line_no, next(created), None)
+        elapsed = time.perf_counter() - started
+        summary["elapsed_sec"] = round(elapsed, 3)
+        summary["shapes_per_sec"] = round(summary["added"] / elapsed, 1) if elapsed > 0 else 0.0
+        logger.info(
+            f"Пачка {summary['batches']}: добавлено {summary['added']}, "
+            f"ошибок {summary['failed']}, {summary['shapes_per_sec']} фигур/с"
+        )
+        if on_progress:
+            await on_progress(dict(summary))
+    
+    batch, pending = [], None
+    try:
+        async for line in lines:
+            summary["lines"] += 1
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+            if isinstance(line, str):
+                line = line.strip()
+                if not line:
+                    continue
+            try:
+                spec = validate_shape_spec(line) if isinstance(line, dict) else parse_shape_spec(line)
+                batch.append((summary["lines"], spec))
+            except ValueError as e:
+                record_error(summary["lines"], str(e))
+                continue
+            
+            if len(batch) >= batch_size:
+                if pending:
+                    await finish(*pending)
+                pending = (batch, asyncio.ensure_future(core.add_shapes_batch([spec for _, spec in batch])))
+                batch = []
+    except BaseException:
+        # Ошибка чтения (слишком длинная строка, обрыв соединения): пачка в полете
+        # отменяется, если еще не начала строиться, иначе дожидаемся ее, чтобы не
+        # оставить работу в очереди потока FreeCAD и необработанное исключение future
+        if pending:
+            pending[1].cancel()
+            await asyncio.gather(pending[1], return_exceptions=True)
+        raise
+    
+    if pending:
+        await finish(*pending)
+    if batch:
+        await finish(batch, asyncio.ensure_future(core.add_shapes_batch([spec for _, spec in batch])))
+    
+    elapsed = time.perf_counter() - started
+    summary["elapsed_sec"] = round(elapsed, 3)
+    summary["shapes_per_sec"] = round(summary["added"] / elapsed, 1) if elapsed > 0 else 0.0
+    return summary
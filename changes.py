@@ -0,0 +1,128 @@
+"""
+Лента изменений документов FreeCAD.
+
+FreeCADCore публикует событие после каждой успешной мутации (создание,
+изменение, удаление объектов, открытие/закрытие/сохранение документа),
+подписчики - WebSocket сессии - получают их в своих event loop'ах.
+
+publish() потокобезопасен и вызывается прямо из потока FreeCAD. У каждого
+подписчика ограниченная очередь: если клиент не успевает читать, лишние
+события отбрасываются, а следующим он получит событие "resync" - сигнал
+перечитать состояние документа целиком.
+
+Каждое событие увеличивает глобальную ревизию и ревизию своего документа -
+по ним инвалидируется кеш ответов read-эндпоинтов (response_cache.py).
+Последние HISTORY_SIZE событий хранятся, чтобы клиент мог получить
+изменения с известной ему ревизии (since) вместо полного перечитывания.
+"""
+
+import asyncio
+import collections
+import threading
+import time
+
+MAX_PENDING_EVENTS = 1000
+HISTORY_SIZE = 1000
+
+
+class Subscription:
+    """Подписка на ленту: очередь событий в event loop подписчика."""
+
+    def __init__(self, max_pending=MAX_PENDING_EVENTS):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_pending)
+        self.overflowed = False
+
+    def _put(self, event):
+        # Выполняется в event loop подписчика
+        if self.overflowed:
+            if not self.queue.empty():
+                return
+            self.overflowed = False
+            event = {"event": "resync", "ts": event["ts"]}
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class ChangeFeed:
+    """Набор подписчиков и публикация событий."""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._revision = 0
+        self._document_revisions = {}
+        self._history = collections.deque(maxlen=HISTORY_SIZE)
+
+    def revision(self, document=None):
+        """Глобальная ревизия или ревизия документа (0, если он не менялся)."""
+        if document is None:
+            return self._revision
+        return self._document_revisions.get(document, 0)
+
+    def document_revisions(self):
+        """Ревизии всех документов, которые менялись."""
+        with self._lock:
+            return dict(self._document_revisions)
+
+    def since(self, revision, document=None):
+        """
+        События после ревизии revision (при document - только этого документа).
+
+        Returns:
+            tuple: (события, complete) - complete=False, если часть событий
+            уже вытеснена из истории и клиенту нужно перечитать состояние
+        """
+        with self._lock:
+            events = [e for e in self._history if e["revision"] > revision]
+            oldest = self._history[0]["revision"] if self._history else self._revision + 1
+            # Ревизия из будущего - клиент видел ленту до перезапуска процесса
+            complete = oldest - 1 <= revision <= self._revision
+        if document is not None:
+            events = [e for e in events if e["document"] == document]
+        return events, complete
+
+    def subscribe(self, max_pending=MAX_PENDING_EVENTS):
+        """Подписаться (вызывать из event loop подписчика)."""
+        subscription = Subscription(max_pending)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, action, document, objects=(), **data):
+        """
+        Опубликовать изменение.
+
+        Args:
+            action: Что произошло (object_created, object_updated, ...)
+            document: Имя документа
+            objects: Имена затронутых объектов
+        """
+        with self._lock:
+            self._revision += 1
+            self._document_revisions[document] = self._document_revisions.get(document, 0) + 1
+            event = {
+                "event": action, "document": document, "objects": list(objects),
+                "revision": self._revision, "ts": time.time(), **data
+            }
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                self.unsubscribe(subscription)
+        return event
+
+
+feed = ChangeFeed()
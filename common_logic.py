@@ -1,5 +1,182 @@
 import sys
 import os
+import json
+import math
+import asyncio
+import contextvars
+import functools
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sessions
+import tracing
+from changes import feed
+from metrics import FREECAD_OPERATION_SECONDS, QUEUE_DEPTH, OPEN_DOCUMENTS, DOCUMENT_OBJECTS
+from tools.models import (
+    ErrorResult, DocumentInfo, DocumentList, DocumentResult, ShapeResult,
+    ObjectInfo, ObjectList, ObjectUpdateResult, PlanStep, PlanResult, is_error
+)
+
+# Простые фигуры: параметры size, x, y, z
+SIMPLE_SHAPES = ("cube", "sphere", "cylinder")
+
+# Сложные фигуры и обязательные параметры построения
+COMPLEX_SHAPES = {
+    "star": ("num_points", "inner_radius", "outer_radius", "height"),
+    "gear": ("teeth", "module", "outer_radius", "height"),
+    "torus": ("major_radius", "minor_radius"),
+}
+
+# Форматы экспорта: расширение -> модуль FreeCAD, которым выполняется экспорт
+EXPORT_FORMATS = {
+    ".step": "Part", ".stp": "Part",
+    ".iges": "Part", ".igs": "Part",
+    ".brep": "Part", ".brp": "Part",
+    ".stl": "Mesh"
+}
+
+# Операции плана (execute_plan) -> методы FreeCADCore
+PLAN_OPERATIONS = {
+    "open_document": "open_document",
+    "create_shape": "create_simple_shape",
+    "create_complex_shape": "create_complex_shape",
+    "update_object": "update_object",
+    "delete_object": "delete_object",
+    "save_document": "save_document",
+    "close_document": "close_document",
+}
+# Операции, изменения которых отменяются транзакцией документа
+PLAN_MUTATIONS = ("create_shape", "create_complex_shape", "update_object", "delete_object")
+
+_FREECAD_QUEUE = QUEUE_DEPTH.labels("freecad")
+
+
+def on_freecad_thread(method):
+    """
+    Превращает синхронный метод FreeCADCore в корутину, выполняемую
+    в выделенном потоке FreeCAD.
+    
+    FreeCAD не потокобезопасен, поэтому все обращения к нему идут через
+    один поток, а event loop FastAPI остается свободным. После каждой
+    операции обновляются метрики открытых документов и объектов.
+    """
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._refresh_document_gauges()
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self.run(call, self, *args, **kwargs)
+    return wrapper
+
+
+class _PlanUndo:
+    """
+    Журнал отмены плана: транзакции, открытые и отпущенные документы,
+    созданные и перезаписанные файлы (в потоке FreeCAD).
+    
+    Пока план выполняется, документы, которые его шаги отпускают
+    (open_document/close_document), не закрываются, а откладываются:
+    при откате они снова становятся доступны вместе с несохраненными
+    правками, при фиксации - закрываются.
+    """
+
+    def __init__(self, core):
+        current_doc = core.current_doc
+        self.original = (current_doc.Name, current_doc.FileName) if current_doc else None
+        # Документы, открытые до плана: откат их не закрывает
+        self.open_before = set(core.freecad.listDocuments())
+        # Документы с открытой транзакцией плана
+        self.transactions = set()
+        # Документы, отпущенные шагами плана (закрываются при фиксации)
+        self.parked = set()
+        # Файлы, созданные open_document плана -> имя документа
+        self.created = {}
+        # Файлы, созданные save_document плана по новому пути
+        self.new_files = set()
+        # Перезаписанные файлы -> резервная копия
+        self.backups = {}
+
+    def before(self, core, op, params):
+        doc = core.current_doc
+        if doc is None:
+            return
+        if op in PLAN_MUTATIONS and doc.Name not in self.transactions:
+            doc.UndoMode = 1
+            doc.openTransaction("plan")
+            self.transactions.add(doc.Name)
+        elif op == "save_document":
+            path = params.get("file_path") or doc.FileName
+            if not path or path in self.created or path in self.backups or path in self.new_files:
+                return
+            if os.path.exists(path):
+                fd, backup = tempfile.mkstemp(suffix=".FCStd")
+                os.close(fd)
+                shutil.copy2(path, backup)
+                self.backups[path] = backup
+            else:
+                self.new_files.add(path)
+
+    def after(self, core, op, params, result):
+        if op == "open_document" and result.action == "created":
+            self.created[result.file_path] = result.document
+
+    def commit(self, core):
+        docs = core.freecad.listDocuments()
+        for name in self.transactions:
+            if name in docs:
+                docs[name].commitTransaction()
+        for backup in self.backups.values():
+            os.remove(backup)
+
+        # Закрыть отпущенные шагами документы, если план не открыл их снова
+        current = core.current_doc
+        session = sessions.current_session.get()
+        for name in self.parked:
+            if name not in docs or (current is not None and current.Name == name):
+                continue
+            if not core._in_use_elsewhere(name, session):
+                core.freecad.closeDocument(name)
+                feed.publish("document_closed", name)
+
+    def rollback(self, core):
+        docs = core.freecad.listDocuments()
+        for name in self.transactions:
+            if name in docs:
+                docs[name].abortTransaction()
+
+        # Закрыть документы, открытые планом; открытые до плана (в том числе
+        # отпущенные шагами) остаются открытыми с несохраненными правками
+        session = sessions.current_session.get()
+        for name in docs:
+            if name not in self.open_before and not core._in_use_elsewhere(name, session):
+                core.freecad.closeDocument(name)
+                feed.publish("document_closed", name)
+        for path in list(self.created) + list(self.new_files):
+            if os.path.exists(path):
+                os.remove(path)
+        for path, backup in self.backups.items():
+            shutil.move(backup, path)
+
+        # Вернуть текущий документ, который был до плана
+        docs = core.freecad.listDocuments()
+        core.current_doc = None
+        if self.original is not None:
+            name, path = self.original
+            if name in docs:
+                core.current_doc = docs[name]
+            elif path and os.path.exists(path):
+                core.current_doc = core.freecad.openDocument(path)
+                feed.publish("document_opened", name)
+
+        for name in self.transactions | set(self.created.values()):
+            feed.publish("plan_rolled_back", name)
+
 
 class FreeCADCore:
     """Минимальный клиент для работы с FreeCAD."""
@@ -8,66 +185,188 @@ class FreeCADCore:
         self.freecad_path = freecad_path or r'C:\Program Files\FreeCAD 1.0\bin'
         self.freecad = None
         self.part = None
+        # Общий текущий документ (запросы без сессии); у сессий свой - sessions.py
+        self._current_doc = None
+        # Журнал отмены выполняющегося плана (execute_plan)
+        self._plan = None
+        # Единственный поток, в котором выполняются все операции FreeCAD
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="freecad")
+
+    @property
+    def current_doc(self):
+        """Текущий документ сессии запроса (sessions.current_session) или общий."""
+        session = sessions.current_session.get()
+        if session is None:
+            return self._current_doc
+        state = sessions.registry.get(session)
+        return state.document if state is not None else None
+
+    @current_doc.setter
+    def current_doc(self, doc):
+        session = sessions.current_session.get()
+        if session is None:
+            self._current_doc = doc
+        else:
+            sessions.registry.touch(session).document = doc
+
+    def _in_use_elsewhere(self, name, session):
+        """Держит ли документ текущим кто-то, кроме session (общий документ или другие сессии)."""
+        if session is not None and self._current_doc is not None and self._current_doc.Name == name:
+            return True
+        return sessions.registry.holders(name, exclude=session) > 0
+
+    def _release_current(self):
+        """
+        Отпустить текущий документ (в потоке FreeCAD). Документ закрывается,
+        только если он не текущий у другой сессии; иначе он остается открытым.
+        Внутри плана закрытие откладывается до его фиксации (_PlanUndo).
+        """
+        name = self.current_doc.Name
         self.current_doc = None
+        if self._in_use_elsewhere(name, sessions.current_session.get()):
+            return
+        if self._plan is not None:
+            self._plan.parked.add(name)
+            return
+        with FREECAD_OPERATION_SECONDS.labels("close").time():
+            self.freecad.closeDocument(name)
+        feed.publish("document_closed", name)
 
-    async def open_document(self, file_path: str):
-        """Открыть существующий документ FreeCAD или создать новый если не существует."""
+    async def run(self, fn, *args, **kwargs):
+        """
+        Выполнить функцию в потоке FreeCAD и дождаться результата.
+        
+        Контекст (текущий span трассировки) переносится в поток FreeCAD;
+        внутри трассы записываются время ожидания в очереди и выполнения.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+        
+        def call():
+            if tracing.current_span() is None:
+                return fn(*args, **kwargs)
+            tracing.record_span("freecad.queue", (time.perf_counter() - submitted) * 1000)
+            with tracing.span(f"freecad.{getattr(fn, '__name__', 'call')}"):
+                return fn(*args, **kwargs)
+        
+        _FREECAD_QUEUE.inc()
+        try:
+            return await loop.run_in_executor(self.executor, context.run, call)
+        finally:
+            _FREECAD_QUEUE.dec()
+
+    def _refresh_document_gauges(self):
+        """Обновить метрики открытых документов и объектов (в потоке FreeCAD)."""
         if not self.freecad:
-            result = self.connect()
-            if not result["success"]:
-                return f"Ошибка подключения: {result.get('error', 'Неизвестная ошибка')}"
+            return
+        docs = self.freecad.listDocuments().values()
+        OPEN_DOCUMENTS.set(len(docs))
+        DOCUMENT_OBJECTS.set(sum(len(doc.Objects) for doc in docs))
+
+    @staticmethod
+    def _recompute(doc, objects):
+        """Пересчитать только переданные объекты документа."""
+        with FREECAD_OPERATION_SECONDS.labels("recompute").time():
+            doc.recompute(objects)
+
+    @on_freecad_thread
+    def open_document(self, file_path: str):
+        """Открыть существующий документ FreeCAD или создать новый если не существует."""
+        error = self._ensure_connected()
+        if error:
+            return error
         
         import os
         
         try:
             if self.current_doc:
-                self.freecad.closeDocument(self.current_doc.Name)
-                self.current_doc = None
+                self._release_current()
             
             if not file_path.lower().endswith('.fcstd'):
-                return "Ошибка: Файл должен иметь расширение .FCStd"
+                return ErrorResult("invalid_file_path", "Ошибка: Файл должен иметь расширение .FCStd")
             
             if os.path.exists(file_path):
-                self.current_doc = self.freecad.openDocument(file_path)
-                return f"Документ открыт: {self.current_doc.Name}"
+                with FREECAD_OPERATION_SECONDS.labels("open").time():
+                    self.current_doc = self.freecad.openDocument(file_path)
+                feed.publish("document_opened", self.current_doc.Name)
+                return DocumentResult(
+                    "opened", f"Документ открыт: {self.current_doc.Name}",
+                    self.current_doc.Name, file_path
+                )
             else:
                 # Создать новый документ
                 doc_name = os.path.splitext(os.path.basename(file_path))[0]
-                self.current_doc = self.freecad.newDocument(doc_name)
+                with FREECAD_OPERATION_SECONDS.labels("open").time():
+                    self.current_doc = self.freecad.newDocument(doc_name)
+                # Документ уже открыт, даже если сохранить его не получится
+                feed.publish("document_opened", self.current_doc.Name)
                 # Сохранить сразу, чтобы файл существовал
-                self.current_doc.saveAs(file_path)
-                return f"Создан новый документ и сохранен по пути: {file_path}. Теперь открыт: {self.current_doc.Name}"
+                with FREECAD_OPERATION_SECONDS.labels("save").time():
+                    self.current_doc.saveAs(file_path)
+                return DocumentResult(
+                    "created",
+                    f"Создан новый документ и сохранен по пути: {file_path}. Теперь открыт: {self.current_doc.Name}",
+                    self.current_doc.Name, file_path
+                )
         
         except Exception as e:
-            return f"Ошибка открытия/создания документа: {str(e)}"
+            return ErrorResult("freecad_error", f"Ошибка открытия/создания документа: {str(e)}")
 
-    async def save_document(self, file_path: str = None):
+    @on_freecad_thread
+    def save_document(self, file_path: str = None):
         """Сохранить текущий документ FreeCAD."""
         if not self.current_doc:
-            return "Нет открытого документа для сохранения"
+            return ErrorResult("no_document", "Нет открытого документа для сохранения")
         
         try:
-            if file_path:
-                self.current_doc.saveAs(file_path)
-                return f"Документ сохранен как: {file_path}"
-            else:
-                self.current_doc.save()
-                return "Документ сохранен"
+            with FREECAD_OPERATION_SECONDS.labels("save").time():
+                if file_path:
+                    self.current_doc.saveAs(file_path)
+                    message = f"Документ сохранен как: {file_path}"
+                else:
+                    self.current_doc.save()
+                    message = "Документ сохранен"
+            feed.publish("document_saved", self.current_doc.Name)
+            return DocumentResult("saved", message, self.current_doc.Name, self.current_doc.FileName)
         except Exception as e:
-            return f"Ошибка сохранения документа: {str(e)}"
+            return ErrorResult("freecad_error", f"Ошибка сохранения документа: {str(e)}")
 
-    async def close_document(self):
+    @on_freecad_thread
+    def close_document(self):
         """Закрыть текущий документ FreeCAD."""
         if not self.current_doc:
-            return "Нет открытого документа для закрытия"
+            return ErrorResult("no_document", "Нет открытого документа для закрытия")
         
         try:
-            self.freecad.closeDocument(self.current_doc.Name)
-            self.current_doc = None
-            return "Документ закрыт"
+            name = self.current_doc.Name
+            self._release_current()
+            return DocumentResult("closed", "Документ закрыт", name)
         except Exception as e:
-            return f"Ошибка закрытия документа: {str(e)}"
+            return ErrorResult("freecad_error", f"Ошибка закрытия документа: {str(e)}")
         
+    @on_freecad_thread
+    def release_session(self, session_id, doc):
+        """
+        Сохранить и закрыть документ сессии, удаленной из реестра (простой
+        или явное завершение). Документ, который держит кто-то еще, остается открытым.
+        """
+        if doc is None or self.freecad is None:
+            return None
+        try:
+            name = doc.Name
+            if name not in self.freecad.listDocuments() or self._in_use_elsewhere(name, session_id):
+                return None
+            if doc.FileName:
+                with FREECAD_OPERATION_SECONDS.labels("save").time():
+                    doc.save()
+            with FREECAD_OPERATION_SECONDS.labels("close").time():
+                self.freecad.closeDocument(name)
+            feed.publish("document_closed", name)
+            return name
+        except Exception as e:
+            return ErrorResult("freecad_error", f"Ошибка закрытия документа сессии {session_id}: {str(e)}")
+
     def connect(self):
         """Подключение к FreeCAD."""
         # 1. Добавляем путь
@@ -94,70 +393,481 @@ class FreeCADCore:
                 "error": f"Ошибка импорта: {e}",
                 "suggestion": "Проверьте путь к FreeCAD"
             }
+
+    def _ensure_connected(self):
+        """Подключиться к FreeCAD при необходимости. Возвращает ErrorResult или None."""
+        if self.freecad:
+            return None
+        result = self.connect()
+        if not result["success"]:
+            return ErrorResult("not_connected", f"Ошибка подключения: {result.get('error', 'Неизвестная ошибка')}")
+        return None
+
+    def _require_document(self):
+        """Проверить подключение и наличие открытого документа. Возвращает ErrorResult или None."""
+        error = self._ensure_connected()
+        if error:
+            return error
+        if not self.current_doc:
+            return ErrorResult(
+                "no_document",
+                "Ошибка: Нет открытого документа. Сначала откройте документ с помощью open_document."
+            )
+        return None
+    
+    @on_freecad_thread
+    def export_document(self, file_path, object_names=None):
+        """
+        Экспортировать объекты текущего документа в STEP/IGES/BREP/STL.
+        
+        Args:
+            file_path: Путь к файлу; формат определяется расширением
+            object_names: Имена объектов (по умолчанию все объекты с геометрией)
+        """
+        error = self._require_document()
+        if error:
+            return error
+        
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in EXPORT_FORMATS:
+            return ErrorResult(
+                "invalid_file_path",
+                f"Ошибка: неподдерживаемый формат экспорта. Доступно: {', '.join(EXPORT_FORMATS)}"
+            )
+        
+        doc = self.current_doc
+        if object_names:
+            objects = [doc.getObject(name) for name in object_names]
+            missing = [name for name, obj in zip(object_names, objects) if obj is None]
+            if missing:
+                return ErrorResult("not_found", f"Ошибка: объекты не найдены: {', '.join(missing)}")
+        else:
+            objects = [obj for obj in doc.Objects if hasattr(obj, "Shape")]
+        if not objects:
+            return ErrorResult("invalid_params", "Ошибка: в документе нет объектов для экспорта")
+        
+        try:
+            with FREECAD_OPERATION_SECONDS.labels("export").time():
+                if EXPORT_FORMATS[ext] == "Mesh":
+                    import Mesh
+                    Mesh.export(objects, file_path)
+                else:
+                    self.part.export(objects, file_path)
+            return DocumentResult(
+                "exported",
+                f"Документ {doc.Name} экспортирован в {file_path} (объектов: {len(objects)})",
+                doc.Name, file_path
+            )
+        except Exception as e:
+            return ErrorResult("freecad_error", f"Ошибка экспорта: {str(e)}")
     
-    async def get_onshape_documents(self):
+    @on_freecad_thread
+    def get_onshape_documents(self):
         """Метод для совместимости с FastAPI кодом."""
         # Сначала подключаемся, если ещё не подключены
-        if not self.freecad:
-            result = self.connect()
-            if not result["success"]:
-                return f"Ошибка подключения: {result.get('error', 'Неизвестная ошибка')}"
+        error = self._ensure_connected()
+        if error:
+            return error
         
         try:
             # Получаем документы из FreeCAD
-            docs = []
-            for doc in self.freecad.listDocuments().values():
-                docs.append({
-                    "name": doc.Name,
-                    "object_count": len(doc.Objects)
-                })
+            docs = [
+                DocumentInfo(doc.Name, len(doc.Objects))
+                for doc in self.freecad.listDocuments().values()
+            ]
             
             if docs:
-                return f"Документы FreeCAD: {docs}"
+                return DocumentList(docs, f"Документов FreeCAD: {len(docs)}")
             else:
-                return "Нет открытых документов"
+                return DocumentList(docs, "Нет открытых документов")
                 
         except Exception as e:
-            return f"Ошибка получения документов: {str(e)}"
+            return ErrorResult("freecad_error", f"Ошибка получения документов: {str(e)}")
         
-    async def create_simple_shape(self, shape_type="cube", size=1.0, x=0.0, y=0.0, z=0.0):
+    @on_freecad_thread
+    def create_simple_shape(self, shape_type="cube", size=1.0, x=0.0, y=0.0, z=0.0):
         """Создать фигуру в FreeCAD только внутри открытого документа с указанными координатами."""
-        # Сначала подключаемся, если ещё не подключены
-        if not self.freecad:
-            result = self.connect()
-            if not result["success"]:
-                return f"Ошибка подключения: {result.get('error', 'Неизвестная ошибка')}"
-        
-        if not self.current_doc:
-            return "Ошибка: Нет открытого документа. Сначала откройте документ с помощью open_document."
+        error = self._require_document()
+        if error:
+            return error
         
         try:
             doc = self.current_doc
+            shape_type = shape_type.lower()
             
-            if shape_type.lower() == "cube":
-                # Для куба координаты указывают его начальную точку (один из углов)
-                shape = self.part.makeBox(size, size, size, self.freecad.Vector(x, y, z))
-                obj_name = f"Cube_{size}mm_{x}_{y}_{z}"
-            elif shape_type.lower() == "sphere":
-                # Для сферы координаты указывают центр
-                shape = self.part.makeSphere(size/2, self.freecad.Vector(x, y, z))
-                obj_name = f"Sphere_{size}mm_{x}_{y}_{z}"
-            elif shape_type.lower() == "cylinder":
-                # Для цилиндра координаты указывают центр основания
-                shape = self.part.makeCylinder(size/2, size, self.freecad.Vector(x, y, z))
-                obj_name = f"Cylinder_{size}mm_{x}_{y}_{z}"
-            else:
-                return f"Неизвестный тип фигуры: {shape_type}. Доступно: cube, sphere, cylinder"
+            if shape_type not in SIMPLE_SHAPES:
+                return ErrorResult(
+                    "invalid_shape_type",
+                    f"Неизвестный тип фигуры: {shape_type}. Доступно: cube, sphere, cylinder"
+                )
             
-            # Добавляем объект в документ
-            obj = doc.addObject("Part::Feature", obj_name)
-            obj.Shape = shape
-            doc.recompute()
+            # Для куба координаты указывают его начальную точку (один из углов),
+            # для сферы - центр, для цилиндра - центр основания
+            try:
+                params = {"size": float(size), "x": float(x), "y": float(y), "z": float(z)}
+            except (TypeError, ValueError):
+                return ErrorResult("invalid_params", "Параметры фигуры должны быть числами")
+            error = self._validate_shape_params(shape_type, params)
+            if error:
+                return ErrorResult("invalid_params", error)
+            size, x, y, z = params.values()
+            obj = self._add_shape_object(doc, self._object_name(shape_type, params), shape_type, params)
             
-            return f"Создана {shape_type} размером {size} мм в точке ({x}, {y}, {z}) в документе {doc.Name}."
+            return ShapeResult(
+                obj.Name, shape_type, doc.Name, params,
+                f"Создана {shape_type} размером {size} мм в точке ({x}, {y}, {z}) в документе {doc.Name} (объект: {obj.Name})."
+            )
             
         except Exception as e:
-            return f"Ошибка создания фигуры: {str(e)}"
+            return ErrorResult("freecad_error", f"Ошибка создания фигуры: {str(e)}")
+
+    @on_freecad_thread
+    def create_complex_shape(self, shape_type, **params):
+        """Создать сложную фигуру (star, gear, torus) в открытом документе."""
+        error = self._require_document()
+        if error:
+            return error
+        
+        shape_type = shape_type.lower()
+        try:
+            params = {
+                k: None if params.get(k) is None else (int if k in ("num_points", "teeth") else float)(params[k])
+                for k in COMPLEX_SHAPES.get(shape_type, ())
+            }
+        except (TypeError, ValueError):
+            return ErrorResult("invalid_params", "Параметры фигуры должны быть числами")
+        error = self._validate_shape_params(shape_type, params)
+        if error:
+            return ErrorResult("invalid_params", error)
+        
+        try:
+            doc = self.current_doc
+            obj = self._add_shape_object(doc, self._object_name(shape_type, params), shape_type, params)
+            if shape_type == "torus":
+                message = f"Тор создан с большим радиусом {params['major_radius']} мм и малым радиусом {params['minor_radius']} мм (объект: {obj.Name})"
+            elif shape_type == "star":
+                message = f"Звезда создана с {params['num_points']} лучами, высотой {params['height']} мм (объект: {obj.Name})"
+            else:
+                message = (f"Упрощенная шестеренка создана с {params['teeth']} зубьями, высотой {params['height']} мм (объект: {obj.Name}). "
+                           f"Для точной геометрии используйте специализированные библиотеки.")
+            return ShapeResult(obj.Name, shape_type, doc.Name, params, message)
+        except Exception as e:
+            return ErrorResult("freecad_error", f"Ошибка создания сложной фигуры: {str(e)}")
+
+    @on_freecad_thread
+    def list_objects(self):
+        """Список объектов текущего документа с параметрами построения."""
+        if not self.current_doc:
+            return ErrorResult("no_document", "Нет открытого документа")
+        
+        objects = []
+        for obj in self.current_doc.Objects:
+            shape_type, params = self._get_shape_params(obj)
+            objects.append(ObjectInfo(obj.Name, obj.Label, shape_type, params))
+        return ObjectList(self.current_doc.Name, objects, f"Объектов в документе: {len(objects)}")
+
+    @on_freecad_thread
+    def update_object(self, name, **params):
+        """
+        Изменить параметры построения объекта и пересчитать только его
+        и зависящие от него объекты, а не весь документ.
+        """
+        error = self._require_document()
+        if error:
+            return error
+        
+        doc = self.current_doc
+        obj = doc.getObject(name)
+        if obj is None:
+            return ErrorResult("not_found", f"Ошибка: объект {name} не найден в документе {doc.Name}")
+        
+        shape_type, current = self._get_shape_params(obj)
+        if shape_type is None:
+            return ErrorResult("not_editable", f"Ошибка: объект {name} создан не через CAD API и не может быть изменен")
+        
+        changes = {k: v for k, v in params.items() if k in current and v is not None}
+        if not changes:
+            return ErrorResult(
+                "invalid_params",
+                f"Ошибка: нет параметров для изменения. Доступно для {shape_type}: {', '.join(current)}"
+            )
+        
+        merged = {**current, **changes}
+        error = self._validate_shape_params(shape_type, merged)
+        if error:
+            return ErrorResult("invalid_params", error)
+        
+        try:
+            with FREECAD_OPERATION_SECONDS.labels("shape_build").time():
+                obj.Shape = self._build_shape(shape_type, merged)
+            self._set_shape_params(obj, shape_type, merged)
+            affected = [obj] + list(obj.InListRecursive)
+            self._recompute(doc, affected)
+            feed.publish("object_updated", doc.Name, [o.Name for o in affected], changes=changes)
+            return ObjectUpdateResult(
+                "updated", obj.Name, len(affected),
+                f"Объект {obj.Name} обновлен: {changes}. Пересчитано объектов: {len(affected)}",
+                changes
+            )
+        except Exception as e:
+            return ErrorResult("freecad_error", f"Ошибка обновления объекта: {str(e)}")
+
+    @on_freecad_thread
+    def delete_object(self, name):
+        """Удалить объект и пересчитать только объекты, которые от него зависели."""
+        error = self._require_document()
+        if error:
+            return error
+        
+        doc = self.current_doc
+        obj = doc.getObject(name)
+        if obj is None:
+            return ErrorResult("not_found", f"Ошибка: объект {name} не найден в документе {doc.Name}")
+        
+        try:
+            dependents = list(obj.InListRecursive)
+            with FREECAD_OPERATION_SECONDS.labels("delete").time():
+                doc.removeObject(obj.Name)
+            if dependents:
+                self._recompute(doc, dependents)
+            feed.publish("object_deleted", doc.Name, [name])
+            return ObjectUpdateResult(
+                "deleted", name, len(dependents),
+                f"Объект {name} удален. Пересчитано зависимых объектов: {len(dependents)}"
+            )
+        except Exception as e:
+            return ErrorResult("freecad_error", f"Ошибка удаления объекта: {str(e)}")
+
+    def _build_shape(self, shape_type, params):
+        """Построить геометрию Part по типу фигуры и ее параметрам."""
+        vector = self.freecad.Vector
+        if shape_type == "cube":
+            size = params["size"]
+            return self.part.makeBox(size, size, size, vector(params["x"], params["y"], params["z"]))
+        if shape_type == "sphere":
+            return self.part.makeSphere(params["size"] / 2, vector(params["x"], params["y"], params["z"]))
+        if shape_type == "cylinder":
+            size = params["size"]
+            return self.part.makeCylinder(size / 2, size, vector(params["x"], params["y"], params["z"]))
+        if shape_type == "torus":
+            return self.part.makeTorus(params["major_radius"], params["minor_radius"])
+        if shape_type == "star":
+            num_points = params["num_points"]
+            points = []
+            for i in range(num_points * 2):
+                angle = i * math.pi / num_points
+                radius = params["inner_radius"] if i % 2 == 0 else params["outer_radius"]
+                points.append(vector(radius * math.cos(angle), radius * math.sin(angle), 0))
+            # Замыкаем контур
+            points.append(points[0])
+            face = self.part.Face(self.part.makePolygon(points))
+            return face.extrude(vector(0, 0, params["height"]))
+        if shape_type == "gear":
+            # В реальном проекте нужно использовать более сложную геометрию
+            return self.part.makeCylinder(params["outer_radius"], params["height"])
+        raise ValueError(f"Неизвестный тип фигуры: {shape_type}")
+
+    @on_freecad_thread
+    def add_shapes_batch(self, specs):
+        """
+        Добавить пачку уже провалидированных фигур в текущий документ.
+        
+        Объекты создаются без промежуточных пересчетов, затем пачка
+        пересчитывается одним вызовом recompute.
+        
+        Args:
+            specs: Список пар (shape_type, params)
+        
+        Returns:
+            tuple: (имена созданных объектов, список ошибок по индексам пачки)
+        """
+        if not self.current_doc:
+            return [], [(i, "Нет открытого документа") for i in range(len(specs))]
+        
+        doc = self.current_doc
+        created, errors = [], []
+        for i, (shape_type, params) in enumerate(specs):
+            try:
+                created.append(self._add_shape_object(
+                    doc, self._object_name(shape_type, params), shape_type, params, recompute=False
+                ))
+            except Exception as e:
+                errors.append((i, str(e)))
+        if created:
+            self._recompute(doc, created)
+            feed.publish("objects_created", doc.Name, [obj.Name for obj in created])
+        return [obj.Name for obj in created], errors
+
+    @on_freecad_thread
+    def add_pattern_copies(self, source_name, transforms, center=(0.0, 0.0, 0.0)):
+        """
+        Добавить в документ копии объекта (массив) с одним пересчетом.
+        
+        Args:
+            source_name: Имя копируемого объекта
+            transforms: Список (сдвиг (dx, dy, dz), угол поворота вокруг оси Z в градусах)
+            center: Точка, через которую проходит ось поворота
+        
+        Returns:
+            ErrorResult, если объекта нет, иначе
+            tuple: (имена созданных объектов, список ошибок по индексам transforms)
+        """
+        error = self._require_document()
+        if error:
+            return error
+        
+        doc = self.current_doc
+        source = doc.getObject(source_name)
+        if source is None or not hasattr(source, "Shape"):
+            return ErrorResult("not_found", f"Ошибка: объект {source_name} не найден в документе {doc.Name}")
+        
+        vector = self.freecad.Vector
+        created, errors = [], []
+        for i, (offset, angle) in enumerate(transforms):
+            try:
+                with FREECAD_OPERATION_SECONDS.labels("shape_build").time():
+                    shape = source.Shape.copy()
+                    if angle:
+                        shape.rotate(vector(*center), vector(0, 0, 1), angle)
+                    if any(offset):
+                        shape.translate(vector(*offset))
+                obj = doc.addObject("Part::Feature", f"{source.Name}_copy")
+                obj.Shape = shape
+                created.append(obj)
+            except Exception as e:
+                errors.append((i, str(e)))
+        if created:
+            self._recompute(doc, created)
+            feed.publish("objects_created", doc.Name, [obj.Name for obj in created])
+        return [obj.Name for obj in created], errors
+
+    @on_freecad_thread
+    def execute_plan(self, steps):
+        """
+        Выполнить шаги плана подряд, как одну транзакцию.
+
+        План целиком выполняется в потоке FreeCAD, поэтому чужие запросы
+        не вклиниваются между шагами. Изменения объектов идут внутри
+        транзакций FreeCAD; файлы, которые план перезаписывает, заранее
+        копируются, а документы, которые шаги закрывают, остаются открытыми
+        до конца плана. При ошибке шага транзакции отменяются, файлы
+        восстанавливаются, созданные планом файлы удаляются, открытые им
+        документы закрываются, и текущим снова становится документ, бывший
+        текущим до плана, - с несохраненными правками.
+
+        Args:
+            steps: Список пар (операция из PLAN_OPERATIONS, параметры)
+
+        Returns:
+            PlanResult: Результаты шагов и итог (committed / rolled_back)
+        """
+        error = self._ensure_connected()
+        if error:
+            return error
+
+        undo = self._plan = _PlanUndo(self)
+        results = []
+        failed = None
+        try:
+            for index, (op, params) in enumerate(steps):
+                try:
+                    undo.before(self, op, params)
+                    result = getattr(FreeCADCore, PLAN_OPERATIONS[op]).__wrapped__(self, **params)
+                except Exception as e:
+                    result = ErrorResult("freecad_error", f"Ошибка шага {index} ({op}): {str(e)}")
+                results.append(PlanStep(index, op, "error" if is_error(result) else "ok", result))
+                if is_error(result):
+                    failed = index
+                    break
+                undo.after(self, op, params, result)
+        finally:
+            self._plan = None
+
+        if failed is None:
+            undo.commit(self)
+            return PlanResult("committed", results, f"План выполнен: шагов {len(results)}")
+
+        results.extend(PlanStep(i, op, "skipped") for i, (op, _) in enumerate(steps[failed + 1:], failed + 1))
+        with FREECAD_OPERATION_SECONDS.labels("rollback").time():
+            undo.rollback(self)
+        return PlanResult(
+            "rolled_back", results,
+            f"План отменен: ошибка на шаге {failed} ({steps[failed][0]}): {results[failed].result.message}",
+            failed
+        )
+
+    @staticmethod
+    def _object_name(shape_type, params):
+        """Имя нового объекта по типу фигуры и ее параметрам."""
+        if shape_type in SIMPLE_SHAPES:
+            return f"{shape_type.capitalize()}_{params['size']}mm_{params['x']}_{params['y']}_{params['z']}"
+        if shape_type == "torus":
+            return f"Torus_{params['major_radius']}x{params['minor_radius']}"
+        if shape_type == "star":
+            return f"Star_{params['num_points']}pts"
+        return f"Gear_{params['teeth']}teeth"
+
+    def _add_shape_object(self, doc, obj_name, shape_type, params, recompute=True):
+        """Добавить объект в документ и запомнить параметры его построения."""
+        with FREECAD_OPERATION_SECONDS.labels("shape_build").time():
+            shape = self._build_shape(shape_type, params)
+        obj = doc.addObject("Part::Feature", obj_name)
+        obj.Shape = shape
+        self._set_shape_params(obj, shape_type, params)
+        if recompute:
+            # Новый объект ни от чего не зависит - пересчитываем только его
+            self._recompute(doc, [obj])
+            feed.publish("objects_created", doc.Name, [obj.Name])
+        return obj
+
+    @staticmethod
+    def _set_shape_params(obj, shape_type, params):
+        """Сохранить тип и параметры фигуры в свойствах объекта (переживают save/open)."""
+        if "CadShapeType" not in obj.PropertiesList:
+            obj.addProperty("App::PropertyString", "CadShapeType", "CAD API", "Тип фигуры")
+            obj.addProperty("App::PropertyString", "CadParams", "CAD API", "Параметры построения (JSON)")
+        obj.CadShapeType = shape_type
+        obj.CadParams = json.dumps(params)
+
+    @staticmethod
+    def _get_shape_params(obj):
+        """Прочитать тип и параметры фигуры, сохраненные _set_shape_params."""
+        if "CadShapeType" not in obj.PropertiesList:
+            return None, {}
+        return obj.CadShapeType, json.loads(obj.CadParams)
+
+    @staticmethod
+    def _validate_shape_params(shape_type, params):
+        """Проверить параметры фигуры. Возвращает текст ошибки или None."""
+        if shape_type in SIMPLE_SHAPES:
+            if params["size"] is None or params["size"] <= 0:
+                return "Ошибка: размер должен быть положительным числом"
+            return None
+        
+        if shape_type not in COMPLEX_SHAPES:
+            return f"Ошибка: неподдерживаемый тип фигуры. Доступно: {', '.join(SIMPLE_SHAPES + tuple(COMPLEX_SHAPES))}"
+        
+        if any(params.get(k) is None for k in COMPLEX_SHAPES[shape_type]):
+            return f"Ошибка: для {shape_type} требуются {', '.join(COMPLEX_SHAPES[shape_type])}"
+        
+        if shape_type == "torus":
+            if params["major_radius"] <= 0 or params["minor_radius"] <= 0:
+                return "Ошибка: радиусы должны быть положительными"
+            if params["minor_radius"] >= params["major_radius"]:
+                return "Ошибка: minor_radius должен быть меньше major_radius"
+        elif shape_type == "star":
+            if params["num_points"] < 5 or params["num_points"] % 2 == 0:
+                return "Ошибка: num_points для звезды должно быть нечетным числом >=5"
+            if params["inner_radius"] <= 0 or params["outer_radius"] <= 0 or params["height"] <= 0:
+                return "Ошибка: радиусы и высота должны быть положительными"
+            if params["inner_radius"] >= params["outer_radius"]:
+                return "Ошибка: inner_radius должен быть меньше outer_radius"
+        elif shape_type == "gear":
+            if params["teeth"] < 3:
+                return "Ошибка: teeth должно быть >=3"
+            if params["module"] <= 0 or params["outer_radius"] <= 0 or params["height"] <= 0:
+                return "Ошибка: module, outer_radius и height должны быть положительными"
+        return None
 
 
     def create_cube(self, size=10.0, doc_name="TestDocument", x=0.0, y=0.0, z=0.0):
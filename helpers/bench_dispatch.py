@@ -0,0 +1,105 @@
+"""
+Бенчмарк вызова гейтвея из инструментов MCP: loopback HTTP против
+вызова внутри процесса (tools/gateway.py).
+
+Гейтвей (main.app) запускается в этом же процессе на --port, как в
+main.py, и для каждой операции последовательно измеряются задержки:
+    http  - новый httpx.AsyncClient на вызов, как делали инструменты
+            (TCP соединение + HTTP разбор на loopback)
+    local - gateway.client(): запрос передается ASGI приложению напрямую
+Разница p50 - задержка, которую убирает вызов внутри процесса.
+
+Пример:
+    python helpers/bench_dispatch.py --calls 2000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay_trace import percentile  # noqa: E402
+
+OPERATIONS = {
+    "status": "/api/mcp/status",
+    "documents": "/api/cad/documents",
+}
+
+
+def summarize(latencies):
+    return {
+        "calls": len(latencies),
+        "mean_us": round(sum(latencies) / len(latencies) * 1e6, 1),
+        "p50_us": round(percentile(latencies, 50) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 99) * 1e6, 1),
+    }
+
+
+async def bench(client_factory, path, calls):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        async with client_factory() as client:
+            response = await client.get(path)
+            response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def start_gateway(port):
+    import main
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run(args):
+    import httpx
+    from tools import gateway
+
+    url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    for name in args.operations:
+        path = OPERATIONS[name]
+        http = await bench(lambda: httpx.AsyncClient(base_url=url, timeout=30.0), path, args.calls)
+        local = await bench(gateway.client, path, args.calls)
+        results[name] = {"http": http, "local": local, "removed_p50_us": round(http["p50_us"] - local["p50_us"], 1)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback HTTP против вызова гейтвея внутри процесса")
+    parser.add_argument("--port", type=int, default=8011, help="Порт гейтвея для HTTP вызовов")
+    parser.add_argument("--calls", type=int, default=1000, help="Вызовов на операцию и режим")
+    parser.add_argument("--operations", nargs="+", default=list(OPERATIONS), choices=list(OPERATIONS))
+    args = parser.parse_args()
+
+    os.environ.pop("CAD_GATEWAY_URL", None)
+    # Все вызовы идут от одного клиента - контроль допуска (класс read) не должен
+    # отвечать 429 посреди замера; лимиты читаются при импорте main
+    os.environ["CAD_LIMIT_READ"] = f"{args.calls * 10}/{args.calls * 4}/16"
+    server = start_gateway(args.port)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        server.should_exit = True
+
+    print(f"{'операция':<12}{'режим':<8}{'mean, мкс':>12}{'p50, мкс':>12}{'p99, мкс':>12}")
+    for name, result in results.items():
+        for mode in ("http", "local"):
+            r = result[mode]
+            print(f"{name:<12}{mode:<8}{r['mean_us']:>12}{r['p50_us']:>12}{r['p99_us']:>12}")
+        print(f"{name:<12}{'убрано p50':<20}{result['removed_p50_us']:>12} мкс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Бенчмарк сериализации результатов: текстовые сообщения против типизированных моделей.
+
+Старый путь: core возвращает f-строку со str(list of dict), маршрут заворачивает
+ее в {"result": ...}, Starlette сериализует json.dumps, агент разбирает ответ и
+снова делает json.dumps(indent=2), а клиенту, чтобы получить данные, приходится
+разбирать repr списка (ast.literal_eval).
+
+Новый путь: core возвращает модель из tools.models, маршрут сериализует ее
+models.dumps (orjson, если установлен), клиент получает данные одним loads.
+
+Запуск: python helpers/bench_serialization.py [--docs 50] [--iterations 20000]
+"""
+
+import argparse
+import ast
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import models  # noqa: E402
+
+
+def old_documents(n):
+    docs = [{"name": f"Document{i}", "object_count": i * 3} for i in range(n)]
+    return f"Документы FreeCAD: {docs}"
+
+
+def new_documents(n):
+    docs = [models.DocumentInfo(f"Document{i}", i * 3) for i in range(n)]
+    return models.DocumentList(docs, f"Документов FreeCAD: {n}")
+
+
+def old_shape():
+    return "Создана cube размером 10.0 мм в точке (1.0, 2.0, 3.0) в документе Unnamed (объект: Cube_10_0mm_1_0_2_0_3_0)."
+
+
+def new_shape():
+    return models.ShapeResult(
+        "Cube_10_0mm_1_0_2_0_3_0", "cube", "Unnamed",
+        {"size": 10.0, "x": 1.0, "y": 2.0, "z": 3.0},
+        "Создана cube размером 10.0 мм в точке (1.0, 2.0, 3.0) в документе Unnamed (объект: Cube_10_0mm_1_0_2_0_3_0)."
+    )
+
+
+def old_path(result):
+    """Маршрут (Starlette JSONResponse) + повторный дамп агентом."""
+    body = json.dumps({"result": result}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    agent_text = json.dumps(json.loads(body), ensure_ascii=False, indent=2)
+    return body, agent_text
+
+
+def new_path(result):
+    """Маршрут cad_response + компактный текст для агента."""
+    body = models.dumps({"result": result.message, "data": result})
+    return body, body.decode("utf-8")
+
+
+def old_parse(body):
+    """Клиенту нужны данные: разбираем JSON и repr списка внутри строки."""
+    text = json.loads(body)["result"]
+    start = text.find("[")
+    return ast.literal_eval(text[start:]) if start >= 0 else text
+
+
+def new_parse(body):
+    return (models.orjson.loads if models.orjson else json.loads)(body)["data"]
+
+
+def bench(name, fn, iterations):
+    seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+    return seconds / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации результатов CAD")
+    parser.add_argument("--docs", type=int, default=50, help="Документов в списке")
+    parser.add_argument("--iterations", type=int, default=20000, help="Итераций на замер")
+    args = parser.parse_args()
+
+    print(f"Энкодер: {'orjson' if models.orjson else 'json (stdlib)'}")
+    print(f"{'случай':<28}{'старый, мкс':>14}{'новый, мкс':>14}{'ускорение':>11}{'старый, Б':>12}{'новый, Б':>11}")
+
+    cases = [
+        (f"documents x{args.docs}", lambda: old_documents(args.docs), lambda: new_documents(args.docs)),
+        ("create_shape", old_shape, new_shape),
+    ]
+    for name, make_old, make_new in cases:
+        old_result, new_result = make_old(), make_new()
+        old_body, old_agent = old_path(old_result)
+        new_body, new_agent = new_path(new_result)
+
+        rows = [
+            ("сериализация", lambda: old_path(old_result), lambda: new_path(new_result),
+             len(old_agent.encode("utf-8")), len(new_agent.encode("utf-8"))),
+            ("разбор клиентом", lambda: old_parse(old_body), lambda: new_parse(new_body),
+             len(old_body), len(new_body)),
+        ]
+        for stage, old_fn, new_fn, old_size, new_size in rows:
+            old_us = bench(name, old_fn, args.iterations)
+            new_us = bench(name, new_fn, args.iterations)
+            print(f"{name + ' / ' + stage:<28}{old_us:>14.2f}{new_us:>14.2f}{old_us / new_us:>10.1f}x"
+                  f"{old_size:>12}{new_size:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Бенчмарк WebSocket сессии (/api/cad/ws) против GET эндпоинтов.
+
+Для каждой операции измеряется пропускная способность (операций/с) и
+задержки на работающем гейтвее:
+    http - GET запросы через один httpx.AsyncClient (keep-alive), не больше
+           --concurrency одновременно
+    ws   - одно WebSocket соединение, до --concurrency запросов в полете
+           (ответы сопоставляются по id)
+
+Операции:
+    read   - список объектов (/api/cad/objects и op list_objects)
+    create - создание куба (/api/cad/create-shape и op create_shape);
+             фигуры создаются в документе --document, который открывается заранее
+
+Пример:
+    python main.py
+    python helpers/bench_websocket.py --ops 2000 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+import httpx
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from replay_trace import percentile  # noqa: E402
+
+HTTP_OPERATIONS = {
+    "read": lambda i: ("/api/cad/objects", {}),
+    "create": lambda i: ("/api/cad/create-shape", {"shape_type": "cube", "size": 1, "x": i * 2, "y": 0, "z": 0}),
+}
+
+WS_OPERATIONS = {
+    "read": lambda i: ("list_objects", {}),
+    "create": lambda i: ("create_shape", {"shape_type": "cube", "size": 1, "x": i * 2, "y": 0, "z": 0}),
+}
+
+
+def summarize(latencies, elapsed):
+    return {
+        "ops": len(latencies),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def bench_http(url, operation, ops, concurrency):
+    latencies = []
+    counter = itertools.count()
+    
+    async def worker(client):
+        while True:
+            i = next(counter)
+            if i >= ops:
+                return
+            path, params = HTTP_OPERATIONS[operation](i)
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+    
+    limits = httpx.Limits(max_keepalive_connections=concurrency, max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=30.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_ws(url, operation, ops, concurrency):
+    ws_url = url.replace("http://", "ws://").replace("https://", "wss://") + "/api/cad/ws"
+    latencies = []
+    pending = {}
+    window = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+    
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        async def reader():
+            async for raw in ws:
+                message = json.loads(raw)
+                started = pending.pop(message.get("id"), None)
+                if started is None:
+                    continue
+                if not message["ok"]:
+                    raise RuntimeError(message["error"]["message"])
+                latencies.append(time.perf_counter() - started)
+                window.release()
+                if len(latencies) >= ops:
+                    done.set()
+                    return
+        
+        reader_task = asyncio.create_task(reader())
+        started = time.perf_counter()
+        for i in range(ops):
+            await window.acquire()
+            op, params = WS_OPERATIONS[operation](i)
+            pending[str(i)] = time.perf_counter()
+            await ws.send(json.dumps({"id": str(i), "op": op, "params": params}))
+        await asyncio.wait([reader_task, asyncio.create_task(done.wait())], return_when=asyncio.FIRST_COMPLETED)
+        if reader_task.done() and reader_task.exception():
+            raise reader_task.exception()
+        elapsed = time.perf_counter() - started
+        reader_task.cancel()
+        return summarize(latencies, elapsed)
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=30.0) as client:
+        response = await client.get("/api/cad/open-document", params={"file_path": args.document})
+        response.raise_for_status()
+    
+    results = {}
+    for operation in args.operations:
+        results[operation] = {
+            "http": await bench_http(args.url, operation, args.ops, args.concurrency),
+            "ws": await bench_ws(args.url, operation, args.ops, args.concurrency),
+        }
+        http_rate, ws_rate = results[operation]["http"]["ops_per_sec"], results[operation]["ws"]["ops_per_sec"]
+        results[operation]["speedup"] = round(ws_rate / http_rate, 2) if http_rate else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket сессия против GET эндпоинтов CAD API")
+    parser.add_argument("--url", default="http://localhost:8001", help="Адрес FastAPI сервера")
+    parser.add_argument("--ops", type=int, default=1000, help="Операций на каждый замер")
+    parser.add_argument("--concurrency", type=int, default=8, help="Запросов в полете")
+    parser.add_argument("--document", default="bench_ws.FCStd", help="Документ для замеров")
+    parser.add_argument("--operations", nargs="+", default=["read", "create"], choices=list(HTTP_OPERATIONS))
+    parser.add_argument("--json", action="store_true", help="Вывести результаты в JSON")
+    args = parser.parse_args()
+    
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for operation, result in results.items():
+        print(f"{operation}:")
+        for transport in ("http", "ws"):
+            r = result[transport]
+            print(f"  {transport:4} {r['ops_per_sec']:>9} оп/с  p50 {r['p50_ms']} мс  p99 {r['p99_ms']} мс")
+        print(f"  ускорение ws/http: x{result['speedup']}")
+
+
+if __name__ == "__main__":
+    main()
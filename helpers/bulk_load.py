@@ -0,0 +1,85 @@
+"""
+CLI для потоковой загрузки фигур из JSONL файла в открытый документ.
+
+Примеры:
+    python helpers/bulk_load.py layout.jsonl --document layout.FCStd
+    python helpers/bulk_load.py /data/layout.jsonl --server-side --batch-size 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import httpx
+
+CHUNK_SIZE = 64 * 1024
+
+
+def stream_file(path, total):
+    """Отдавать файл кусками и печатать прогресс отправки."""
+    sent = 0
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sent += len(chunk)
+            elapsed = time.perf_counter() - started
+            speed = sent / elapsed / 1024 if elapsed > 0 else 0.0
+            print(f"\r📤 Отправлено {sent * 100 // max(total, 1)}% ({sent}/{total} байт, {speed:.0f} КБ/с)", end="", flush=True)
+            yield chunk
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая загрузка фигур из JSONL в FreeCAD")
+    parser.add_argument("path", help="JSONL файл: одна спецификация фигуры на строку")
+    parser.add_argument("--url", default="http://localhost:8001", help="Адрес FastAPI сервера")
+    parser.add_argument("--batch-size", type=int, default=100, help="Фигур на один пересчет документа")
+    parser.add_argument("--document", help="Открыть (или создать) этот .FCStd перед загрузкой")
+    parser.add_argument("--server-side", action="store_true", help="Файл лежит на сервере, передать только путь")
+    args = parser.parse_args()
+
+    if not args.server_side and not os.path.isfile(args.path):
+        print(f"❌ Файл не найден: {args.path}")
+        return 1
+
+    with httpx.Client(base_url=args.url, timeout=None) as client:
+        if args.document:
+            response = client.get("/api/cad/open-document", params={"file_path": args.document})
+            response.raise_for_status()
+            print(f"📄 {response.json().get('result')}")
+
+        started = time.perf_counter()
+        params = {"batch_size": args.batch_size}
+        if args.server_side:
+            params["file_path"] = args.path
+            response = client.post("/api/cad/bulk-load", params=params)
+        else:
+            total = os.path.getsize(args.path)
+            response = client.post(
+                "/api/cad/bulk-load",
+                params=params,
+                content=stream_file(args.path, total),
+                headers={"Content-Type": "application/x-ndjson"}
+            )
+        elapsed = time.perf_counter() - started
+
+        if response.status_code != 200:
+            print(f"❌ HTTP {response.status_code}: {response.text}")
+            return 1
+
+        summary = response.json()["summary"]
+        print(f"✅ Строк: {summary['lines']}, добавлено: {summary['added']}, ошибок: {summary['failed']}")
+        print(f"⏱️  Сервер: {summary['elapsed_sec']} с ({summary['shapes_per_sec']} фигур/с), всего: {elapsed:.2f} с")
+        for error in summary["errors"][:10]:
+            print(f"   строка {error['line']}: {error['error']}")
+        if summary["failed"] > 10:
+            print(f"   ... и еще {summary['failed'] - 10} ошибок")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
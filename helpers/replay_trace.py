@@ -0,0 +1,136 @@
+"""
+Воспроизведение JSONL трассы запросов, записанной TraceRecorderMiddleware.
+
+Запросы отправляются в исходном порядке с исходными интервалами, деленными
+на --speed (0 - без пауз, максимально быстро). --concurrency ограничивает
+число одновременных запросов.
+
+Примеры:
+    CAD_TRACE_FILE=trace.jsonl python main.py       # запись трассы
+    python helpers/replay_trace.py trace.jsonl --speed 10 --concurrency 8
+    python helpers/replay_trace.py trace.jsonl --speed 0 --json > build_a.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+
+def load_trace(path):
+    """Прочитать трассу, отсортированную по времени начала запроса."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def percentile(values, p):
+    """Перцентиль методом ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def replay(records, url, speed, concurrency, timeout):
+    """Отправить запросы трассы и собрать задержки."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def send(record):
+            async with semaphore:
+                target = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+                started = time.perf_counter()
+                try:
+                    response = await client.request(
+                        record["method"], target, content=record.get("body", "").encode("utf-8") or None
+                    )
+                    statuses[response.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+        
+        t0 = records[0]["ts"] if records else 0.0
+        started = time.perf_counter()
+        tasks = []
+        for record in records:
+            if speed > 0:
+                delay = (record["ts"] - t0) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(record)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    
+    return latencies, statuses, elapsed
+
+
+def summarize(latencies, statuses, elapsed, recorded):
+    """Сводка: перцентили задержек и пропускная способность."""
+    return {
+        "requests": len(latencies),
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3) if latencies else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "recorded_p50_ms": round(percentile(recorded, 50), 3),
+        "recorded_p95_ms": round(percentile(recorded, 95), 3),
+        "recorded_p99_ms": round(percentile(recorded, 99), 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение трассы запросов CAD API")
+    parser.add_argument("trace", help="JSONL трасса от TraceRecorderMiddleware")
+    parser.add_argument("--url", default="http://localhost:8001", help="Адрес FastAPI сервера")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Ускорение относительно исходного темпа (1 - как в трассе, 0 - без пауз)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Максимум одновременных запросов")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Таймаут одного запроса, с")
+    parser.add_argument("--json", action="store_true", help="Вывести сводку в JSON (для сравнения сборок)")
+    args = parser.parse_args()
+    
+    records = load_trace(args.trace)
+    if not records:
+        print("❌ Трасса пуста")
+        return 1
+    
+    latencies, statuses, elapsed = asyncio.run(
+        replay(records, args.url, args.speed, max(1, args.concurrency), args.timeout)
+    )
+    recorded = [r["duration_ms"] for r in records if "duration_ms" in r]
+    summary = summarize(latencies, statuses, elapsed, recorded)
+    
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+    
+    print(f"📼 Запросов: {summary['requests']} за {summary['elapsed_sec']} с "
+          f"({summary['throughput_rps']} запр/с, concurrency={args.concurrency}, speed={args.speed})")
+    print(f"⏱️  p50={summary['p50_ms']} мс  p95={summary['p95_ms']} мс  "
+          f"p99={summary['p99_ms']} мс  max={summary['max_ms']} мс")
+    print(f"📊 В трассе: p50={summary['recorded_p50_ms']} мс  p95={summary['recorded_p95_ms']} мс  "
+          f"p99={summary['recorded_p99_ms']} мс")
+    print(f"📋 Статусы: {summary['statuses']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Асинхронные задачи гейтвея: длинные операции (пачки фигур, загрузка JSONL,
+экспорт) выполняются в фоне, клиент сразу получает ID задачи.
+
+Одновременно выполняется не больше max_concurrent задач, в очереди ждут не
+больше max_queued; при переполнении submit() бросает QueueFullError с
+оценкой, через сколько секунд стоит повторить (для Retry-After).
+
+Отмена прерывает задачу в ближайшей точке await - между пачками/шагами;
+операция, уже выполняющаяся в потоке FreeCAD, доводится до конца.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import QUEUE_DEPTH
+from tools.models import JobInfo
+
+logger = logging.getLogger("Jobs")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Очередь задач заполнена."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Очередь задач заполнена, повторите через {retry_after} с")
+        self.retry_after = retry_after
+
+
+class Job:
+    """Одна задача: состояние, прогресс и результат."""
+
+    def __init__(self, kind):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = {"done": 0, "total": None}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    def set_progress(self, done, total=None, **extra):
+        """Обновить прогресс (вызывается обработчиком задачи)."""
+        self.progress = {"done": done, "total": total if total is not None else self.progress.get("total"), **extra}
+
+    def info(self):
+        messages = {
+            QUEUED: "Задача в очереди",
+            RUNNING: "Задача выполняется",
+            SUCCEEDED: "Задача выполнена",
+            FAILED: f"Задача завершилась с ошибкой: {self.error}",
+            CANCELLED: "Задача отменена"
+        }
+        return JobInfo(
+            self.job_id, self.kind, self.status, self.progress, self.created_at,
+            self.started_at, self.finished_at, self.error, messages[self.status]
+        )
+
+
+class JobManager:
+    """Очередь задач с ограничением параллелизма и длины очереди."""
+
+    def __init__(self, max_concurrent=2, max_queued=100, keep_finished=1000):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self._jobs = OrderedDict()
+        self._semaphore = None
+        self._queued = 0
+        self._avg_duration = 1.0
+        self._queue_gauge = QUEUE_DEPTH.labels("jobs")
+
+    def submit(self, kind, handler, on_done=None):
+        """
+        Поставить задачу в очередь.
+
+        Args:
+            kind: Тип задачи (для отображения)
+            handler: Корутинная функция handler(job) -> результат
+            on_done: Необязательная функция on_done(job), вызывается после
+                завершения задачи в любом статусе (в т.ч. отмены в очереди)
+
+        Raises:
+            QueueFullError: если в очереди уже max_queued задач
+        """
+        if self._queued >= self.max_queued:
+            raise QueueFullError(self.retry_after())
+        if self._semaphore is None:
+            # Создается лениво, внутри работающего event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        job = Job(kind)
+        self._jobs[job.job_id] = job
+        self._queued += 1
+        self._queue_gauge.inc()
+        job.task = asyncio.create_task(self._run(job, handler, on_done))
+        self._evict_finished()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        return [job.info() for job in self._jobs.values()]
+
+    def cancel(self, job_id):
+        """Отменить задачу. Возвращает задачу или None, если ее нет."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.status not in FINISHED_STATUSES:
+            job.task.cancel()
+        return job
+
+    def retry_after(self):
+        """Оценка в секундах, когда в очереди освободится место."""
+        waves = self._queued / max(self.max_concurrent, 1)
+        return max(1, int(waves * self._avg_duration / 2 + 0.5))
+
+    async def _run(self, job, handler, on_done):
+        dequeued = False
+        try:
+            async with self._semaphore:
+                self._queued -= 1
+                self._queue_gauge.dec()
+                dequeued = True
+                job.status = RUNNING
+                job.started_at = time.time()
+                job.result = await handler(job)
+                job.status = SUCCEEDED
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            logger.exception(f"Задача {job.job_id} ({job.kind}) завершилась с ошибкой")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            if not dequeued:
+                self._queued -= 1
+                self._queue_gauge.dec()
+            job.finished_at = time.time()
+            if job.started_at:
+                # Скользящее среднее длительности - для оценки Retry-After
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (job.finished_at - job.started_at)
+            if on_done is not None:
+                try:
+                    on_done(job)
+                except Exception:
+                    logger.exception(f"Ошибка завершения задачи {job.job_id}")
+
+    def _evict_finished(self):
+        """Удалить самые старые завершенные задачи сверх keep_finished."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATUSES]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+
+jobs = JobManager(
+    max_concurrent=int(os.getenv("CAD_JOBS_CONCURRENCY", "2")),
+    max_queued=int(os.getenv("CAD_JOBS_QUEUE", "100"))
+)
@@ -1,38 +1,174 @@
 # main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Request, Response, WebSocket
+from typing import Any, Dict, List
 import httpx
 import uvicorn
-from common_logic import core
+from common_logic import core, PLAN_OPERATIONS
+import bulk_loader
+import streaming
+import ws_session
+import response_cache
+import sessions
+from singleflight import flights
+from changes import feed
+from jobs import jobs, QueueFullError
 import asyncio
+from contextlib import asynccontextmanager
 from mcp_instance import mcp
+from middleware.custom_middleware import TraceRecorderMiddleware, MetricsMiddleware, MCPMetricsMiddleware, MCPTracingMiddleware, MCPToolCacheMiddleware, MCPSessionMiddleware, SessionMiddleware, TracingMiddleware, IdempotencyMiddleware, AdmissionControlMiddleware, Limit
+import metrics
+import profiler
+from tools import models, gateway
 import threading
 import math
 from dotenv import load_dotenv
 import os
+import hmac
 import json
+import logging
+import tempfile
+import time
 
 load_dotenv()
 
 
 # Импорт всех инструментов для регистрации MCP
-from tools import tool_create_cube, tool_create_cylinder, tool_create_shapes, tool_create_sphere, tool_documents, tool_status, tool_open_document, tool_save_document, tool_close_document, tool_create_complex_shape, tool_test_shape
+from tools import tool_create_cube, tool_create_cylinder, tool_create_shapes, tool_create_sphere, tool_documents, tool_status, tool_open_document, tool_save_document, tool_close_document, tool_create_complex_shape, tool_test_shape, tool_update_object, tool_delete_object, tool_get_job, tool_cancel_job, tool_create_shapes_batch, tool_create_pattern, tool_export_document, tool_execute_plan, resource_documents
 
-app = FastAPI(title="CAD API Gateway")
+logger = logging.getLogger("CADGateway")
+
+# Как часто проверять простаивающие сессии (sessions.py)
+SESSION_SWEEP_INTERVAL = float(os.getenv("CAD_SESSION_SWEEP_INTERVAL", "60"))
+
+async def _release_sessions(expired):
+    for session_id, state in expired:
+        result = await core.release_session(session_id, state.document)
+        if models.is_error(result):
+            logger.warning(result.message)
+
+async def sweep_idle_sessions():
+    """Сессии без запросов дольше CAD_SESSION_IDLE_TIMEOUT: сохранить и закрыть их документы."""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            await _release_sessions(sessions.registry.expired())
+        except Exception as e:
+            logger.warning(f"Ошибка очистки сессий: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Инструменты MCP этого процесса вызывают гейтвей напрямую, без loopback HTTP,
+    пока приложение работает; при остановке гейтвей отключается и очистка
+    сессий останавливается.
+    """
+    gateway.attach(app, asyncio.get_running_loop())
+    sweeper = asyncio.create_task(sweep_idle_sessions())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        await asyncio.gather(sweeper, return_exceptions=True)
+        gateway.detach()
+
+app = FastAPI(title="CAD API Gateway", lifespan=lifespan)
+
+# Мутирующие эндпоинты: поддерживают Idempotency-Key (повтор не создает объект заново)
+MUTATING_PATH_PREFIXES = (
+    "/api/cad/create-shape", "/api/cad/create-complex-shape", "/api/cad/create-test-shape",
+    "/api/cad/update-object", "/api/cad/delete-object",
+    "/api/cad/open-document", "/api/cad/save-document", "/api/cad/close-document",
+    "/api/cad/batch", "/api/cad/bulk-load", "/api/cad/pattern", "/api/cad/export", "/api/cad/plan",
+    "/api/jobs/batch", "/api/jobs/bulk-load", "/api/jobs/export"
+)
+
+EXPORT_PATH_PREFIXES = ("/api/cad/export", "/api/jobs/export")
+
+def classify_endpoint(method, path):
+    """Класс эндпоинта для контроля допуска: read, mutate, export, admin или None (без ограничений)."""
+    if path.startswith("/api/admin/"):
+        return "admin"
+    if path.startswith(EXPORT_PATH_PREFIXES):
+        return "export"
+    if path.startswith(MUTATING_PATH_PREFIXES):
+        return "mutate"
+    if path.startswith(("/api/cad/", "/api/jobs", "/api/mcp/")):
+        return "read"
+    return None
+
+# Лимиты на клиента: "запросов в секунду/всплеск/одновременных запросов"
+ADMISSION_LIMITS = {
+    "read": Limit.parse(os.getenv("CAD_LIMIT_READ", "50/100/16")),
+    "mutate": Limit.parse(os.getenv("CAD_LIMIT_MUTATE", "20/40/4")),
+    "export": Limit.parse(os.getenv("CAD_LIMIT_EXPORT", "1/3/1")),
+    # Профилирование останавливает потоки на время сэмплирования - по одному за раз
+    "admin": Limit.parse(os.getenv("CAD_LIMIT_ADMIN", "0.1/2/1")),
+}
+
+app.add_middleware(SessionMiddleware)
+app.add_middleware(
+    IdempotencyMiddleware,
+    path_prefixes=MUTATING_PATH_PREFIXES,
+    ttl=float(os.getenv("CAD_IDEMPOTENCY_TTL", "3600"))
+)
+app.add_middleware(AdmissionControlMiddleware, classify=classify_endpoint, limits=ADMISSION_LIMITS)
+# Запись трассы запросов /api/cad/* для helpers/replay_trace.py (включается переменной окружения)
+if os.getenv("CAD_TRACE_FILE"):
+    app.add_middleware(TraceRecorderMiddleware, trace_file=os.getenv("CAD_TRACE_FILE"))
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+mcp.add_middleware(MCPMetricsMiddleware())
+mcp.add_middleware(MCPTracingMiddleware())
+mcp.add_middleware(MCPToolCacheMiddleware())
+mcp.add_middleware(MCPSessionMiddleware())
+
+
+# Коды ошибок core, которым соответствует не 400
+_ERROR_STATUS = {"not_found": 404, "not_connected": 500, "freecad_error": 500}
+
+def cad_response(result, **extra):
+    """
+    Ответ гейтвея: текст для чата в "result" и типизированная модель в "data",
+    сериализованные быстрым JSON-энкодером (минуя jsonable_encoder FastAPI).
+    """
+    if models.is_error(result):
+        return Response(
+            content=models.dumps({"detail": result.message, "data": result}),
+            status_code=_ERROR_STATUS.get(result.code, 400),
+            media_type="application/json"
+        )
+    return Response(
+        content=models.dumps({"result": result.message, "data": result, **extra}),
+        media_type="application/json"
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в формате Prometheus."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+# Ответ /api/mcp/status - статичен, поэтому отдается из кеша с постоянным ETag
+_MCP_STATUS = {
+    "status": "running",
+    "tools": ["get_mcp_status", "get_documents", "create_shape", "create_cube", "create_sphere", "create_cylinder", "open_document", "save_document", "close_document", "create_complex_shape", "create_test_shape", "update_object", "delete_object", "get_job", "cancel_job", "create_shapes_batch", "create_pattern", "export_document", "execute_plan"],
+    "resources": ["cad://revision", "cad://documents", "cad://documents/{name}/objects", "cad://changes/{since}"],
+    "description": "CAD MCP Server for FreeCAD operations"
+}
 
 @app.get("/api/mcp/status")
-async def get_mcp_status():
+async def get_mcp_status(request: Request):
     """Получить статус MCP сервера."""
-    return {
-        "status": "running",
-        "tools": ["get_mcp_status", "get_documents", "create_shape", "create_cube", "create_sphere", "create_cylinder", "open_document", "save_document", "close_document", "create_complex_shape", "create_test_shape"],
-        "description": "CAD MCP Server for FreeCAD operations"
-    }
+    async def build():
+        return Response(content=models.dumps(_MCP_STATUS), media_type="application/json")
+    # Статус не меняется за время жизни процесса - ревизия постоянная
+    return await response_cache.cached_read(request, "mcp_status", "mcp_status", lambda: 0, build)
 
 @app.get("/api/cad/documents")
-async def get_documents():
-    """Получить документы из FreeCAD."""
-    result = await core.get_onshape_documents()
-    return {"result": result}
+async def get_documents(request: Request):
+    """Получить документы из FreeCAD (кешируется до следующего изменения любого документа)."""
+    async def build():
+        return cad_response(await core.get_onshape_documents())
+    return await response_cache.cached_read(request, "documents", "documents", feed.revision, build)
 
 @app.get("/api/cad/create-shape")
 async def create_shape(
@@ -73,16 +209,13 @@ async def create_shape(
         z
     )
     
-    return {
-        "result": result,
-        "parameters": {
-            "shape_type": shape_type,
-            "size": size,
-            "x": x,
-            "y": y,
-            "z": z
-        }
-    }
+    return cad_response(result, parameters={
+        "shape_type": shape_type,
+        "size": size,
+        "x": x,
+        "y": y,
+        "z": z
+    })
 
 @app.get("/api/cad/create-complex-shape")
 async def create_complex_shape(
@@ -128,144 +261,586 @@ async def create_complex_shape(
             detail="Нет открытого документа. Сначала откройте документ с помощью /api/cad/open-document"
         )
     
+    params = {
+        "num_points": num_points,
+        "inner_radius": inner_radius,
+        "outer_radius": outer_radius,
+        "height": height,
+        "teeth": teeth,
+        "module": module,
+        "major_radius": major_radius,
+        "minor_radius": minor_radius
+    }
+    
+    # Валидация параметров по типу фигуры
+    error = core._validate_shape_params(shape_type.lower(), params)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    
+    result = await core.create_complex_shape(shape_type.lower(), **params)
+    return cad_response(result, parameters={"shape_type": shape_type, **params})
+
+@app.get("/api/cad/objects")
+async def list_objects(request: Request):
+    """Получить объекты текущего документа и параметры их построения (кешируется по ревизии документа)."""
+    document = core.current_doc.Name if core.current_doc else None
+    
+    def revision():
+        # Смена текущего документа во время построения - тоже изменение ответа
+        current = core.current_doc.Name if core.current_doc else None
+        return current, feed.revision(current)
+    
+    async def build():
+        return cad_response(await core.list_objects())
+    return await response_cache.cached_read(request, "objects", f"objects:{document}", revision, build)
+
+MAX_CHANGES_WAIT = 30.0
+
+@app.get("/api/cad/changes")
+async def get_changes(since: int = None, document: str = None, wait: float = 0):
+    """
+    Изменения документов после ревизии since - инкрементальный diff для
+    клиентов без WebSocket (ресурсы MCP). Без since - только текущие ревизии
+    (дешевая проверка, изменилось ли что-то). wait > 0 - long-poll: ждать
+    первого события до wait секунд. resync=true - история не покрывает
+    since, состояние нужно перечитать целиком.
+    """
+    if since is None:
+        return {"revision": feed.revision(), "documents": feed.document_revisions()}
+    events, complete = feed.since(since, document)
+    if not events and complete and wait > 0:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, MAX_CHANGES_WAIT)
+        subscription = feed.subscribe()
+        try:
+            # Повторная проверка после подписки: событие могло прийти между вызовами
+            events, complete = feed.since(since, document)
+            while not events and complete and loop.time() < deadline:
+                try:
+                    await asyncio.wait_for(subscription.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                events, complete = feed.since(since, document)
+        finally:
+            feed.unsubscribe(subscription)
+    return {
+        "revision": feed.revision(),
+        "documents": feed.document_revisions(),
+        "events": events,
+        "resync": not complete
+    }
+
+@app.get("/api/cad/update-object")
+async def update_object(
+    name: str,
+    size: float = None,
+    x: float = None,
+    y: float = None,
+    z: float = None,
+    num_points: int = None,
+    inner_radius: float = None,
+    outer_radius: float = None,
+    height: float = None,
+    teeth: int = None,
+    module: float = None,
+    major_radius: float = None,
+    minor_radius: float = None
+):
+    """
+    Изменить параметры существующего объекта без пересоздания документа.
+    
+    Передаются только изменяемые параметры; пересчитываются лишь сам объект
+    и объекты, зависящие от него.
+    """
+    result = await core.update_object(
+        name,
+        size=size, x=x, y=y, z=z,
+        num_points=num_points, inner_radius=inner_radius, outer_radius=outer_radius,
+        height=height, teeth=teeth, module=module,
+        major_radius=major_radius, minor_radius=minor_radius
+    )
+    return cad_response(result)
+
+@app.get("/api/cad/delete-object")
+async def delete_object(name: str):
+    """Удалить объект из текущего документа."""
+    result = await core.delete_object(name)
+    return cad_response(result)
+
+# Максимум фигур в одном запросе /api/cad/batch (большие объемы - через bulk-load)
+MAX_BATCH_SHAPES = 10000
+
+def _check_batch_size(batch_size):
+    if batch_size < 1 or batch_size > bulk_loader.MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"batch_size должен быть от 1 до {bulk_loader.MAX_BATCH_SIZE}"
+        )
+
+def _check_document():
+    if not core.current_doc:
+        raise HTTPException(
+            status_code=400,
+            detail="Нет открытого документа. Сначала откройте документ с помощью /api/cad/open-document"
+        )
+
+def _check_batch(shapes, batch_size):
+    _check_batch_size(batch_size)
+    if not shapes or len(shapes) > MAX_BATCH_SHAPES:
+        raise HTTPException(status_code=400, detail=f"shapes должен содержать от 1 до {MAX_BATCH_SHAPES} фигур")
+    _check_document()
+
+def _summary_response(summary):
+    return {
+        "result": (
+            f"Загружено фигур: {summary['added']}, ошибок: {summary['failed']}, "
+            f"{summary['shapes_per_sec']} фигур/с"
+        ),
+        "summary": summary
+    }
+
+@app.post("/api/cad/batch")
+async def create_shapes_batch(
+    shapes: List[Dict[str, Any]] = Body(..., embed=True),
+    batch_size: int = bulk_loader.DEFAULT_BATCH_SIZE
+):
+    """
+    Создать несколько фигур одним запросом.
+    
+    Тело: {"shapes": [{"shape_type": "cube", "size": 10}, ...]} - спецификации
+    в том же формате, что строки JSONL для /api/cad/bulk-load. Фигуры
+    добавляются пачками по batch_size с одним пересчетом документа на пачку.
+    """
+    _check_batch(shapes, batch_size)
+    summary = await bulk_loader.bulk_load(bulk_loader.iter_specs(shapes), batch_size, collect_names=True)
+    return _summary_response(summary)
+
+MAX_PLAN_STEPS = 100
+
+@app.post("/api/cad/plan")
+async def execute_plan(steps: List[Dict[str, Any]] = Body(..., embed=True)):
+    """
+    Выполнить план из нескольких операций одной транзакцией.
+    
+    Тело: {"steps": [{"op": "open_document", "file_path": "a.FCStd"},
+    {"op": "create_shape", "shape_type": "cube", "size": 20}, {"op": "save_document"},
+    {"op": "close_document"}]}. Остальные поля шага - параметры операции.
+    При ошибке шага все изменения плана отменяются (409, результаты шагов в data).
+    """
+    if not steps or len(steps) > MAX_PLAN_STEPS:
+        raise HTTPException(status_code=400, detail=f"steps должен содержать от 1 до {MAX_PLAN_STEPS} шагов")
+    plan = []
+    for i, step in enumerate(steps):
+        params = dict(step)
+        op = params.pop("op", None)
+        if op not in PLAN_OPERATIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Шаг {i}: неизвестная операция {op}. Доступно: {', '.join(PLAN_OPERATIONS)}"
+            )
+        plan.append((op, params))
+    
+    result = await core.execute_plan(plan)
+    if models.is_error(result) or result.status == "committed":
+        return cad_response(result)
+    return Response(
+        content=models.dumps({"detail": result.message, "data": result}),
+        status_code=409,
+        media_type="application/json"
+    )
+
+def _export(file_path, names):
+    """
+    Экспорт через single-flight: одинаковые одновременные запросы (тот же файл,
+    объекты и ревизия документа) выполняют один экспорт и получают общий результат.
+    """
+    document = core.current_doc.Name if core.current_doc else None
+    key = (
+        os.path.abspath(file_path), tuple(sorted(names)) if names else None,
+        document, feed.revision(document)
+    )
+    return flights.do("export", key, lambda: core.export_document(file_path, names))
+
+@app.get("/api/cad/export")
+async def export_document(file_path: str, objects: str = None):
+    """
+    Экспортировать текущий документ в STEP/IGES/BREP/STL (формат - по расширению file_path).
+    
+    Parameters:
+    - objects: Имена объектов через запятую (по умолчанию все объекты с геометрией)
+    """
+    names = [name.strip() for name in objects.split(",") if name.strip()] if objects else None
+    result = await _export(file_path, names)
+    return cad_response(result)
+
+# ============ МАССИВЫ ОБЪЕКТОВ ============
+PATTERN_TYPES = ("linear", "polar")
+MAX_PATTERN_COUNT = 1000
+
+def _pattern_transforms(pattern_type, count, dx, dy, dz, angle):
+    """
+    Сдвиги и углы поворота копий массива. count включает исходный объект,
+    поэтому копий count - 1. Для polar angle - шаг между копиями
+    (по умолчанию 360 / count, т.е. полный круг).
+    """
+    if pattern_type not in PATTERN_TYPES:
+        raise HTTPException(status_code=400, detail=f"pattern_type должен быть одним из: {', '.join(PATTERN_TYPES)}")
+    if count < 2 or count > MAX_PATTERN_COUNT:
+        raise HTTPException(status_code=400, detail=f"count должен быть от 2 до {MAX_PATTERN_COUNT}")
+    if pattern_type == "linear":
+        if not (dx or dy or dz):
+            raise HTTPException(status_code=400, detail="Для linear нужен ненулевой шаг dx, dy или dz")
+        return [((i * dx, i * dy, i * dz), 0.0) for i in range(1, count)]
+    step = angle if angle is not None else 360.0 / count
+    return [((0.0, 0.0, 0.0), i * step) for i in range(1, count)]
+
+async def _create_pattern(source, transforms, center, batch_size, on_item=None):
+    """
+    Создать копии пачками по batch_size (один пересчет на пачку).
+    on_item(index, object_name, error) вызывается для каждой копии (index от 1).
+    Возвращает ErrorResult или сводку.
+    """
+    started = time.perf_counter()
+    summary = {"added": 0, "failed": 0, "objects": [], "errors": []}
+    for start in range(0, len(transforms), batch_size):
+        chunk = transforms[start:start + batch_size]
+        result = await core.add_pattern_copies(source, chunk, center)
+        if models.is_error(result):
+            return result
+        names, errors = result
+        failed = dict(errors)
+        created = iter(names)
+        for i in range(len(chunk)):
+            index = start + i + 1
+            if i in failed:
+                summary["failed"] += 1
+                summary["errors"].append({"index": index, "error": failed[i]})
+                name, error = None, failed[i]
+            else:
+                name, error = next(created), None
+                summary["added"] += 1
+                summary["objects"].append(name)
+            if on_item:
+                on_item(index, name, error)
+    summary["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return summary
+
+@app.get("/api/cad/pattern")
+async def create_pattern(
+    source: str,
+    pattern_type: str = "linear",
+    count: int = 2,
+    dx: float = 0.0,
+    dy: float = 0.0,
+    dz: float = 0.0,
+    angle: float = None,
+    cx: float = 0.0,
+    cy: float = 0.0,
+    batch_size: int = bulk_loader.DEFAULT_BATCH_SIZE
+):
+    """
+    Создать массив копий объекта.
+    
+    Parameters:
+    - source: Имя копируемого объекта
+    - pattern_type: linear (сдвиг на dx/dy/dz на каждую копию) или polar (поворот вокруг оси Z)
+    - count: Число экземпляров, включая исходный объект
+    - angle: Шаг поворота для polar в градусах (по умолчанию 360 / count)
+    - cx, cy: Точка, через которую проходит ось поворота для polar
+    """
+    _check_batch_size(batch_size)
+    _check_document()
+    transforms = _pattern_transforms(pattern_type, count, dx, dy, dz, angle)
+    summary = await _create_pattern(source, transforms, (cx, cy, 0.0), batch_size)
+    if models.is_error(summary):
+        return cad_response(summary)
+    return {
+        "result": f"Создан массив {pattern_type} из {source}: копий {summary['added']}, ошибок {summary['failed']}",
+        "summary": summary
+    }
+
+# ============ ПОТОКОВЫЕ ВАРИАНТЫ (SSE / NDJSON) ============
+def _stream(request, format, run):
+    """Потоковый ответ операции run(emit) в формате из format/Accept."""
     try:
-        doc = core.current_doc
+        fmt = streaming.negotiate_format(format, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return streaming.stream_response(streaming.operation_events(run), fmt)
+
+@app.post("/api/cad/batch/stream")
+async def stream_shapes_batch(
+    request: Request,
+    shapes: List[Dict[str, Any]] = Body(..., embed=True),
+    batch_size: int = streaming.STREAM_BATCH_SIZE,
+    format: str = None
+):
+    """
+    Потоковый вариант /api/cad/batch.
+    
+    События: item (на каждую фигуру: index, object_name или error, done, total),
+    done (итоговая сводка), error, heartbeat.
+    """
+    _check_batch(shapes, batch_size)
+    total = len(shapes)
+    
+    async def run(emit):
+        done = 0
         
-        if shape_type.lower() == "torus":
-            # Проверка параметров
-            if major_radius is None or minor_radius is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Для тора требуются major_radius и minor_radius"
-                )
-            if major_radius <= 0 or minor_radius <= 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Радиусы должны быть положительными"
-                )
-            if minor_radius >= major_radius:
-                raise HTTPException(
-                    status_code=400,
-                    detail="minor_radius должен быть меньше major_radius"
-                )
-            
-            # Создание тора
-            torus = core.part.makeTorus(major_radius, minor_radius)
-            obj = doc.addObject("Part::Feature", f"Torus_{major_radius}x{minor_radius}")
-            obj.Shape = torus
-            doc.recompute()
-            
-            result_message = f"Тор создан с большим радиусом {major_radius} мм и малым радиусом {minor_radius} мм"
-            
-        elif shape_type.lower() == "star":
-            if num_points is None or inner_radius is None or outer_radius is None or height is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Для звезды требуются num_points, inner_radius, outer_radius, height"
-                )
-            if num_points < 5 or num_points % 2 == 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="num_points для звезды должно быть нечетным числом >=5"
-                )
-            if inner_radius <= 0 or outer_radius <= 0 or height <= 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Радиусы и высота должны быть положительными"
-                )
-            if inner_radius >= outer_radius:
-                raise HTTPException(
-                    status_code=400,
-                    detail="inner_radius должен быть меньше outer_radius"
-                )
-            
-            # Создание звезды
-            import math
-            points = []
-            for i in range(num_points * 2):
-                angle = i * math.pi / num_points
-                radius = inner_radius if i % 2 == 0 else outer_radius
-                x = radius * math.cos(angle)
-                y = radius * math.sin(angle)
-                points.append(core.freecad.Vector(x, y, 0))
-            
-            # Замыкаем контур
-            points.append(points[0])
-            
-            # Создаем полигон
-            wire = core.part.makePolygon(points)
-            face = core.part.Face(wire)
-            
-            extruded = face.extrude(core.freecad.Vector(0, 0, height))
-            obj = doc.addObject("Part::Feature", f"Star_{num_points}pts")
-            obj.Shape = extruded
-            doc.recompute()
-            
-            result_message = f"Звезда создана с {num_points} лучами, высотой {height} мм"
-            
-        elif shape_type.lower() == "gear":
-            if teeth is None or module is None or outer_radius is None or height is None:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Для шестеренки требуются teeth, module, outer_radius, height"
-                )
-            if teeth < 3:
-                raise HTTPException(
-                    status_code=400,
-                    detail="teeth должно быть >=3"
-                )
-            if module <= 0 or outer_radius <= 0 or height <= 0:
-                raise HTTPException(
-                    status_code=400,
-                    detail="module, outer_radius и height должны быть положительными"
-                )
-            # В реальном проекте нужно использовать более сложную геометрию
-            cylinder = core.part.makeCylinder(outer_radius, height)
-            obj = doc.addObject("Part::Feature", f"Gear_{teeth}teeth")
-            obj.Shape = cylinder
-            doc.recompute()
-            
-            result_message = f"Упрощенная шестеренка создана с {teeth} зубьями, высотой {height} мм. Для точной геометрии используйте специализированные библиотеки."
+        def on_item(line_no, name, error):
+            nonlocal done
+            done += 1
+            emit("item", {"index": line_no - 1, "object_name": name, "error": error, "done": done, "total": total})
         
-        return {
-            "result": result_message,
-            "parameters": {
-                "shape_type": shape_type,
-                "num_points": num_points,
-                "inner_radius": inner_radius,
-                "outer_radius": outer_radius,
-                "height": height,
-                "teeth": teeth,
-                "module": module,
-                "major_radius": major_radius,
-                "minor_radius": minor_radius
-            }
-        }
+        summary = await bulk_loader.bulk_load(bulk_loader.iter_specs(shapes), batch_size, on_item=on_item)
+        return {"summary": summary}
+    
+    return _stream(request, format, run)
+
+@app.get("/api/cad/pattern/stream")
+async def stream_pattern(
+    request: Request,
+    source: str,
+    pattern_type: str = "linear",
+    count: int = 2,
+    dx: float = 0.0,
+    dy: float = 0.0,
+    dz: float = 0.0,
+    angle: float = None,
+    cx: float = 0.0,
+    cy: float = 0.0,
+    batch_size: int = streaming.STREAM_BATCH_SIZE,
+    format: str = None
+):
+    """Потоковый вариант /api/cad/pattern: событие item на каждую созданную копию."""
+    _check_batch_size(batch_size)
+    _check_document()
+    transforms = _pattern_transforms(pattern_type, count, dx, dy, dz, angle)
+    total = len(transforms)
+    
+    async def run(emit):
+        def on_item(index, name, error):
+            emit("item", {"index": index, "object_name": name, "error": error, "done": index, "total": total})
+        
+        summary = await _create_pattern(source, transforms, (cx, cy, 0.0), batch_size, on_item)
+        if models.is_error(summary):
+            emit("error", {"code": summary.code, "message": summary.message})
+            return None
+        return {"summary": summary}
+    
+    return _stream(request, format, run)
+
+@app.get("/api/cad/export/stream")
+async def stream_export(request: Request, file_path: str, objects: str = None, format: str = None):
+    """
+    Потоковый вариант /api/cad/export: start, heartbeat во время экспорта,
+    затем done (или error).
+    """
+    _check_document()
+    names = [name.strip() for name in objects.split(",") if name.strip()] if objects else None
+    
+    async def run(emit):
+        emit("start", {"file_path": file_path, "done": 0, "total": 1})
+        result = await _export(file_path, names)
+        if models.is_error(result):
+            emit("error", {"code": result.code, "message": result.message})
+            return None
+        return {"data": result, "done": 1, "total": 1}
+    
+    return _stream(request, format, run)
+
+@app.post("/api/cad/bulk-load")
+async def bulk_load(
+    request: Request,
+    file_path: str = None,
+    batch_size: int = bulk_loader.DEFAULT_BATCH_SIZE
+):
+    """
+    Потоковая загрузка фигур из JSONL в текущий документ.
+    
+    Parameters:
+    - file_path: Путь к JSONL файлу на сервере. Если не указан, читается тело запроса
+    - batch_size: Сколько фигур добавлять за один пересчет документа
+    
+    Каждая строка - JSON-объект с shape_type и параметрами фигуры, как в
+    /api/cad/create-shape и /api/cad/create-complex-shape.
+    """
+    _check_batch_size(batch_size)
+    _check_document()
+    if file_path and not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail=f"Файл не найден: {file_path}")
+    
+    chunks = bulk_loader.iter_file_chunks(file_path) if file_path else request.stream()
+    try:
+        summary = await bulk_loader.bulk_load(bulk_loader.iter_lines(chunks), batch_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _summary_response(summary)
+
+@app.websocket("/api/cad/ws")
+async def cad_websocket(websocket: WebSocket, events: bool = False):
+    """
+    Постоянная сессия для интерактивного моделирования: запросы с id,
+    документ сессии на сервере и push-события изменений (протокол - в ws_session.py).
+    """
+    await ws_session.Session(websocket).run(subscribe=events)
+
+# ============ АСИНХРОННЫЕ ЗАДАЧИ ============
+def _job_response(job, status_code=200, **extra):
+    info = job.info()
+    return Response(
+        content=models.dumps({"result": info.message, "data": info, **extra}),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
+def _submit_job(kind, handler, on_done=None):
+    """Поставить задачу в очередь: 202 + Location, либо 429 + Retry-After при переполнении."""
+    try:
+        job = jobs.submit(kind, handler, on_done)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    response = _job_response(job, status_code=202)
+    response.headers["Location"] = f"/api/jobs/{job.job_id}"
+    return response
+
+def _get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Задача {job_id} не найдена")
+    return job
+
+def _load_shapes_job(lines, total, batch_size, collect_names=False):
+    """Обработчик задачи загрузки фигур с обновлением прогресса после каждой пачки."""
+    async def handler(job):
+        job.set_progress(0, total)
+        
+        async def on_progress(summary):
+            job.set_progress(
+                summary["added"] + summary["failed"], total,
+                added=summary["added"], failed=summary["failed"], batches=summary["batches"]
+            )
         
+        summary = await bulk_loader.bulk_load(lines, batch_size, on_progress, collect_names)
+        processed = summary["added"] + summary["failed"]
+        job.set_progress(processed, processed, added=summary["added"], failed=summary["failed"], batches=summary["batches"])
+        return summary
+    return handler
+
+@app.post("/api/jobs/batch", status_code=202)
+async def submit_batch_job(
+    shapes: List[Dict[str, Any]] = Body(..., embed=True),
+    batch_size: int = bulk_loader.DEFAULT_BATCH_SIZE
+):
+    """Асинхронный вариант /api/cad/batch: сразу возвращает ID задачи."""
+    _check_batch(shapes, batch_size)
+    handler = _load_shapes_job(bulk_loader.iter_specs(shapes), len(shapes), batch_size, collect_names=True)
+    return _submit_job("batch", handler)
+
+@app.post("/api/jobs/bulk-load", status_code=202)
+async def submit_bulk_load_job(
+    request: Request,
+    file_path: str = None,
+    batch_size: int = bulk_loader.DEFAULT_BATCH_SIZE
+):
+    """
+    Асинхронный вариант /api/cad/bulk-load.
+    
+    Если file_path не указан, тело запроса сначала сохраняется во временный
+    файл (задача переживает запрос), а затем загружается в фоне.
+    """
+    _check_batch_size(batch_size)
+    _check_document()
+    cleanup_path = None
+    if file_path:
+        if not os.path.isfile(file_path):
+            raise HTTPException(status_code=404, detail=f"Файл не найден: {file_path}")
+    else:
+        fd, cleanup_path = tempfile.mkstemp(prefix="cad_bulk_", suffix=".jsonl")
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                await asyncio.to_thread(f.write, chunk)
+        file_path = cleanup_path
+    
+    lines = bulk_loader.iter_lines(bulk_loader.iter_file_chunks(file_path))
+    handler = _load_shapes_job(lines, None, batch_size)
+    # Временный файл удаляется при любом исходе, включая отмену до старта
+    on_done = (lambda job: os.remove(cleanup_path)) if cleanup_path else None
+    try:
+        return _submit_job("bulk_load", handler, on_done)
     except HTTPException:
+        if cleanup_path:
+            os.remove(cleanup_path)
         raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Ошибка создания сложной фигуры: {str(e)}"
-        )
+
+@app.post("/api/jobs/export", status_code=202)
+async def submit_export_job(file_path: str, objects: str = None):
+    """Асинхронный вариант /api/cad/export."""
+    _check_document()
+    names = [name.strip() for name in objects.split(",") if name.strip()] if objects else None
+    
+    async def handler(job):
+        job.set_progress(0, 1)
+        result = await _export(file_path, names)
+        if models.is_error(result):
+            raise RuntimeError(result.message)
+        job.set_progress(1, 1)
+        return result
+    
+    return _submit_job("export", handler)
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """Список задач (активные и последние завершенные)."""
+    job_list = jobs.list()
+    return Response(
+        content=models.dumps({"result": f"Задач: {len(job_list)}", "data": job_list}),
+        media_type="application/json"
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Состояние и прогресс задачи."""
+    return _job_response(_get_job(job_id))
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Результат задачи; 202, пока задача не завершена."""
+    job = _get_job(job_id)
+    if job.finished_at is None:
+        return _job_response(job, status_code=202)
+    return _job_response(job, output=job.result)
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Отменить задачу. Задача останавливается в ближайшей точке ожидания
+    (между пачками), уже начатая операция FreeCAD доводится до конца.
+    """
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Задача {job_id} не найдена")
+    if job.task is not None and not job.task.done():
+        # Даем задаче обработать отмену, чтобы вернуть актуальный статус
+        await asyncio.sleep(0)
+    return _job_response(job)
 
 @app.get("/api/cad/open-document")
 async def open_document(file_path: str):
     if not file_path:
         raise HTTPException(status_code=400, detail="Путь к файлу обязателен")
     result = await core.open_document(file_path)
-    return {"result": result}
+    return cad_response(result)
 
 @app.get("/api/cad/save-document")
 async def save_document(file_path: str = None):
     result = await core.save_document(file_path)
-    return {"result": result}
+    return cad_response(result)
 
 @app.get("/api/cad/close-document")
 async def close_document():
     result = await core.close_document()
-    return {"result": result}
+    return cad_response(result)
 
 @app.get("/api/cad/create-test-shape")
 async def create_test_shape_endpoint(
@@ -317,8 +892,8 @@ async def create_test_shape_endpoint(
         )
         save_result = await core.save_document(file_name)
         close_result = await core.close_document()
-        return {
-            "success": True,
+        return Response(content=models.dumps({
+            "success": not any(models.is_error(r) for r in (open_result, create_result, save_result, close_result)),
             "result": "Тестовая фигура создана и сохранена успешно",
             "details": {
                 "file": file_name,
@@ -335,12 +910,12 @@ async def create_test_shape_endpoint(
                 f"📐 Тип фигуры: {shape_type}\n"
                 f"📏 Размер: {size} мм\n"
                 f"📍 Координаты: ({x}, {y}, {z}) мм\n"
-                f"📄 Открытие документа: {open_result}\n"
-                f"🎯 Создание фигуры: {create_result}\n"
-                f"💾 Сохранение: {save_result}\n"
-                f"🚪 Закрытие: {close_result}"
+                f"📄 Открытие документа: {open_result.message}\n"
+                f"🎯 Создание фигуры: {create_result.message}\n"
+                f"💾 Сохранение: {save_result.message}\n"
+                f"🚪 Закрытие: {close_result.message}"
             )
-        }
+        }), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(
@@ -348,17 +923,100 @@ async def create_test_shape_endpoint(
             detail=f"Ошибка при создании тестовой фигуры: {str(e)}"
         )
 
+@app.get("/api/sessions")
+async def list_sessions():
+    """Сессии (X-CAD-Session), их текущие документы и время простоя."""
+    return {"idle_timeout": sessions.registry.idle_timeout, "sessions": sessions.registry.info()}
+
+@app.delete("/api/sessions/{session_id}")
+async def end_session(session_id: str):
+    """Завершить сессию: ее документ сохраняется и закрывается, если его не держат другие."""
+    state = sessions.registry.pop(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Сессия {session_id} не найдена")
+    result = await core.release_session(session_id, state.document)
+    if models.is_error(result):
+        return cad_response(result)
+    return {"session": session_id, "closed": result}
+
+@app.get("/api/admin/profile")
+async def profile_process(
+    request: Request,
+    seconds: float = 5.0,
+    interval_ms: float = 5.0,
+    format: str = "json",
+    all_threads: bool = False,
+    limit: int = 20
+):
+    """
+    Профилировать работающий процесс гейтвея в течение seconds секунд.
+    
+    Parameters:
+    - seconds: Длительность сэмплирования (до 60 с)
+    - interval_ms: Интервал между сэмплами стеков
+    - format: json (hot stacks), collapsed (для flamegraph) или pstats (файл для pstats/snakeviz)
+    - all_threads: Профилировать все потоки, а не только event loop и поток FreeCAD
+    - limit: Сколько самых частых стеков вернуть в json
+    
+    Требуется заголовок X-Admin-Token со значением CAD_ADMIN_TOKEN; без
+    CAD_ADMIN_TOKEN эндпоинт отключен (404) - гейтвей слушает 0.0.0.0.
+    """
+    admin_token = os.getenv("CAD_ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Профилирование отключено: задайте CAD_ADMIN_TOKEN")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Требуется X-Admin-Token")
+    if format not in ("json", "collapsed", "pstats"):
+        raise HTTPException(status_code=400, detail="format должен быть json, collapsed или pstats")
+    if seconds <= 0 or interval_ms <= 0:
+        raise HTTPException(status_code=400, detail="seconds и interval_ms должны быть положительными")
+    
+    # Эндпоинт выполняется в потоке event loop - его и профилируем вместе с потоком FreeCAD
+    threads = profiler.select_threads(threading.get_ident(), all_threads)
+    try:
+        profile = await asyncio.to_thread(profiler.sample, threads, seconds, interval_ms / 1000)
+    except profiler.ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if format == "collapsed":
+        return Response(content=profile.collapsed(), media_type="text/plain; charset=utf-8")
+    if format == "pstats":
+        return Response(
+            content=profile.pstats_bytes(),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="cad_gateway.pstats"'}
+        )
+    return profile.summary(limit)
+
 @app.get("/")
 async def root():
     return {
         "message": "FreeCAD API Gateway",
         "endpoints": {
+            "metrics": "/metrics",
+            "sessions": "/api/sessions | DELETE /api/sessions/{session_id} (заголовок X-CAD-Session - свой документ)",
+            "profile": "/api/admin/profile?seconds=5&format=collapsed (заголовок X-Admin-Token, CAD_ADMIN_TOKEN)",
             "documents": "/api/cad/documents",
             "create_shape": "/api/cad/create-shape?shape_type=cube&size=10",
             "create_cube_15mm": "/api/cad/create-shape?shape_type=cube&size=15",
             "create_sphere": "/api/cad/create-shape?shape_type=sphere&size=20",
             "create_cylinder": "/api/cad/create-shape?shape_type=cylinder&size=10",
             "create_complex_shape": "/api/cad/create-complex-shape?shape_type=star&num_points=5&inner_radius=10&outer_radius=20&height=5",
+            "list_objects": "/api/cad/objects",
+            "changes": "/api/cad/changes?since=0&wait=25",
+            "update_object": "/api/cad/update-object?name=Cube_10_0mm_0_0_0_0_0_0&size=20",
+            "delete_object": "/api/cad/delete-object?name=Cube_10_0mm_0_0_0_0_0_0",
+            "bulk_load": "/api/cad/bulk-load?batch_size=100 (POST, тело - JSONL)",
+            "batch": "/api/cad/batch (POST, тело - {\"shapes\": [...]})",
+            "plan": "/api/cad/plan (POST, тело - {\"steps\": [{\"op\": \"open_document\", \"file_path\": \"a.FCStd\"}, ...]})",
+            "export": "/api/cad/export?file_path=model.step",
+            "pattern": "/api/cad/pattern?source=Cube_10_0mm_0_0_0_0_0_0&pattern_type=linear&count=5&dx=15",
+            "websocket": "ws://localhost:8001/api/cad/ws?events=true",
+            "stream": "/api/cad/batch/stream (POST) | /api/cad/pattern/stream | /api/cad/export/stream (?format=sse|ndjson)",
+            "submit_job": "/api/jobs/batch | /api/jobs/bulk-load | /api/jobs/export (POST, 202 + job_id)",
+            "job_status": "/api/jobs/{job_id}",
+            "job_result": "/api/jobs/{job_id}/result",
+            "cancel_job": "/api/jobs/{job_id}/cancel (POST)",
             "open_document": "/api/cad/open-document?file_path=test.FCStd",
             "save_document": "/api/cad/save-document?file_path=test.FCStd",
             "close_document": "/api/cad/close-document",
@@ -377,21 +1035,53 @@ async def root():
 
 if __name__ == "__main__":
     # Запуск MCP сервера в отдельном потоке
-    mcp_thread = threading.Thread(target=lambda: mcp.run(transport="streamable-http", host="0.0.0.0", port=8000), daemon=True)
-    mcp_thread.start()
+    # Порты настраиваются для запуска нескольких воркеров за router.py;
+    # CAD_MCP_PORT=0 - воркер без MCP сервера
+    gateway_port = int(os.getenv("CAD_GATEWAY_PORT", "8001"))
+    mcp_port = int(os.getenv("CAD_MCP_PORT", "8000"))
+    gateway_uds = os.getenv("CAD_GATEWAY_UDS")
+    if mcp_port:
+        mcp_thread = threading.Thread(target=lambda: mcp.run(transport="streamable-http", host="0.0.0.0", port=mcp_port), daemon=True)
+        mcp_thread.start()
 
+    base_url = f"http://localhost:{gateway_port}"
     print("=" * 60)
-    print("FreeCAD FastAPI Server запущен")
-    print("MCP Server запущен на порту 8000")
+    print(f"FreeCAD FastAPI Server запущен на порту {gateway_port}")
+    if gateway_uds:
+        print(f"Гейтвей также слушает Unix socket {gateway_uds}")
+    if mcp_port:
+        print(f"MCP Server запущен на порту {mcp_port}")
+    else:
+        print("MCP Server не запускается (CAD_MCP_PORT=0)")
     print("AI Agent (LangChain) инициализирован")
     print("=" * 60)
-    print("Swagger UI: http://localhost:8001/docs")
-    print("Тест документов: http://localhost:8001/api/cad/documents")
-    print("Создать куб 15мм: http://localhost:8001/api/cad/create-shape?shape_type=cube&size=15")
-    print("Создать тестовый куб: http://localhost:8001/api/cad/create-test-shape?shape_type=cube&size=15")
-    print("AI Agent запрос: POST http://localhost:8001/api/agent/query")
-    print("AI Agent статус: GET http://localhost:8001/api/agent/status")
+    print(f"Swagger UI: {base_url}/docs")
+    print(f"Тест документов: {base_url}/api/cad/documents")
+    print(f"Создать куб 15мм: {base_url}/api/cad/create-shape?shape_type=cube&size=15")
+    print(f"Создать тестовый куб: {base_url}/api/cad/create-test-shape?shape_type=cube&size=15")
+    print(f"AI Agent запрос: POST {base_url}/api/agent/query")
+    print(f"AI Agent статус: GET {base_url}/api/agent/status")
     print("Пример запроса к агенту:")
-    print('curl -X POST http://localhost:8001/api/agent/query -H "Content-Type: application/json" -d \'{"query": "Создай куб размером 20мм"}\'')
+    print(f'curl -X POST {base_url}/api/agent/query -H "Content-Type: application/json" -d \'{{"query": "Создай куб размером 20мм"}}\'')
     print("=" * 60)
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if gateway_uds:
+        # Режим supervisor.py: MCP сервер в отдельном процессе обращается
+        # к гейтвею через Unix socket, внешние клиенты - по TCP
+        async def serve():
+            servers = [
+                uvicorn.Server(uvicorn.Config(app, host="0.0.0.0", port=gateway_port)),
+                uvicorn.Server(uvicorn.Config(app, uds=gateway_uds, lifespan="off")),
+            ]
+            tasks = [asyncio.ensure_future(server.serve()) for server in servers]
+            # Сигнал остановки получает только один из серверов - останавливаем оба
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for server in servers:
+                server.should_exit = True
+            await asyncio.gather(*tasks)
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            # uvicorn повторно поднимает пойманный сигнал после остановки
+            pass
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=gateway_port)
\ No newline at end of file
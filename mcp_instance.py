@@ -1,7 +1,22 @@
 """Единый экземпляр FastMCP для всего приложения."""
 
+from contextlib import asynccontextmanager
+
 # Импорт из fastmcp, как в требованиях
 from fastmcp import FastMCP
 
+
+@asynccontextmanager
+async def lifespan(server):
+    """Общий HTTP клиент инструментов к гейтвею живет столько же, сколько MCP сервер."""
+    from tools import gateway
+
+    await gateway.open_pool()
+    try:
+        yield {}
+    finally:
+        await gateway.close_pool()
+
+
 # Создаем единый экземпляр FastMCP
-mcp = FastMCP("CAD-Server")
\ No newline at end of file
+mcp = FastMCP("CAD-Server", lifespan=lifespan)
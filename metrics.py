@@ -1 +1,286 @@
-# тут основной файл для prometheus штуки
\ No newline at end of file
+# тут основной файл для prometheus штуки
+"""
+Реестр метрик в формате Prometheus и метрики CAD API Gateway.
+
+Собственная минимальная реализация (Counter, Gauge, Histogram с метками)
+без внешних зависимостей: на горячем пути только поиск в словаре и
+инкремент под коротким локом. Текстовый формат отдается эндпоинтом /metrics.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Бакеты по умолчанию (секунды): от 1 мс до 30 с - таймаут httpx в инструментах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """Базовый класс семейства метрик с метками."""
+
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Дочерняя метрика для конкретных значений меток."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        """Метрика без меток."""
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Измерить длительность блока в секундах."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.upper_bounds + (float("inf"),), self.counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, [("le", _format_value(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """Произвольное текущее значение."""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount=1.0):
+        self._default().dec(amount)
+
+
+class Histogram(_Metric):
+    """Распределение значений по бакетам."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    """Набор метрик, отдаваемых одним эндпоинтом."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        """Текстовый формат Prometheus (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ============ МЕТРИКИ ГЕЙТВЕЯ ============
+HTTP_REQUEST_SECONDS = Histogram(
+    "cad_http_request_duration_seconds",
+    "Длительность HTTP запросов к гейтвею",
+    ["method", "endpoint"]
+)
+HTTP_REQUESTS = Counter(
+    "cad_http_requests_total",
+    "HTTP запросы к гейтвею по статусу ответа",
+    ["method", "endpoint", "status"]
+)
+FREECAD_OPERATION_SECONDS = Histogram(
+    "cad_freecad_operation_duration_seconds",
+    "Длительность операций FreeCAD (recompute, save, open, shape_build, ...)",
+    ["operation"]
+)
+OPEN_DOCUMENTS = Gauge(
+    "cad_open_documents",
+    "Количество открытых документов FreeCAD"
+)
+DOCUMENT_OBJECTS = Gauge(
+    "cad_document_objects",
+    "Количество объектов во всех открытых документах"
+)
+QUEUE_DEPTH = Gauge(
+    "cad_queue_depth",
+    "Задачи, ожидающие или выполняющиеся в очереди",
+    ["queue"]
+)
+MCP_TOOL_CALLS = Counter(
+    "cad_mcp_tool_calls_total",
+    "Вызовы MCP инструментов",
+    ["tool", "status"]
+)
+MCP_TOOL_SECONDS = Histogram(
+    "cad_mcp_tool_duration_seconds",
+    "Длительность вызовов MCP инструментов",
+    ["tool"]
+)
+WS_SESSIONS = Gauge(
+    "cad_ws_sessions",
+    "Открытые WebSocket сессии"
+)
+WS_OPERATIONS = Counter(
+    "cad_ws_operations_total",
+    "Операции WebSocket сессий по статусу",
+    ["op", "status"]
+)
+WS_OPERATION_SECONDS = Histogram(
+    "cad_ws_operation_duration_seconds",
+    "Длительность операций WebSocket сессий",
+    ["op"]
+)
+RESPONSE_CACHE_REQUESTS = Counter(
+    "cad_response_cache_requests_total",
+    "Обращения к кешу ответов read-эндпоинтов (hit, miss, not_modified)",
+    ["endpoint", "result"]
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "cad_singleflight_calls_total",
+    "Вызовы через single-flight: leader - выполнил работу, shared - получил чужой результат",
+    ["operation", "result"]
+)
+IDEMPOTENCY_REQUESTS = Counter(
+    "cad_idempotency_requests_total",
+    "Запросы с Idempotency-Key: executed - выполнен, replayed - ответ из хранилища, conflict - ключ с другими параметрами",
+    ["result"]
+)
+ADMISSION_REJECTIONS = Counter(
+    "cad_admission_rejections_total",
+    "Запросы, отклоненные контролем допуска (rate - лимит частоты, concurrency - лимит параллельных)",
+    ["endpoint_class", "reason"]
+)
+MCP_GATEWAY_REQUESTS = Counter(
+    "cad_mcp_gateway_requests_total",
+    "Запросы инструментов MCP к удаленному гейтвею: new - новое соединение, reused - соединение из пула",
+    ["connection", "http_version"]
+)
+MCP_TOOL_CACHE_REQUESTS = Counter(
+    "cad_mcp_tool_cache_requests_total",
+    "Обращения к кешу результатов read-only инструментов MCP (hit, miss)",
+    ["tool", "result"]
+)
@@ -1 +1,638 @@
-# тут надо кастомный middleware сделать
\ No newline at end of file
+"""Кастомные ASGI middleware для CAD API Gateway."""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+from fastmcp.server.middleware import Middleware, MiddlewareContext
+from fastmcp.tools.tool import ToolResult
+
+import sessions
+import tracing
+import tool_cache
+from metrics import (
+    HTTP_REQUEST_SECONDS, HTTP_REQUESTS, MCP_TOOL_CALLS, MCP_TOOL_SECONDS,
+    IDEMPOTENCY_REQUESTS, ADMISSION_REJECTIONS
+)
+
+# Тело запроса пишется в трассу только до этого размера (bulk-load может быть огромным)
+MAX_TRACE_BODY_BYTES = 64 * 1024
+
+
+class TraceRecorderMiddleware:
+    """
+    Записывает каждый запрос к /api/cad/* в JSONL трассу для последующего
+    воспроизведения (helpers/replay_trace.py).
+    
+    Одна строка трассы:
+        {"ts": 1700000000.123, "method": "GET", "path": "/api/cad/create-shape",
+         "query": "shape_type=cube&size=10", "status": 200, "duration_ms": 12.3}
+    
+    Запись в файл идет в фоновом потоке, в обработчике запроса только
+    кладется словарь в очередь.
+    """
+    
+    def __init__(self, app, trace_file, path_prefix="/api/cad/"):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.trace_file = trace_file
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+        self._writer.start()
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        
+        record = {
+            "ts": time.time(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "status": None
+        }
+        body = bytearray()
+        
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) <= MAX_TRACE_BODY_BYTES:
+                body.extend(message.get("body", b""))
+            return message
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record["status"] = message["status"]
+            await send(message)
+        
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            if body:
+                if len(body) <= MAX_TRACE_BODY_BYTES:
+                    record["body"] = body.decode("utf-8", errors="replace")
+                else:
+                    record["body_truncated"] = True
+            self._queue.put(record)
+    
+    def _write_loop(self):
+        with open(self.trace_file, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                # Сбрасываем на диск, когда очередь опустела
+                if self._queue.empty():
+                    f.flush()
+
+
+class MetricsMiddleware:
+    """
+    Метрики HTTP запросов: гистограмма длительности и счетчик по статусам.
+    
+    Эндпоинт в метках - шаблон маршрута FastAPI, а не сырой путь, чтобы
+    число временных рядов не зависело от запросов.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], endpoint).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(scope["method"], endpoint, str(status)).inc()
+
+
+class MCPMetricsMiddleware(Middleware):
+    """Счетчики и длительность вызовов MCP инструментов."""
+    
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool = context.message.name
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await call_next(context)
+            status = "error" if _is_error_result(result) else "success"
+            return result
+        finally:
+            MCP_TOOL_SECONDS.labels(tool).observe(time.perf_counter() - started)
+            MCP_TOOL_CALLS.labels(tool, status).inc()
+
+
+class MCPTracingMiddleware(Middleware):
+    """
+    Span mcp.<инструмент> на каждый вызов: запросы инструмента к гейтвею
+    становятся его дочерними span'ами (tools/gateway.py). При
+    CAD_SPANS_IN_META=1 разбивка по стадиям возвращается клиенту в
+    _meta["trace"] результата.
+    """
+    
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        with tracing.span(f"mcp.{context.message.name}") as tool_span:
+            result = await call_next(context)
+        if tracing.INCLUDE_TIMINGS_IN_META and isinstance(result, ToolResult):
+            # Результат может быть из кеша инструментов - не меняем его на месте
+            result = ToolResult(
+                content=result.content,
+                structured_content=result.structured_content,
+                meta={**(result.meta or {}), "trace": tracing.timings_meta(tool_span)}
+            )
+        return result
+
+
+class MCPToolCacheMiddleware(Middleware):
+    """
+    Кеш результатов read-only инструментов (tool_cache.py). Вызов
+    инструмента, меняющего документы, сбрасывает кеш.
+    """
+    
+    def __init__(self, cache=None, cached_tools=tool_cache.CACHED_TOOLS, neutral_tools=tool_cache.NEUTRAL_TOOLS):
+        self.cache = cache or tool_cache.cache
+        self.cached_tools = set(cached_tools)
+        self.neutral_tools = set(neutral_tools)
+    
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        from tools import gateway
+        
+        tool = context.message.name
+        if tool in self.cached_tools:
+            return await self.cache.get_or_call(
+                tool, context.message.arguments, gateway.revision(),
+                lambda: call_next(context),
+                cacheable=lambda result: not _is_error_result(result)
+            )
+        try:
+            return await call_next(context)
+        finally:
+            if tool not in self.neutral_tools:
+                self.cache.invalidate()
+
+
+class MCPSessionMiddleware(Middleware):
+    """
+    Передает id сессии MCP в запросы инструментов и ресурсов к гейтвею
+    (tools/gateway.py): у каждой сессии свой текущий документ (sessions.py).
+    """
+    
+    async def on_request(self, context: MiddlewareContext, call_next):
+        from tools import gateway
+        
+        session = None
+        if context.fastmcp_context is not None:
+            try:
+                session = context.fastmcp_context.session_id
+            except RuntimeError:
+                # Вне запроса MCP (нет транспорта) - общий документ
+                session = None
+        token = gateway.current_session.set(session)
+        try:
+            return await call_next(context)
+        finally:
+            gateway.current_session.reset(token)
+
+
+def _is_error_result(result):
+    """
+    Завершился ли вызов инструмента ошибкой. Инструменты не бросают
+    исключения, а возвращают {"error": ...} в structured_content; для
+    результатов без structured_content разбирается JSON текстового блока.
+    """
+    if getattr(result, "isError", False):
+        return True
+    data = getattr(result, "structured_content", None)
+    if data is None:
+        data = _text_payload(getattr(result, "content", None))
+    if isinstance(data, dict) and isinstance(data.get("result"), dict):
+        data = data["result"].get("structured_content", data["result"])
+    return isinstance(data, dict) and "error" in data
+
+
+def _text_payload(content):
+    if not content or getattr(content[0], "type", None) != "text":
+        return None
+    try:
+        return json.loads(content[0].text)
+    except ValueError:
+        return None
+
+
+class TracingMiddleware:
+    """
+    Продолжает трассу, пришедшую в заголовках X-CAD-Trace-Id/X-CAD-Parent-Span
+    (или начинает новую), и возвращает длительности стадий гейтвея в Server-Timing.
+    """
+    
+    def __init__(self, app, path_prefix="/api/"):
+        self.app = app
+        self.path_prefix = path_prefix
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        
+        headers = dict(scope["headers"])
+        trace_id = headers.get(tracing.TRACE_HEADER.lower().encode())
+        parent_id = headers.get(tracing.PARENT_HEADER.lower().encode())
+        
+        with tracing.span(
+            "gateway",
+            trace_id=trace_id.decode("latin-1") if trace_id else None,
+            parent_id=parent_id.decode("latin-1") if parent_id else None,
+            path=scope["path"]
+        ) as gateway_span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    timing = tracing.server_timing(gateway_span.finished_spans())
+                    timing = f"gateway;dur={gateway_span.elapsed_ms()}" + (f", {timing}" if timing else "")
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (tracing.TRACE_HEADER.encode(), gateway_span.trace_id.encode()),
+                        (tracing.SERVER_TIMING_HEADER.encode(), timing.encode())
+                    ]
+                await send(message)
+            
+            await self.app(scope, receive, send_wrapper)
+
+
+class SessionMiddleware:
+    """
+    Привязывает запрос к сессии из заголовка X-CAD-Session (sessions.py):
+    внутри запроса core.current_doc - документ этой сессии. Запросы без
+    заголовка работают с общим текущим документом. Новая сессия
+    записывается на клиента (client_identity): сверх его лимита - 429.
+    """
+    
+    def __init__(self, app, registry=None):
+        self.app = app
+        self._registry = registry
+        self.header = sessions.SESSION_HEADER.lower().encode("latin-1")
+    
+    @property
+    def registry(self):
+        return self._registry or sessions.registry
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        session = dict(scope["headers"]).get(self.header)
+        if not session:
+            await self.app(scope, receive, send)
+            return
+        
+        session = session.decode("latin-1")
+        try:
+            self.registry.touch(session, client_identity(scope))
+        except sessions.TooManySessionsError as e:
+            await _send_json(send, 429, {"detail": str(e)}, retry_after=60)
+            return
+        except RuntimeError as e:
+            await _send_json(send, 503, {"detail": str(e)}, retry_after=60)
+            return
+        token = sessions.current_session.set(session)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sessions.current_session.reset(token)
+
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+IDEMPOTENCY_PARAM = "idempotency_key"
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# Ответы больше этого размера не сохраняются (повтор выполнится заново)
+MAX_IDEMPOTENT_BODY_BYTES = 1024 * 1024
+
+
+class IdempotencyStore:
+    """
+    Ограниченное хранилище недавних ответов по ключу идемпотентности.
+    
+    Запись живет ttl секунд; при переполнении вытесняются самые старые.
+    Для ключей, запрос по которым еще выполняется, хранится Future -
+    повторы ждут его, а не выполняются параллельно.
+    """
+    
+    def __init__(self, ttl=3600.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.in_flight = {}
+    
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] < time.monotonic():
+            del self._entries[key]
+            return None
+        return entry
+    
+    def put(self, key, fingerprint, status, headers, body):
+        self._entries[key] = {
+            "expires": time.monotonic() + self.ttl,
+            "fingerprint": fingerprint,
+            "status": status,
+            "headers": headers,
+            "body": body
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class IdempotencyMiddleware:
+    """
+    Idempotency-Key для мутирующих эндпоинтов.
+    
+    Ключ передается заголовком Idempotency-Key или параметром
+    idempotency_key. Первый запрос с ключом выполняется, его ответ (кроме
+    5xx) сохраняется; повтор с тем же ключом и теми же параметрами получает
+    сохраненный ответ с заголовком Idempotent-Replayed: true, не доходя до
+    FreeCAD. Повтор, пришедший во время выполнения первого запроса, ждет его
+    результата. Тот же ключ с другими параметрами - 422.
+    
+    Ключ действует в пределах клиента (client_identity), сессии
+    (X-CAD-Session), метода и пути: одинаковые ключи разных клиентов не
+    получают чужих ответов, а один ключ можно использовать для цепочки
+    разных операций (open/create/save). Тело запроса с ключом читается
+    целиком - оно входит в отпечаток.
+    """
+    
+    def __init__(self, app, path_prefixes, ttl=3600.0, max_entries=10000):
+        self.app = app
+        self.path_prefixes = tuple(path_prefixes)
+        self.store = IdempotencyStore(ttl, max_entries)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+        
+        query = parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+        headers = dict(scope["headers"])
+        key = headers.get(IDEMPOTENCY_HEADER.encode("latin-1"), b"").decode("latin-1")
+        key = key or dict(query).get(IDEMPOTENCY_PARAM, "")
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": f"Idempotency-Key длиннее {MAX_IDEMPOTENCY_KEY_LENGTH} символов"})
+            return
+        
+        body, receive = await _buffer_body(receive)
+        digest = hashlib.sha256(body)
+        digest.update(json.dumps(sorted(p for p in query if p[0] != IDEMPOTENCY_PARAM)).encode("utf-8"))
+        fingerprint = digest.hexdigest()
+        session = headers.get(sessions.SESSION_HEADER.lower().encode("latin-1"), b"").decode("latin-1")
+        store_key = (client_identity(scope), session, scope["method"], scope["path"], key)
+        
+        while True:
+            entry = self.store.get(store_key)
+            if entry is not None:
+                if entry["fingerprint"] != fingerprint:
+                    IDEMPOTENCY_REQUESTS.labels("conflict").inc()
+                    await _send_json(send, 422, {"detail": "Idempotency-Key уже использован с другими параметрами"})
+                    return
+                IDEMPOTENCY_REQUESTS.labels("replayed").inc()
+                await send({
+                    "type": "http.response.start",
+                    "status": entry["status"],
+                    "headers": entry["headers"] + [(b"idempotent-replayed", b"true")]
+                })
+                await send({"type": "http.response.body", "body": entry["body"]})
+                return
+            leader = self.store.in_flight.get(store_key)
+            if leader is None:
+                break
+            # Первый запрос с этим ключом еще выполняется - ждем его ответа
+            await asyncio.shield(leader)
+        
+        done = asyncio.get_running_loop().create_future()
+        self.store.in_flight[store_key] = done
+        IDEMPOTENCY_REQUESTS.labels("executed").inc()
+        response = {"status": 500, "headers": [], "body": bytearray(), "complete": False}
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                if len(response["body"]) <= MAX_IDEMPOTENT_BODY_BYTES:
+                    response["body"].extend(message.get("body", b""))
+                response["complete"] = not message.get("more_body", False)
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # 5xx и 429 не сохраняем: повтор такого запроса должен выполниться заново
+            if (response["complete"] and response["status"] < 500 and response["status"] != 429
+                    and len(response["body"]) <= MAX_IDEMPOTENT_BODY_BYTES):
+                self.store.put(store_key, fingerprint, response["status"], response["headers"], bytes(response["body"]))
+            del self.store.in_flight[store_key]
+            done.set_result(None)
+
+
+async def _buffer_body(receive):
+    """Прочитать тело запроса целиком; вернуть его и receive, отдающий его приложению."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    body = b"".join(chunks)
+    replayed = False
+    
+    async def replay_receive():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    
+    return body, replay_receive
+
+
+async def _send_json(send, status, payload, retry_after=None):
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps(payload, ensure_ascii=False).encode("utf-8")})
+
+
+API_KEY_HEADER = b"x-api-key"
+# Идентификатор клиента, который передают инструменты MCP (например, id MCP сессии)
+CLIENT_HEADER = b"x-cad-client"
+
+
+def _key_digest(api_key):
+    return hashlib.sha256(api_key).hexdigest()
+
+
+# Действующие API ключи (CAD_API_KEYS через запятую); в памяти только хеши
+API_KEY_DIGESTS = frozenset(
+    _key_digest(key.strip().encode("latin-1")) for key in os.getenv("CAD_API_KEYS", "").split(",") if key.strip()
+)
+# Адреса, от которых принимается X-CAD-Client: MCP сервер и роутер на этой машине,
+# плюс CAD_TRUSTED_CLIENTS (через запятую) для них же на других хостах
+TRUSTED_CLIENT_HOSTS = frozenset(
+    ["127.0.0.1", "::1"] + [host.strip() for host in os.getenv("CAD_TRUSTED_CLIENTS", "").split(",") if host.strip()]
+)
+
+
+class Limit:
+    """Лимиты класса эндпоинтов: частота (запросов/с), всплеск и одновременные запросы."""
+    
+    __slots__ = ("rate", "burst", "concurrency")
+    
+    def __init__(self, rate, burst, concurrency):
+        # Нулевая частота дала бы деление на ноль при расчете Retry-After,
+        # всплеск меньше 1 или нулевой параллелизм - отказ каждому запросу
+        if not rate > 0:
+            raise ValueError(f"Частота лимита должна быть положительной: {rate}")
+        if burst < 1:
+            raise ValueError(f"Всплеск лимита должен быть не меньше 1: {burst}")
+        if concurrency < 1:
+            raise ValueError(f"Число одновременных запросов лимита должно быть не меньше 1: {concurrency}")
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+    
+    @classmethod
+    def parse(cls, value):
+        """
+        Из строки "rate/burst/concurrency", например "20/40/4".
+        
+        Raises:
+            ValueError: строка не в этом формате или значения вне допустимых (rate > 0, burst >= 1, concurrency >= 1)
+        """
+        try:
+            rate, burst, concurrency = value.split("/")
+            rate, burst, concurrency = float(rate), float(burst), int(concurrency)
+        except ValueError:
+            raise ValueError(f"Лимит должен иметь вид rate/burst/concurrency, например 20/40/4: {value!r}")
+        return cls(rate, burst, concurrency)
+
+
+class AdmissionControlMiddleware:
+    """
+    Контроль допуска: token bucket и лимит одновременных запросов на клиента
+    для каждого класса эндпоинтов (read, mutate, export).
+    
+    Клиент определяется client_identity(): проверенный X-API-Key, затем
+    X-CAD-Client от доверенного адреса (MCP сессия), иначе IP. Отказ - 429 с Retry-After - формируется прямо здесь,
+    до маршрутизации и без чтения тела, поэтому не доходит до FreeCADCore.
+    
+    classify(method, path) возвращает класс эндпоинта или None - тогда
+    запрос не ограничивается (метрики, админка, документация).
+    """
+    
+    def __init__(self, app, classify, limits, max_clients=10000):
+        self.app = app
+        self.classify = classify
+        self.limits = limits
+        self.max_clients = max_clients
+        # (клиент, класс) -> [токены, время последнего пополнения]
+        self._buckets = OrderedDict()
+        # (клиент, класс) -> число выполняющихся запросов
+        self._active = {}
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        endpoint_class = self.classify(scope["method"], scope["path"])
+        limit = self.limits.get(endpoint_class)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        
+        key = (client_identity(scope), endpoint_class)
+        if self._active.get(key, 0) >= limit.concurrency:
+            ADMISSION_REJECTIONS.labels(endpoint_class, "concurrency").inc()
+            await _send_json(send, 429, {"detail": "Слишком много одновременных запросов"}, retry_after=1)
+            return
+        wait = self._take_token(key, limit)
+        if wait:
+            ADMISSION_REJECTIONS.labels(endpoint_class, "rate").inc()
+            await _send_json(send, 429, {"detail": "Превышен лимит запросов"}, retry_after=math.ceil(wait))
+            return
+        
+        self._active[key] = self._active.get(key, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            remaining = self._active[key] - 1
+            if remaining:
+                self._active[key] = remaining
+            else:
+                del self._active[key]
+    
+    def _take_token(self, key, limit):
+        """Взять токен из корзины; вернуть 0 или сколько секунд ждать следующего."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [limit.burst, now]
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / limit.rate
+
+
+def client_identity(scope):
+    """
+    Идентификатор клиента: X-API-Key из CAD_API_KEYS (хеш), X-CAD-Client от
+    доверенного адреса (TRUSTED_CLIENT_HOSTS или Unix socket) или IP.
+    Непроверенные заголовки игнорируются, иначе лимиты и ключи
+    идемпотентности обходятся сменой заголовка.
+    """
+    headers = dict(scope["headers"])
+    api_key = headers.get(API_KEY_HEADER)
+    if api_key:
+        # Сам ключ в памяти не храним
+        digest = _key_digest(api_key)
+        if digest in API_KEY_DIGESTS:
+            return "key:" + digest[:16]
+    # Без адреса клиента - Unix socket, доступный только локальным процессам
+    host = (scope.get("client") or (None,))[0]
+    client = headers.get(CLIENT_HEADER)
+    if client and (host is None or host in TRUSTED_CLIENT_HOSTS):
+        return "client:" + client.decode("latin-1")
+    return "ip:" + (host or "unknown")
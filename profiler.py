@@ -0,0 +1,173 @@
+"""
+Сэмплирующий профилировщик работающего процесса гейтвея.
+
+Отдельный поток каждые interval секунд снимает стеки выбранных потоков
+через sys._current_frames() - профилируемый код не инструментируется и не
+замедляется, включать можно в любой момент без перезапуска.
+
+Результат доступен в трех видах:
+    - hot stacks: самые частые стеки с долями
+    - collapsed: "thread;frame;frame N" - вход для flamegraph.pl / speedscope
+    - pstats: файл, который читает pstats.Stats / snakeviz
+"""
+
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_SECONDS = 60.0
+MIN_INTERVAL = 0.001
+
+# Одновременно может идти только одно профилирование
+_busy = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Профилирование уже выполняется."""
+
+
+class Profile:
+    """Результат сэмплирования: счетчики стеков по потокам."""
+
+    def __init__(self, interval, thread_names):
+        self.interval = interval
+        self.thread_names = thread_names
+        # (имя потока, (кадр от корня к листу, ...)) -> число сэмплов
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+
+    def collapsed(self):
+        """Стеки в формате collapsed для flamegraph."""
+        lines = []
+        for (thread, frames), count in self.stacks.most_common():
+            label = ";".join((thread,) + tuple(_frame_label(f) for f in frames))
+            lines.append(f"{label} {count}")
+        return "\n".join(lines) + "\n"
+
+    def hot_stacks(self, limit=20):
+        """Самые частые стеки (лист сверху) с долей сэмплов потока."""
+        per_thread = Counter()
+        for (thread, _), count in self.stacks.items():
+            per_thread[thread] += count
+        result = []
+        for (thread, frames), count in self.stacks.most_common(limit):
+            result.append({
+                "thread": thread,
+                "samples": count,
+                "percent": round(count * 100 / per_thread[thread], 1),
+                "stack": [_frame_label(f) for f in reversed(frames)]
+            })
+        return result
+
+    def summary(self, limit=20):
+        per_thread = Counter()
+        for (thread, _), count in self.stacks.items():
+            per_thread[thread] += count
+        return {
+            "duration_sec": round(self.duration, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "threads": dict(per_thread),
+            "hot_stacks": self.hot_stacks(limit)
+        }
+
+    def pstats_bytes(self):
+        """
+        Данные в формате pstats (marshal словаря stats).
+
+        Вызовы восстанавливаются по сэмплам: nc - число сэмплов с функцией
+        в стеке, tt/ct - собственное и полное время (сэмплы * интервал).
+        """
+        stats = {}
+        for (_, frames), count in self.stacks.items():
+            seen = set()
+            for depth, func in enumerate(frames):
+                cc, nc, tt, ct, callers = stats.setdefault(func, (0, 0, 0.0, 0.0, {}))
+                is_leaf = depth == len(frames) - 1
+                tt += count * self.interval if is_leaf else 0.0
+                if func not in seen:
+                    # Рекурсия не должна удваивать полное время
+                    cc, nc, ct = cc + count, nc + count, ct + count * self.interval
+                    seen.add(func)
+                if depth > 0:
+                    caller = frames[depth - 1]
+                    c_cc, c_nc, c_tt, c_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (
+                        c_cc + count, c_nc + count,
+                        c_tt + (count * self.interval if is_leaf else 0.0),
+                        c_ct + count * self.interval
+                    )
+                stats[func] = (cc, nc, tt, ct, callers)
+        return marshal.dumps(stats)
+
+
+def _frame_label(func):
+    filename, lineno, name = func
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def _stack(frame):
+    """Стек от корня к листу; функция - (файл, первая строка, имя) как в pstats."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    frames.reverse()
+    return tuple(frames)
+
+
+def sample(thread_ids, seconds, interval):
+    """
+    Сэмплировать стеки потоков thread_ids ({ident: имя}) в течение seconds.
+
+    Блокирующая функция - вызывать из отдельного потока.
+
+    Raises:
+        ProfilerBusyError: если профилирование уже идет
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusyError("Профилирование уже выполняется")
+    try:
+        seconds = min(max(seconds, interval), MAX_SECONDS)
+        interval = max(interval, MIN_INTERVAL)
+        profile = Profile(interval, sorted(thread_ids.values()))
+        own_ident = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_tick = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            frames = sys._current_frames()
+            for ident, name in thread_ids.items():
+                frame = frames.get(ident)
+                if frame is not None and ident != own_ident:
+                    profile.stacks[(name, _stack(frame))] += 1
+            profile.samples += 1
+            del frames
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+        profile.duration = time.perf_counter() - started
+        return profile
+    finally:
+        _busy.release()
+
+
+def select_threads(event_loop_ident, all_threads=False):
+    """
+    Потоки для профилирования: поток event loop гейтвея и потоки FreeCAD
+    (или все потоки процесса при all_threads).
+    """
+    selected = {event_loop_ident: "event_loop"}
+    for thread in threading.enumerate():
+        if thread.ident is None or thread.ident == event_loop_ident:
+            continue
+        if all_threads or thread.name.startswith("freecad"):
+            selected[thread.ident] = thread.name
+    return selected
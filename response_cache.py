@@ -0,0 +1,111 @@
+"""
+Кеш ответов read-эндпоинтов с инвалидацией по ревизиям.
+
+Ответ хранится вместе с ревизией, для которой он построен: глобальной
+(список документов) или ревизией документа (объекты документа). Мутации
+увеличивают ревизии через ленту изменений (changes.py), поэтому устаревшая
+запись просто не совпадает по ревизии и перестраивается при следующем
+запросе - явной очистки не требуется.
+
+ETag вычисляется из ключа и ревизии, без построения тела ответа: если
+клиент прислал совпадающий If-None-Match, гейтвей отвечает 304, не
+обращаясь ни к кешу, ни к FreeCAD. В ETag входит идентификатор запуска
+процесса - после перезапуска ревизии начинаются заново, а старые ETag
+не должны совпасть.
+"""
+
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+
+from fastapi import Response
+
+from metrics import RESPONSE_CACHE_REQUESTS
+from singleflight import flights
+
+BOOT_ID = uuid.uuid4().hex[:8]
+
+MAX_ENTRIES = 256
+
+
+def etag(key, revision):
+    """ETag ответа для ключа и ревизии."""
+    digest = hashlib.blake2s(f"{key}\0{revision}".encode("utf-8"), digest_size=8).hexdigest()
+    return f'"{BOOT_ID}-{digest}"'
+
+
+def etag_matches(if_none_match, tag):
+    """Совпадает ли заголовок If-None-Match (список, W/, *) с ETag."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU тел ответов: ключ -> (ревизия, тело)."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, revision):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != revision:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, revision, body):
+        with self._lock:
+            self._entries[key] = (revision, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+cache = ResponseCache()
+
+
+async def cached_read(request, endpoint, key, revision, build):
+    """
+    Ответ read-эндпоинта через кеш.
+
+    Args:
+        request: Входящий запрос (для If-None-Match)
+        endpoint: Имя эндпоинта для метрик
+        key: Ключ кеша (включает все, от чего зависит ответ, кроме ревизии)
+        revision: Функция без аргументов -> текущая ревизия данных ответа
+        build: Корутинная функция без аргументов -> Response; кешируются только ответы 200
+    
+    Одновременные промахи по одному ключу и ревизии строят ответ один раз (singleflight.py).
+    Ревизия перечитывается после построения: если данные изменились, пока ответ
+    строился, тело может не соответствовать ревизии, поэтому оно отдается без
+    ETag и не кешируется.
+    """
+    current = revision()
+    tag = etag(key, current)
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        RESPONSE_CACHE_REQUESTS.labels(endpoint, "not_modified").inc()
+        return Response(status_code=304, headers=headers)
+    
+    body = cache.get(key, current)
+    if body is not None:
+        RESPONSE_CACHE_REQUESTS.labels(endpoint, "hit").inc()
+    else:
+        RESPONSE_CACHE_REQUESTS.labels(endpoint, "miss").inc()
+        response = await flights.do(endpoint, (key, current), build)
+        if response.status_code != 200:
+            return response
+        body = response.body
+        if revision() != current:
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-cache"})
+        cache.put(key, current, body)
+    return Response(content=body, media_type="application/json", headers=headers)
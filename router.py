@@ -0,0 +1,462 @@
+"""
+Фронт-роутер для нескольких воркеров гейтвея.
+
+Текущий документ (core.current_doc) живет в процессе воркера, поэтому
+запросы одного документа должны попадать в один процесс. Роутер
+принимает запросы вместо main.py и проксирует их воркерам, выбирая
+воркер по consistent hash ключа документа:
+    - заголовок X-CAD-Document, если клиент передает его явно;
+    - file_path запросов open-document / create-test-shape / save-document;
+    - иначе документ, который этот клиент открыл последним;
+    - иначе сам клиент (client_identity: проверенный X-API-Key / X-CAD-Client / IP).
+Запросы к задачам (/api/jobs/{id}) идут на воркер, который создал задачу.
+
+Запросы с заголовком X-CAD-Session (sessions.py) работают с документом
+своей сессии в воркере: роутер ведет текущий документ воркера отдельно
+для каждой сессии (и для запросов без сессии), а служебные save/open/close
+при переключении и переносе документов отправляет с тем же заголовком.
+
+В одном воркере может оказаться несколько документов: перед запросом
+другого документа роутер сохраняет и закрывает текущий документ воркера
+и открывает нужный (документы переключаются, когда запросов к текущему
+нет). Если воркер не смог сохранить или открыть документ, запрос
+завершается 502 (503 - воркер недоступен) и не проксируется.
+
+Воркеры добавляются и выводятся (drain) на ходу через /router/workers
+(заголовок X-Admin-Token со значением CAD_ADMIN_TOKEN, без него - 404).
+При изменении кольца документы, сменившие владельца, сохраняются на
+старом воркере и открываются на новом при первом запросе. Выводимый
+воркер сразу перестает получать новые документы и удаляется, когда
+завершатся его запросы.
+
+Запуск (воркеры - main.py на своих портах, без MCP):
+    CAD_GATEWAY_PORT=8101 CAD_MCP_PORT=0 python main.py
+    CAD_GATEWAY_PORT=8102 CAD_MCP_PORT=0 python main.py
+    python router.py --port 8001 --workers http://localhost:8101 http://localhost:8102
+Роутер передает воркерам идентификатор клиента в X-CAD-Client; воркер на
+другом хосте принимает его только от адреса из CAD_TRUSTED_CLIENTS.
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import hmac
+import logging
+import os
+import re
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+import sessions
+from middleware.custom_middleware import CLIENT_HEADER, client_identity
+
+logger = logging.getLogger("Router")
+
+DOCUMENT_HEADER = "x-cad-document"
+VIRTUAL_NODES = 128
+MAX_TRACKED = 100000
+
+# Эндпоинты, у которых file_path определяет документ
+_FILE_PATH_ENDPOINTS = ("/api/cad/open-document", "/api/cad/create-test-shape", "/api/cad/save-document")
+_JOB_PATH = re.compile(r"^/api/jobs/([0-9a-f]{32})(/|$)")
+
+# Заголовки соединения не проксируются (RFC 9110, 7.6.1)
+_HOP_BY_HOP = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailer", b"transfer-encoding", b"upgrade", b"host", b"content-length"
+}
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash с виртуальными узлами: при добавлении/удалении узла переезжает ~1/N ключей."""
+
+    def __init__(self, vnodes=VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self._points = []
+        self._owners = {}
+
+    def add(self, node):
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+                self._owners[point] = node
+
+    def remove(self, node):
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: self._owners[p] for p in self._points}
+
+    def get(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+class Worker:
+    """Воркер гейтвея и его состояние в роутере."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.draining = False
+        self.in_flight = 0
+        # Документ, открытый сейчас в воркере (ключ), по сессиям (None - без сессии),
+        # и идет ли переключение
+        self.current_keys = {}
+        self.switching = False
+        self.cond = asyncio.Condition()
+
+    def status(self):
+        return {
+            "url": self.url,
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "current_documents": [
+                {"session": session, "document": key} for session, key in self.current_keys.items()
+            ]
+        }
+
+
+class Router:
+    """Таблица воркеров, кольцо и привязки документов."""
+
+    def __init__(self, worker_urls=(), timeout=300.0):
+        self.workers = {}
+        self.ring = HashRing()
+        # ключ документа -> {"worker": url, "file_path": путь или None}
+        self.documents = OrderedDict()
+        # (клиент, сессия) -> ключ последнего открытого документа
+        self.client_documents = OrderedDict()
+        # id задачи -> url воркера
+        self.jobs = OrderedDict()
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=5.0))
+        for url in worker_urls:
+            worker = Worker(url)
+            self.workers[worker.url] = worker
+            self.ring.add(worker.url)
+
+    # ============ ВЫБОР ВОРКЕРА ============
+    @staticmethod
+    def session(request):
+        """Сессия запроса (заголовок X-CAD-Session) или None."""
+        return request.headers.get(sessions.SESSION_HEADER)
+
+    def route(self, request):
+        """Вернуть (воркер, ключ документа или None, file_path или None) для запроса."""
+        path = request.url.path
+        job = _JOB_PATH.match(path)
+        if job and job.group(1) in self.jobs:
+            return self.workers.get(self.jobs[job.group(1)]), None, None
+
+        client = client_identity(request.scope)
+        file_path = request.query_params.get("file_path") if path in _FILE_PATH_ENDPOINTS else None
+        key = request.headers.get(DOCUMENT_HEADER)
+        if not key and file_path:
+            key = os.path.normpath(file_path)
+        if not key:
+            key = self.client_documents.get((client, self.session(request)))
+
+        if key is None:
+            url = self.ring.get(f"client:{client}")
+        else:
+            placement = self.documents.get(key)
+            url = placement["worker"] if placement else self.ring.get(key)
+            if placement is None or placement.get("file_path") is None:
+                self._remember(self.documents, key, {"worker": url, "file_path": file_path})
+        return self.workers.get(url), key, file_path
+
+    def learn(self, request, response, key, file_path, worker):
+        """Запомнить привязки по ответу воркера: открытый документ и созданную задачу."""
+        path = request.url.path
+        if response.status_code == 202 and response.headers.get("location", "").startswith("/api/jobs/"):
+            self._remember(self.jobs, response.headers["location"].rsplit("/", 1)[-1], worker.url)
+        if response.status_code != 200 or key is None:
+            return
+        session = self.session(request)
+        client = (client_identity(request.scope), session)
+        if path == "/api/cad/open-document":
+            self._remember(self.client_documents, client, key)
+            self._remember(self.documents, key, {"worker": worker.url, "file_path": file_path})
+            worker.current_keys[session] = key
+        elif path == "/api/cad/close-document":
+            self.documents.pop(key, None)
+            if self.client_documents.get(client) == key:
+                del self.client_documents[client]
+            if worker.current_keys.get(session) == key:
+                del worker.current_keys[session]
+
+    @staticmethod
+    def _remember(table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > MAX_TRACKED:
+            table.popitem(last=False)
+
+    # ============ ПЕРЕКЛЮЧЕНИЕ ДОКУМЕНТОВ ВНУТРИ ВОРКЕРА ============
+    async def enter(self, worker, key, opens_document, session=None):
+        """
+        Занять слот запроса на воркере для документа key. Если в воркере
+        у этой сессии открыт другой документ, дождаться запросов воркера,
+        сохранить его и открыть нужный (open-document откроет документ сам).
+        """
+        async with worker.cond:
+            while worker.switching or (
+                key is not None and worker.current_keys.get(session) not in (None, key) and worker.in_flight
+            ):
+                await worker.cond.wait()
+            if key is None or (worker.current_keys.get(session) == key and not opens_document):
+                worker.in_flight += 1
+                return
+            worker.switching = True
+        try:
+            await self._switch(worker, key, session, open_target=not opens_document)
+        except BaseException:
+            # Переключение не удалось: запрос не выполняется и слот не занимает
+            async with worker.cond:
+                worker.switching = False
+                worker.cond.notify_all()
+            raise
+        async with worker.cond:
+            worker.switching = False
+            worker.in_flight += 1
+            worker.cond.notify_all()
+
+    async def leave(self, worker):
+        async with worker.cond:
+            worker.in_flight -= 1
+            worker.cond.notify_all()
+
+    async def _switch(self, worker, key, session=None, open_target=True):
+        """
+        Сохранить и закрыть текущий документ сессии в воркере и открыть
+        документ key. Документ, заданный только заголовком (путь неизвестен),
+        роутер не открывает: до open-document запросы к нему получат ошибку
+        воркера "нет открытого документа", а не чужой документ.
+        
+        Raises:
+            HTTPException: 409 - текущий документ нельзя сохранить (путь
+                неизвестен); 502/503 - воркер не выполнил save/close/open
+        """
+        previous = worker.current_keys.get(session)
+        if previous not in (None, key):
+            current = self.documents.get(previous)
+            if not current or not current.get("file_path"):
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"В воркере открыт документ {previous} с неизвестным путем: "
+                           f"сохраните (save-document с file_path) или закройте его перед работой с другим документом"
+                )
+            await self._call(worker, "/api/cad/save-document", session, file_path=current["file_path"])
+            await self._call(worker, "/api/cad/close-document", session)
+            worker.current_keys.pop(session, None)
+        if not open_target:
+            return
+        target = self.documents.get(key)
+        if target and target.get("file_path"):
+            await self._call(worker, "/api/cad/open-document", session, file_path=target["file_path"])
+            worker.current_keys[session] = key
+
+    async def _call(self, worker, path, session=None, **params):
+        """
+        Служебный запрос к воркеру от имени сессии session (None - без сессии).
+        
+        Raises:
+            HTTPException: 503 - воркер недоступен; 502 - воркер вернул ошибку
+        """
+        headers = {sessions.SESSION_HEADER: session} if session else {}
+        try:
+            response = await self.client.get(worker.url + path, params=params, headers=headers)
+        except httpx.TransportError as e:
+            logger.warning(f"{worker.url}{path} {params}: {e}")
+            raise HTTPException(status_code=503, detail=f"Воркер {worker.url} недоступен: {e}")
+        if response.status_code >= 400:
+            logger.warning(f"{worker.url}{path} {params}: {response.status_code} {response.text}")
+            raise HTTPException(
+                status_code=502,
+                detail=f"Воркер {worker.url} не выполнил {path}: {response.status_code} {response.text}"
+            )
+        return response
+
+    # ============ ПРОКСИРОВАНИЕ ============
+    async def forward(self, request):
+        worker, key, file_path = self.route(request)
+        if worker is None:
+            raise HTTPException(status_code=503, detail="Нет доступных воркеров")
+        opens_document = request.url.path in ("/api/cad/open-document", "/api/cad/create-test-shape")
+        await self.enter(worker, key, opens_document, self.session(request))
+        try:
+            headers = [
+                (k, v) for k, v in request.headers.raw if k.lower() not in _HOP_BY_HOP and k.lower() != CLIENT_HEADER
+            ]
+            # Воркер доверяет X-CAD-Client роутера: передаем проверенный идентификатор клиента
+            headers.append((CLIENT_HEADER, client_identity(request.scope).encode("latin-1")))
+            upstream_request = self.client.build_request(
+                request.method,
+                httpx.URL(worker.url + request.url.path, query=request.url.query.encode("latin-1")),
+                headers=headers,
+                content=request.stream()
+            )
+            upstream = await self.client.send(upstream_request, stream=True)
+        except httpx.TransportError as e:
+            await self.leave(worker)
+            raise HTTPException(status_code=503, detail=f"Воркер {worker.url} недоступен: {e}")
+        except Exception:
+            await self.leave(worker)
+            raise
+        self.learn(request, upstream, key, file_path, worker)
+
+        async def release():
+            await upstream.aclose()
+            await self.leave(worker)
+
+        response_headers = {
+            k: v for k, v in upstream.headers.items() if k.lower().encode("latin-1") not in _HOP_BY_HOP
+        }
+        response_headers["X-CAD-Worker"] = worker.url
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers=response_headers,
+            background=BackgroundTask(release)
+        )
+
+    # ============ ДОБАВЛЕНИЕ / ВЫВОД ВОРКЕРОВ ============
+    async def join(self, url):
+        worker = Worker(url)
+        if worker.url in self.workers and not self.workers[worker.url].draining:
+            return {"joined": worker.url, "moved": []}
+        self.workers[worker.url] = worker
+        self.ring.add(worker.url)
+        return {"joined": worker.url, "moved": await self.rebalance()}
+
+    async def drain(self, url, timeout=60.0):
+        """Вывести воркер: перенести его документы и дождаться завершения его запросов."""
+        worker = self.workers.get(url.rstrip("/"))
+        if worker is None:
+            raise HTTPException(status_code=404, detail=f"Воркер {url} не найден")
+        worker.draining = True
+        self.ring.remove(worker.url)
+        moved = await self.rebalance()
+        async with worker.cond:
+            try:
+                await asyncio.wait_for(worker.cond.wait_for(lambda: worker.in_flight == 0), timeout)
+            except asyncio.TimeoutError:
+                return {"drained": False, "moved": moved, "in_flight": worker.in_flight}
+        del self.workers[worker.url]
+        return {"drained": True, "moved": moved}
+
+    async def rebalance(self):
+        """
+        Переназначить документы по новому кольцу. Документ, открытый на
+        старом воркере, сохраняется там; новый воркер откроет его при первом запросе.
+        """
+        moved = []
+        for key, placement in list(self.documents.items()):
+            owner = self.ring.get(key)
+            if owner is None or owner == placement["worker"]:
+                continue
+            old = self.workers.get(placement["worker"])
+            # Сессии старого воркера, у которых этот документ текущий
+            holders = [session for session, current in old.current_keys.items() if current == key] if old else []
+            if holders and placement.get("file_path"):
+                async with old.cond:
+                    await old.cond.wait_for(lambda: not old.switching and old.in_flight == 0)
+                    old.switching = True
+                try:
+                    for session in holders:
+                        await self._call(old, "/api/cad/save-document", session, file_path=placement["file_path"])
+                        await self._call(old, "/api/cad/close-document", session)
+                        old.current_keys.pop(session, None)
+                except HTTPException as e:
+                    # Документ не сохранен - остается на старом воркере, пока тот в таблице
+                    logger.warning(f"Документ {key} не перенесен с {old.url}: {e.detail}")
+                    continue
+                finally:
+                    async with old.cond:
+                        old.switching = False
+                        old.cond.notify_all()
+            placement["worker"] = owner
+            moved.append({"document": key, "from": old.url if old else None, "to": owner})
+        if moved:
+            logger.info(f"Перенесено документов: {len(moved)}")
+        return moved
+
+    def status(self):
+        return {
+            "workers": [worker.status() for worker in self.workers.values()],
+            "documents": len(self.documents),
+            "clients": len(self.client_documents),
+            "jobs": len(self.jobs)
+        }
+
+
+def require_admin_token(request: Request):
+    """
+    Изменять состав воркеров можно только с X-Admin-Token = CAD_ADMIN_TOKEN:
+    воркеру уходят документы и доверенный X-CAD-Client. Без CAD_ADMIN_TOKEN
+    эндпоинты отключены (404).
+    """
+    admin_token = os.getenv("CAD_ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Управление воркерами отключено: задайте CAD_ADMIN_TOKEN")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Требуется X-Admin-Token")
+
+
+def create_app(worker_urls):
+    router = Router(worker_urls)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        try:
+            yield
+        finally:
+            await router.client.aclose()
+
+    app = FastAPI(title="CAD Gateway Router", lifespan=lifespan)
+    app.state.router = router
+
+    @app.get("/router/status")
+    async def router_status():
+        """Воркеры, их нагрузка и число привязанных документов."""
+        return router.status()
+
+    @app.post("/router/workers", dependencies=[Depends(require_admin_token)])
+    async def join_worker(url: str):
+        """Добавить воркер в кольцо и перераспределить документы (заголовок X-Admin-Token)."""
+        return await router.join(url)
+
+    @app.delete("/router/workers", dependencies=[Depends(require_admin_token)])
+    async def drain_worker(url: str, timeout: float = 60.0):
+        """Вывести воркер из кольца (drain) и перераспределить его документы (заголовок X-Admin-Token)."""
+        return await router.drain(url, timeout)
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    async def proxy(request: Request, path: str):
+        return await router.forward(request)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Фронт-роутер воркеров CAD API Gateway")
+    parser.add_argument("--port", type=int, default=8001, help="Порт роутера")
+    parser.add_argument("--workers", nargs="+", required=True, help="Адреса воркеров (main.py)")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    uvicorn.run(create_app(args.workers), host="0.0.0.0", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,27 @@
 # server.py (замените на это)
+import os
+from starlette.responses import Response
+import metrics
 from mcp_instance import mcp
+from middleware.custom_middleware import MCPMetricsMiddleware, MCPTracingMiddleware, MCPToolCacheMiddleware, MCPSessionMiddleware
 from tools import (
     tool_create_cube, tool_create_cylinder, tool_create_shapes,
     tool_create_sphere, tool_documents, tool_status, tool_open_document,
     tool_save_document, tool_close_document, tool_create_complex_shape,
-    tool_test_shape
+    tool_test_shape, tool_update_object, tool_delete_object, tool_get_job, tool_cancel_job, tool_create_shapes_batch, tool_create_pattern, tool_export_document, tool_execute_plan, resource_documents
 )
 
+mcp.add_middleware(MCPMetricsMiddleware())
+mcp.add_middleware(MCPTracingMiddleware())
+mcp.add_middleware(MCPToolCacheMiddleware())
+mcp.add_middleware(MCPSessionMiddleware())
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def get_metrics(request):
+    """Метрики MCP процесса (вызовы инструментов, пул соединений к гейтвею) в формате Prometheus."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     # Запуск сервера с HTTP транспортом
-    mcp.run(transport="streamable-http", host="0.0.0.0", port=8000)
\ No newline at end of file
+    mcp.run(transport="streamable-http", host="0.0.0.0", port=int(os.getenv("CAD_MCP_PORT", "8000")))
\ No newline at end of file
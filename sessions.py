@@ -0,0 +1,121 @@
+"""
+Изоляция документов по сессиям MCP.
+
+У FreeCADCore один текущий документ, и без изоляции два ассистента,
+вызывающие open_document/create_shape вперемешку, работают в чужом
+документе. Запрос с заголовком X-CAD-Session (его добавляют инструменты
+MCP, значение - id сессии MCP) выполняется в контексте своей сессии:
+core.current_doc для него - документ этой сессии. Операции по-прежнему
+выполняются в одном потоке FreeCAD, но сессии не мешают друг другу и не
+ждут, пока другая закроет документ.
+
+Запросы без заголовка работают с общим текущим документом, как раньше.
+Один клиент (client_identity) может создать не больше max_per_client
+сессий, иначе мусорные заголовки заполнят реестр для всех остальных.
+Сессии без запросов дольше idle_timeout удаляются, их документ
+сохраняется и закрывается (main.py, sweep_idle_sessions).
+"""
+
+import contextvars
+import os
+import threading
+import time
+
+SESSION_HEADER = "X-CAD-Session"
+
+# id сессии текущего запроса (None - общий текущий документ)
+current_session = contextvars.ContextVar("cad_session", default=None)
+
+
+class TooManySessionsError(RuntimeError):
+    """Клиент исчерпал свой лимит сессий."""
+
+
+class SessionState:
+    """Состояние сессии: ее текущий документ, создавший ее клиент и время последнего запроса."""
+
+    def __init__(self, owner=None):
+        self.document = None
+        self.owner = owner
+        self.created_at = time.time()
+        self.last_seen = time.monotonic()
+
+
+class SessionRegistry:
+    """Сессии и их документы (потокобезопасно: читается и из потока FreeCAD)."""
+
+    def __init__(self, idle_timeout=1800.0, max_sessions=1000, max_per_client=20):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_per_client = max_per_client
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id, owner=None):
+        """
+        Отметить запрос сессии (создать сессию, если ее нет).
+
+        Args:
+            session_id: id сессии
+            owner: Клиент, от имени которого создается сессия (client_identity)
+
+        Raises:
+            TooManySessionsError: у клиента owner уже max_per_client сессий
+            RuntimeError: в реестре уже max_sessions сессий
+        """
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                if owner is not None and sum(
+                    1 for other in self._sessions.values() if other.owner == owner
+                ) >= self.max_per_client:
+                    raise TooManySessionsError(f"Слишком много сессий клиента ({self.max_per_client})")
+                if len(self._sessions) >= self.max_sessions:
+                    raise RuntimeError(f"Слишком много сессий ({self.max_sessions})")
+                state = self._sessions[session_id] = SessionState(owner)
+            state.last_seen = time.monotonic()
+            return state
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def pop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def expired(self):
+        """Удалить и вернуть сессии, простаивающие дольше idle_timeout: [(id, состояние)]."""
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [(sid, state) for sid, state in self._sessions.items() if state.last_seen < deadline]
+            for sid, _ in idle:
+                del self._sessions[sid]
+        return idle
+
+    def holders(self, document_name, exclude=None):
+        """Сколько сессий (кроме exclude) держат документ текущим."""
+        with self._lock:
+            return sum(
+                1 for sid, state in self._sessions.items()
+                if sid != exclude and state.document is not None and state.document.Name == document_name
+            )
+
+    def info(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "session": sid,
+                    "document": state.document.Name if state.document is not None else None,
+                    "created_at": state.created_at,
+                    "idle_seconds": round(now - state.last_seen, 1),
+                }
+                for sid, state in self._sessions.items()
+            ]
+
+
+registry = SessionRegistry(
+    idle_timeout=float(os.getenv("CAD_SESSION_IDLE_TIMEOUT", "1800")),
+    max_per_client=int(os.getenv("CAD_SESSIONS_PER_CLIENT", "20"))
+)
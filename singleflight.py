@@ -0,0 +1,49 @@
+"""
+Single-flight: одинаковые одновременные операции выполняются один раз.
+
+Первый вызов с ключом (лидер) запускает работу, остальные, пришедшие до
+ее окончания, ждут тот же результат (или то же исключение). Ключ должен
+включать нормализованные параметры и ревизию документа, иначе ожидающий
+получит результат, построенный для другого состояния.
+
+Работа выполняется в отдельной задаче: если лидер отключится, ожидающие
+все равно получат результат.
+"""
+
+import asyncio
+
+from metrics import SINGLEFLIGHT_CALLS
+
+
+class SingleFlight:
+    """Набор выполняющихся операций по ключам."""
+
+    def __init__(self):
+        self._in_flight = {}
+
+    async def do(self, operation, key, fn):
+        """
+        Выполнить fn() или дождаться уже выполняющегося вызова с тем же ключом.
+
+        Args:
+            operation: Имя операции (метка метрик, часть ключа)
+            key: Хешируемый ключ - нормализованные параметры и ревизия
+            fn: Корутинная функция без аргументов
+        """
+        full_key = (operation, key)
+        task = self._in_flight.get(full_key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.labels(operation, "leader").inc()
+            task = asyncio.ensure_future(fn())
+            self._in_flight[full_key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(full_key, None))
+        else:
+            SINGLEFLIGHT_CALLS.labels(operation, "shared").inc()
+        # shield: отмена одного ожидающего не отменяет общую работу
+        return await asyncio.shield(task)
+
+    def in_flight(self):
+        return len(self._in_flight)
+
+
+flights = SingleFlight()
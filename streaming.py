@@ -0,0 +1,106 @@
+"""
+Потоковые ответы гейтвея для длинных операций CAD.
+
+Операция отправляет события по мере выполнения (например, по одному на
+каждый построенный объект), клиент получает их сразу, без опроса задачи.
+Формат выбирается параметром format или заголовком Accept:
+    sse    - text/event-stream ("event: item" / "data: {...}")
+    ndjson - application/x-ndjson, по JSON-объекту {"event": ..., ...} на строку
+
+Если клиент отключился, операция отменяется в ближайшей точке await.
+"""
+
+import asyncio
+
+from fastapi.responses import StreamingResponse
+
+from tools import models
+
+FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+# Пачка по умолчанию для потоковых эндпоинтов: меньше, чем в bulk-load,
+# чтобы события приходили чаще (ценой большего числа пересчетов)
+STREAM_BATCH_SIZE = 10
+
+# Пока событий нет, раз в HEARTBEAT_SECONDS отправляется heartbeat,
+# чтобы соединение не закрыли прокси и таймауты чтения клиента
+HEARTBEAT_SECONDS = 10.0
+
+
+def negotiate_format(format=None, accept=None):
+    """
+    Формат потока: явный format, иначе sse, если клиент принимает
+    text/event-stream, иначе ndjson.
+
+    Raises:
+        ValueError: если format не поддерживается
+    """
+    if format:
+        if format not in FORMATS:
+            raise ValueError(f"format должен быть одним из: {', '.join(FORMATS)}")
+        return format
+    return "sse" if "text/event-stream" in (accept or "") else "ndjson"
+
+
+def encode_event(fmt, event, data):
+    """Событие в байты выбранного формата."""
+    if fmt == "sse":
+        return b"event: " + event.encode("utf-8") + b"\ndata: " + models.dumps(data) + b"\n\n"
+    return models.dumps({"event": event, **data}) + b"\n"
+
+
+async def operation_events(run, heartbeat=HEARTBEAT_SECONDS):
+    """
+    Выполнить операцию и отдавать ее события по мере появления.
+
+    Args:
+        run: Корутинная функция run(emit); emit(event, data) отправляет событие.
+            Результат run (dict) отправляется событием "done" (если не None),
+            исключение - событием "error".
+        heartbeat: Интервал heartbeat в секундах
+
+    Yields:
+        tuple: (имя события, данные)
+    """
+    queue = asyncio.Queue()
+    
+    def emit(event, data):
+        queue.put_nowait((event, data))
+    
+    async def worker():
+        try:
+            result = await run(emit)
+            if result is not None:
+                emit("done", result)
+        except Exception as e:
+            emit("error", {"message": str(e)})
+        finally:
+            queue.put_nowait(None)
+    
+    task = asyncio.create_task(worker())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                item = ("heartbeat", {})
+            if item is None:
+                break
+            yield item
+    finally:
+        # Клиент отключился (или поток закончен) - операция больше не нужна
+        task.cancel()
+
+
+def stream_response(events, fmt):
+    """StreamingResponse из асинхронного потока событий (event, data)."""
+    async def body():
+        async for event, data in events:
+            yield encode_event(fmt, event, data)
+    
+    return StreamingResponse(
+        body(),
+        media_type=FORMATS[fmt],
+        # Отключаем кеширование и буферизацию в прокси (nginx), иначе события придут пачкой в конце
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
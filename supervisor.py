@@ -0,0 +1,188 @@
+"""
+Supervisor: гейтвей и MCP сервер в отдельных процессах.
+
+В обычном режиме main.py запускает MCP сервер потоком внутри гейтвея:
+оба делят GIL с FastAPI и FreeCAD, и падение одного роняет другой.
+Supervisor запускает их отдельными процессами:
+    gateway - main.py без MCP (CAD_MCP_PORT=0); слушает TCP порт для
+              внешних клиентов и Unix socket для MCP сервера;
+    mcp     - server.py; инструменты обращаются к гейтвею через Unix
+              socket (CAD_GATEWAY_UDS), без TCP стека loopback.
+
+Каждый процесс перезапускается независимо, если он завершился или (для
+гейтвея) перестал отвечать на проверку. Между перезапусками -
+экспоненциальная пауза, которая сбрасывается, если процесс проработал
+RESET_BACKOFF_AFTER секунд. Где нет AF_UNIX (Windows), MCP сервер
+обращается к гейтвею по TCP.
+
+Запуск:
+    python supervisor.py --gateway-port 8001 --mcp-port 8000
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger("Supervisor")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+POLL_INTERVAL = 0.5
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+RESET_BACKOFF_AFTER = 60.0
+STOP_TIMEOUT = 10.0
+
+# Проверка гейтвея: сколько ждать старта и сколько неудач подряд считать зависанием
+HEALTH_INTERVAL = 5.0
+HEALTH_TIMEOUT = 5.0
+HEALTH_STARTUP_GRACE = 60.0
+HEALTH_MAX_FAILURES = 3
+
+
+def probe_gateway(uds=None, port=None, timeout=HEALTH_TIMEOUT):
+    """GET / гейтвея через Unix socket (или TCP порт). True, если пришел ответ 200."""
+    try:
+        family, address = (socket.AF_UNIX, uds) if uds else (socket.AF_INET, ("127.0.0.1", port))
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(address)
+            sock.sendall(b"GET / HTTP/1.1\r\nHost: gateway\r\nConnection: close\r\n\r\n")
+            status_line = sock.recv(64).split(b"\r\n", 1)[0]
+        return status_line.split()[1:2] == [b"200"]
+    except (OSError, IndexError):
+        return False
+
+
+class Child:
+    """Дочерний процесс с политикой перезапуска."""
+
+    def __init__(self, name, args, env, health=None):
+        self.name = name
+        self.args = args
+        self.env = env
+        self.health = health
+        self.process = None
+        self.started_at = 0.0
+        self.backoff = MIN_BACKOFF
+        self.restart_at = 0.0
+        self.restarts = 0
+        self.health_checked_at = 0.0
+        self.health_failures = 0
+
+    def start(self):
+        logger.info(f"Запуск {self.name}: {' '.join(self.args)}")
+        self.process = subprocess.Popen(self.args, cwd=ROOT, env=self.env)
+        self.started_at = time.monotonic()
+        self.health_checked_at = self.started_at
+        self.health_failures = 0
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"{self.name} не завершился за {timeout} с, kill")
+            self.process.kill()
+            self.process.wait()
+
+    def _unhealthy(self, now):
+        if self.health is None or now - self.started_at < HEALTH_STARTUP_GRACE:
+            return False
+        if now - self.health_checked_at < HEALTH_INTERVAL:
+            return False
+        self.health_checked_at = now
+        if self.health():
+            self.health_failures = 0
+            return False
+        self.health_failures += 1
+        logger.warning(f"{self.name} не ответил на проверку ({self.health_failures}/{HEALTH_MAX_FAILURES})")
+        return self.health_failures >= HEALTH_MAX_FAILURES
+
+    def tick(self, now):
+        """Проверить процесс и при необходимости запланировать/выполнить перезапуск."""
+        if self.process is None:
+            if now >= self.restart_at:
+                self.start()
+            return
+        code = self.process.poll()
+        if code is None and not self._unhealthy(now):
+            return
+        if code is None:
+            self.stop()
+            code = self.process.returncode
+        uptime = now - self.started_at
+        if uptime >= RESET_BACKOFF_AFTER:
+            self.backoff = MIN_BACKOFF
+        logger.error(f"{self.name} завершился (код {code}, работал {uptime:.0f} с), перезапуск через {self.backoff:.0f} с")
+        self.process = None
+        self.restarts += 1
+        self.restart_at = now + self.backoff
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+
+def build_children(gateway_port, mcp_port, uds):
+    base = {k: v for k, v in os.environ.items() if k != "CAD_GATEWAY_UDS"}
+    gateway_env = {**base, "CAD_GATEWAY_PORT": str(gateway_port), "CAD_MCP_PORT": "0"}
+    mcp_env = {
+        **base,
+        "CAD_MCP_PORT": str(mcp_port),
+        "CAD_GATEWAY_URL": base.get("CAD_GATEWAY_URL", f"http://localhost:{gateway_port}"),
+    }
+    if uds:
+        gateway_env["CAD_GATEWAY_UDS"] = mcp_env["CAD_GATEWAY_UDS"] = uds
+    return [
+        Child("gateway", [sys.executable, "main.py"], gateway_env, health=lambda: probe_gateway(uds, gateway_port)),
+        Child("mcp", [sys.executable, "server.py"], mcp_env),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Гейтвей и MCP сервер в отдельных процессах")
+    parser.add_argument("--gateway-port", type=int, default=int(os.getenv("CAD_GATEWAY_PORT", "8001")))
+    parser.add_argument("--mcp-port", type=int, default=int(os.getenv("CAD_MCP_PORT", "8000")))
+    parser.add_argument(
+        "--uds", default=os.path.join(tempfile.gettempdir(), f"cad-gateway-{os.getpid()}.sock"),
+        help="Путь Unix socket гейтвея (пустая строка - связь по TCP)"
+    )
+    args = parser.parse_args()
+    if not hasattr(socket, "AF_UNIX"):
+        # Windows без AF_UNIX: MCP сервер обращается к гейтвею по TCP
+        args.uds = ""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    children = build_children(args.gateway_port, args.mcp_port, args.uds)
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    try:
+        while not stopping:
+            now = time.monotonic()
+            for child in children:
+                child.tick(now)
+            time.sleep(POLL_INTERVAL)
+    finally:
+        logger.info("Остановка процессов")
+        # MCP первым: он зависит от гейтвея
+        for child in reversed(children):
+            child.stop()
+        if args.uds and os.path.exists(args.uds):
+            os.remove(args.uds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# Модули сервера лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sessions  # noqa: E402
+from common_logic import core  # noqa: E402
+from fakes import FakeFreeCAD, FakePart  # noqa: E402
+
+
+@pytest.fixture
+def freecad(tmp_path, monkeypatch):
+    """FreeCADCore с тестовым двойником FreeCAD; рабочий каталог - tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    app = FakeFreeCAD()
+    monkeypatch.setattr(core, "freecad", app)
+    monkeypatch.setattr(core, "part", FakePart())
+    monkeypatch.setattr(core, "_current_doc", None)
+    monkeypatch.setattr(sessions, "registry", sessions.SessionRegistry())
+    return app
@@ -0,0 +1,179 @@
+"""
+Тестовый двойник FreeCAD/Part: документы, объекты, транзакции и
+сохранение в файл (JSON вместо FCStd) - ровно то, что использует
+FreeCADCore. Геометрия не строится, фигуры - записи параметров.
+"""
+
+import copy
+import json
+import os
+
+
+class Vector:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = x, y, z
+
+
+class Shape:
+    def __init__(self, kind, *args):
+        self.kind = kind
+        self.args = args
+
+    def copy(self):
+        return Shape(self.kind, *self.args)
+
+    def translate(self, vector):
+        return self
+
+    def rotate(self, *args):
+        return self
+
+    def extrude(self, vector):
+        return Shape("extrusion", self)
+
+
+class FakePart:
+    """Модуль Part."""
+
+    def __init__(self):
+        self.exported = []
+
+    def makeBox(self, *args):
+        return Shape("box", *args)
+
+    def makeSphere(self, *args):
+        return Shape("sphere", *args)
+
+    def makeCylinder(self, *args):
+        return Shape("cylinder", *args)
+
+    def makeTorus(self, *args):
+        return Shape("torus", *args)
+
+    def makePolygon(self, points):
+        return Shape("polygon", len(points))
+
+    def Face(self, wire):
+        return Shape("face", wire)
+
+    def export(self, objects, path):
+        self.exported.append((path, [obj.Name for obj in objects]))
+        with open(path, "w") as f:
+            f.write("export")
+
+
+class FeatureObject:
+    """Part::Feature с динамическими свойствами."""
+
+    def __init__(self, doc, name):
+        self.Document = doc
+        self.Name = name
+        self.Label = name
+        self.Shape = None
+        self.PropertiesList = []
+        # Объекты, которые зависят от этого (задается тестом)
+        self.InListRecursive = []
+
+    def addProperty(self, type_, name, group="", doc=""):
+        self.PropertiesList.append(name)
+        setattr(self, name, "")
+
+
+class Document:
+    def __init__(self, app, name, file_name=""):
+        self.app = app
+        self.Name = name
+        self.FileName = file_name
+        self._objects = {}
+        self.UndoMode = 0
+        self._transaction = None
+        # Имена объектов, пересчитанных каждым вызовом recompute
+        self.recomputed = []
+
+    @property
+    def Objects(self):
+        return list(self._objects.values())
+
+    def addObject(self, type_, name):
+        unique, index = name, 1
+        while unique in self._objects:
+            unique, index = f"{name}{index:03d}", index + 1
+        obj = self._objects[unique] = FeatureObject(self, unique)
+        return obj
+
+    def getObject(self, name):
+        return self._objects.get(name)
+
+    def removeObject(self, name):
+        del self._objects[name]
+
+    def recompute(self, objects=None):
+        self.recomputed.append(None if objects is None else [obj.Name for obj in objects])
+
+    def openTransaction(self, name=""):
+        self._transaction = copy.copy(self._objects)
+
+    def commitTransaction(self):
+        self._transaction = None
+
+    def abortTransaction(self):
+        if self._transaction is not None:
+            self._objects, self._transaction = self._transaction, None
+
+    def _dump(self):
+        return {
+            name: {"CadShapeType": getattr(obj, "CadShapeType", None), "CadParams": getattr(obj, "CadParams", None)}
+            for name, obj in self._objects.items()
+        }
+
+    def save(self):
+        with open(self.FileName, "w", encoding="utf-8") as f:
+            json.dump(self._dump(), f)
+
+    def saveAs(self, path):
+        self.FileName = path
+        self.save()
+
+    def _load(self):
+        with open(self.FileName, encoding="utf-8") as f:
+            data = json.load(f)
+        for name, props in data.items():
+            obj = self.addObject("Part::Feature", name)
+            if props["CadShapeType"] is not None:
+                obj.addProperty("App::PropertyString", "CadShapeType")
+                obj.addProperty("App::PropertyString", "CadParams")
+                obj.CadShapeType, obj.CadParams = props["CadShapeType"], props["CadParams"]
+
+
+class FakeFreeCAD:
+    """Модуль FreeCAD (App)."""
+
+    Vector = Vector
+
+    def __init__(self):
+        self.documents = {}
+
+    def Version(self):
+        return ["1", "0", "0"]
+
+    def listDocuments(self):
+        return dict(self.documents)
+
+    def newDocument(self, name):
+        unique, index = name, 1
+        while unique in self.documents:
+            unique, index = f"{name}{index}", index + 1
+        doc = self.documents[unique] = Document(self, unique)
+        return doc
+
+    def openDocument(self, path):
+        for doc in self.documents.values():
+            if doc.FileName == path:
+                return doc
+        doc = self.newDocument(os.path.splitext(os.path.basename(path))[0])
+        doc.FileName = path
+        doc._load()
+        return doc
+
+    def closeDocument(self, name):
+        del self.documents[name]
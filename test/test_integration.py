@@ -1 +1,770 @@
-# здесь должны быть тесты
\ No newline at end of file
+"""Интеграционные тесты: HTTP гейтвей (FastAPI TestClient) и MCP сервер в одном процессе."""
+
+import asyncio
+import json
+import os
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+import sessions
+import tool_cache
+from common_logic import core
+
+
+@pytest.fixture
+def client(freecad):
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def _create_cube(client, size=10, x=0):
+    response = client.get("/api/cad/create-shape", params={"shape_type": "cube", "size": size, "x": x})
+    assert response.status_code == 200
+    return response.json()["data"]["object_name"]
+
+
+# ============ update_object / delete_object ============
+
+def test_update_object_endpoint_recomputes_dependents(client, freecad):
+    client.get("/api/cad/open-document", params={"file_path": "model.FCStd"})
+    name = _create_cube(client)
+    doc = freecad.listDocuments()["model"]
+    doc.getObject(name).InListRecursive = [doc.addObject("Part::Feature", "Fusion")]
+
+    response = client.get("/api/cad/update-object", params={"name": name, "size": 25})
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["action"] == "updated"
+    assert data["recomputed"] == 2
+    assert data["changes"] == {"size": 25.0}
+    objects = {o["name"]: o for o in client.get("/api/cad/objects").json()["data"]["objects"]}
+    assert objects[name]["params"]["size"] == 25.0
+
+
+def test_delete_object_endpoint(client, freecad):
+    client.get("/api/cad/open-document", params={"file_path": "model.FCStd"})
+    name = _create_cube(client)
+
+    response = client.get("/api/cad/delete-object", params={"name": name})
+    missing = client.get("/api/cad/delete-object", params={"name": name})
+
+    assert response.status_code == 200
+    assert response.json()["data"]["action"] == "deleted"
+    assert missing.status_code == 404
+    assert freecad.listDocuments()["model"].getObject(name) is None
+
+
+# ============ Асинхронные задачи ============
+
+def test_batch_job_reports_progress_and_result(client, freecad):
+    client.get("/api/cad/open-document", params={"file_path": "model.FCStd"})
+
+    submitted = client.post("/api/jobs/batch", json={"shapes": [{"shape_type": "cube", "size": 1}] * 3}, params={"batch_size": 2})
+    job_id = submitted.json()["data"]["job_id"]
+    for _ in range(100):
+        result = client.get(f"/api/jobs/{job_id}/result")
+        if result.status_code == 200:
+            break
+        time.sleep(0.01)
+
+    assert submitted.status_code == 202
+    assert submitted.headers["location"] == f"/api/jobs/{job_id}"
+    assert result.status_code == 200
+    body = result.json()
+    assert body["data"]["status"] == "succeeded"
+    assert body["data"]["progress"] == {"done": 3, "total": 3, "added": 3, "failed": 0, "batches": 2}
+    assert len(body["output"]["objects"]) == 3
+
+
+def test_job_queue_overflow_returns_429_with_retry_after(client, freecad, monkeypatch):
+    import jobs
+
+    monkeypatch.setattr(main, "jobs", jobs.JobManager(max_concurrent=1, max_queued=0))
+    client.get("/api/cad/open-document", params={"file_path": "model.FCStd"})
+
+    response = client.post("/api/jobs/batch", json={"shapes": [{"shape_type": "cube"}]})
+
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+
+# ============ Сессии ============
+
+def test_sessions_work_in_their_own_documents_until_ended(client, freecad):
+    alpha, beta = {"X-CAD-Session": "alpha"}, {"X-CAD-Session": "beta"}
+    client.get("/api/cad/open-document", params={"file_path": "a.FCStd"}, headers=alpha)
+    client.get("/api/cad/open-document", params={"file_path": "b.FCStd"}, headers=beta)
+
+    created = client.get("/api/cad/create-shape", params={"shape_type": "cube"}, headers=alpha)
+    objects = client.get("/api/cad/objects", headers=beta).json()["data"]
+    listed = client.get("/api/sessions").json()["sessions"]
+    ended = client.delete("/api/sessions/alpha")
+
+    assert created.json()["data"]["document"] == "a"
+    assert objects["document"] == "b" and objects["objects"] == []
+    assert {(info["session"], info["document"]) for info in listed} == {("alpha", "a"), ("beta", "b")}
+    assert ended.json() == {"session": "alpha", "closed": "a"}
+    assert set(freecad.listDocuments()) == {"b"}
+    assert client.delete("/api/sessions/alpha").status_code == 404
+
+
+def test_session_header_junk_is_capped_per_client(client, freecad, monkeypatch):
+    monkeypatch.setattr(sessions.registry, "max_per_client", 2)
+
+    statuses = [client.get("/api/cad/objects", headers={"X-CAD-Session": f"junk-{i}"}).status_code for i in range(3)]
+    # Другой клиент (MCP сессия через доверенный адрес) по-прежнему создает сессии
+    trusted = TestClient(main.app, client=("127.0.0.1", 50000))
+    other = trusted.get("/api/cad/objects", headers={"X-CAD-Session": "mcp-1", "X-CAD-Client": "mcp-1"})
+
+    assert 429 not in statuses[:2] and statuses[2] == 429
+    assert other.status_code != 429
+    assert len(sessions.registry.info()) == 3
+
+
+def test_lifespan_attaches_gateway_and_stops_session_sweeper(freecad):
+    from tools import gateway
+
+    async def sweepers():
+        return [task for task in asyncio.all_tasks() if task.get_coro().__name__ == "sweep_idle_sessions"]
+
+    with TestClient(main.app) as test_client:
+        assert gateway.is_local()
+        running = test_client.portal.call(sweepers)
+        assert len(running) == 1
+
+    assert not gateway.is_local()
+    assert running[0].cancelled()
+
+
+# ============ MCP инструменты (гейтвей в том же процессе) ============
+
+def call_tools(*calls):
+    """Вызвать инструменты MCP через клиент FastMCP в памяти; вернуть CallToolResult."""
+    from fastmcp import Client
+    from tools import gateway
+
+    async def scenario():
+        gateway.attach(main.app, asyncio.get_running_loop())
+        try:
+            async with Client(main.mcp) as mcp_client:
+                return [await mcp_client.call_tool_mcp(name, arguments) for name, arguments in calls]
+        finally:
+            gateway.detach()
+    return asyncio.run(scenario())
+
+
+@pytest.fixture
+def freecad_unavailable(monkeypatch):
+    """FreeCAD не подключается: инструменты получают от гейтвея 500."""
+    from common_logic import core
+
+    monkeypatch.setattr(core, "freecad", None)
+    monkeypatch.setattr(core, "connect", lambda: {"success": False, "error": "FreeCAD не найден"})
+    tool_cache.cache.invalidate()
+
+
+def _counter(metric, *labels):
+    return metric.labels(*labels).value
+
+
+def test_failed_tool_calls_are_counted_as_errors(freecad_unavailable):
+    errors = _counter(metrics.MCP_TOOL_CALLS, "get_documents", "error")
+    successes = _counter(metrics.MCP_TOOL_CALLS, "get_documents", "success")
+
+    results = call_tools(*[("get_documents", {})] * 3)
+
+    assert all("error" in result.structuredContent for result in results)
+    assert _counter(metrics.MCP_TOOL_CALLS, "get_documents", "error") == errors + 3
+    assert _counter(metrics.MCP_TOOL_CALLS, "get_documents", "success") == successes
+
+
+def test_rolled_back_plan_is_counted_as_tool_error(freecad):
+    errors = _counter(metrics.MCP_TOOL_CALLS, "execute_plan", "error")
+    successes = _counter(metrics.MCP_TOOL_CALLS, "execute_plan", "success")
+
+    [result] = call_tools(("execute_plan", {"steps": [
+        {"op": "open_document", "file_path": "model.FCStd"},
+        {"op": "delete_object", "name": "missing"},
+    ]}))
+
+    assert result.structuredContent["status"] == "rolled_back"
+    assert result.structuredContent["failed_step"] == 1
+    assert "error" in result.structuredContent
+    assert _counter(metrics.MCP_TOOL_CALLS, "execute_plan", "error") == errors + 1
+    assert _counter(metrics.MCP_TOOL_CALLS, "execute_plan", "success") == successes
+
+
+def _cache_counts(tool):
+    return dict(tool_cache.cache.stats()["tools"].get(tool, {"hit": 0, "miss": 0}))
+
+
+def test_error_tool_results_are_never_cached(freecad_unavailable):
+    before = _cache_counts("get_documents")
+
+    results = call_tools(*[("get_documents", {})] * 3)
+
+    after = _cache_counts("get_documents")
+    assert all("error" in result.structuredContent for result in results)
+    assert after["hit"] == before["hit"]
+    assert after["miss"] == before["miss"] + 3
+    assert tool_cache.cache.stats()["entries"] == 0
+
+
+def test_successful_read_only_results_are_cached(freecad):
+    tool_cache.cache.invalidate()
+    before = _cache_counts("get_documents")
+
+    results = call_tools(*[("get_documents", {})] * 2)
+
+    after = _cache_counts("get_documents")
+    assert not results[0].isError and "error" not in results[0].structuredContent
+    assert results[1].structuredContent == results[0].structuredContent
+    assert after["hit"] == before["hit"] + 1
+
+
+def test_tool_results_carry_typed_structured_content(freecad):
+    opened, created, documents = call_tools(
+        ("open_document", {"file_path": "model.FCStd"}),
+        ("create_shape", {"shape_type": "cube", "size": 5}),
+        ("get_documents", {})
+    )
+
+    assert opened.structuredContent == {
+        "action": "created", "message": opened.structuredContent["message"],
+        "document": "model", "file_path": "model.FCStd"
+    }
+    assert set(created.structuredContent) == {"object_name", "shape_type", "document", "params", "message"}
+    assert created.structuredContent["shape_type"] == "cube"
+    assert created.structuredContent["params"]["size"] == 5.0
+    assert documents.structuredContent["documents"] == [
+        {"name": "model", "object_count": 1}
+    ]
+
+
+def test_every_gateway_backed_tool_returns_trace_in_meta(freecad, monkeypatch):
+    import tracing
+    monkeypatch.setattr(tracing, "INCLUDE_TIMINGS_IN_META", True)
+
+    opened, documents = call_tools(
+        ("open_document", {"file_path": "model.FCStd"}),
+        ("get_documents", {})
+    )
+
+    timings = opened.meta["trace"]["timings_ms"]
+    assert {"mcp.open_document", "http.open-document", "gateway", "freecad.open_document"} <= set(timings)
+    assert opened.meta["status"] == "success"
+    assert {"mcp.get_documents", "http.documents", "gateway"} <= set(documents.meta["trace"]["timings_ms"])
+    assert opened.meta["trace"]["trace_id"] != documents.meta["trace"]["trace_id"]
+
+
+def test_standalone_mcp_server_counts_tool_calls_and_serves_metrics(monkeypatch):
+    import importlib
+    import sys
+
+    from middleware.custom_middleware import MCPMetricsMiddleware
+
+    # server.py регистрирует middleware и маршруты на общем экземпляре mcp
+    monkeypatch.setattr(main.mcp, "middleware", [])
+    monkeypatch.setattr(main.mcp, "_additional_http_routes", [])
+    monkeypatch.delitem(sys.modules, "server", raising=False)
+    importlib.import_module("server")
+
+    response = TestClient(main.mcp.http_app()).get("/metrics")
+
+    assert isinstance(main.mcp.middleware[0], MCPMetricsMiddleware)
+    assert response.status_code == 200
+    assert "cad_mcp_gateway_requests_total" in response.text
+
+
+# ============ Подписки на ресурсы ============
+
+def test_resource_subscription_is_advertised_and_notified(freecad):
+    from fastmcp import Client
+    from fastmcp.client.messages import MessageHandler
+    from tools import gateway
+
+    updated = asyncio.Queue()
+
+    class Handler(MessageHandler):
+        async def on_resource_updated(self, message):
+            updated.put_nowait(str(message.params.uri))
+
+    async def scenario():
+        gateway.attach(main.app, asyncio.get_running_loop())
+        try:
+            async with Client(main.mcp, message_handler=Handler()) as mcp_client:
+                capabilities = mcp_client.initialize_result.capabilities
+                await mcp_client.session.subscribe_resource("cad://documents")
+                # Наблюдатель сначала запоминает текущую ревизию
+                await asyncio.sleep(0.2)
+                await mcp_client.call_tool_mcp("open_document", {"file_path": "model.FCStd"})
+                uri = await asyncio.wait_for(updated.get(), timeout=5)
+                await mcp_client.session.unsubscribe_resource("cad://documents")
+                return capabilities, uri
+        finally:
+            gateway.detach()
+
+    capabilities, uri = asyncio.run(scenario())
+
+    assert capabilities.resources.subscribe is True
+    assert uri == "cad://documents"
+
+
+# ============ WebSocket сессия ============
+
+def _ws_call(websocket, request_id, op, **params):
+    websocket.send_json({"id": request_id, "op": op, "params": params})
+    return websocket.receive_json()
+
+
+def test_websocket_operations_stay_in_their_own_document(client, freecad):
+    with client.websocket_connect("/api/cad/ws") as first, client.websocket_connect("/api/cad/ws") as second:
+        assert _ws_call(first, "1", "open_document", file_path="a.FCStd")["ok"]
+        assert _ws_call(second, "1", "open_document", file_path="b.FCStd")["ok"]
+        # Второе соединение открыло свой документ - первое продолжает работать в своем
+        created = _ws_call(first, "2", "create_shape", shape_type="cube", size=5)
+        listed = _ws_call(second, "2", "list_objects")
+
+        assert created["ok"] and created["data"]["document"] == "a"
+        assert listed["data"]["document"] == "b" and listed["data"]["objects"] == []
+        assert len(freecad.listDocuments()["a"].Objects) == 1
+        assert core.current_doc is None
+        assert len(sessions.registry.info()) == 2
+
+    # Отключение завершает собственные сессии соединений: документы сохранены и закрыты
+    for _ in range(100):
+        if not freecad.listDocuments():
+            break
+        time.sleep(0.01)
+    assert sessions.registry.info() == []
+    assert freecad.listDocuments() == {}
+
+
+# ============ Роутер воркеров ============
+
+class _Body(httpx.AsyncByteStream):
+    """Тело ответа потоком, как у настоящего транспорта (роутер проксирует его через aiter_raw)."""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+
+
+def _json_response(status, payload):
+    return httpx.Response(
+        status, headers={"content-type": "application/json"},
+        stream=_Body(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+    )
+
+
+class FakeWorker:
+    """Воркер гейтвея за роутером: текущий документ по сессиям и журнал запросов."""
+
+    def __init__(self):
+        self.current = {}
+        self.calls = []
+        self.failing = set()
+        self.down = False
+
+    def handle(self, request):
+        if self.down:
+            raise httpx.ConnectError("connection refused", request=request)
+        path, session = request.url.path, request.headers.get("x-cad-session")
+        file_path = request.url.params.get("file_path")
+        self.calls.append((path, session, file_path))
+        if path == "/api/cad/open-document":
+            if file_path in self.failing:
+                return _json_response(500, {"detail": "Ошибка открытия"})
+            self.current[session] = file_path
+        elif session not in self.current:
+            return _json_response(404, {"detail": "Нет открытого документа"})
+        elif path == "/api/cad/close-document":
+            del self.current[session]
+            return _json_response(200, {"data": {"action": "closed"}})
+        return _json_response(200, {"data": {"document": self.current.get(session)}})
+
+    def service_calls(self, path):
+        return [call for call in self.calls if call[0] == path]
+
+
+@pytest.fixture
+def routed():
+    """Роутер с двумя адресами воркеров; в кольце сначала только w1."""
+    import router
+
+    workers = {"w1": FakeWorker(), "w2": FakeWorker()}
+    app = router.create_app(["http://w1"])
+    state = app.state.router
+    state.client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: workers[request.url.host].handle(request))
+    )
+    with TestClient(app) as test_client:
+        yield test_client, state, workers
+
+
+def _moving_file(router_module, name_prefix):
+    """Файл, который после добавления w2 переезжает на w2."""
+    ring = router_module.HashRing()
+    ring.add("http://w1")
+    ring.add("http://w2")
+    return next(
+        f"{name_prefix}{i}.FCStd" for i in range(1000)
+        if ring.get(os.path.normpath(f"{name_prefix}{i}.FCStd")) == "http://w2"
+    )
+
+
+def test_router_keeps_documents_of_different_sessions_apart(routed):
+    client, state, workers = routed
+    worker = workers["w1"]
+    a = {"X-CAD-Session": "session-a"}
+    b = {"X-CAD-Session": "session-b"}
+
+    client.get("/api/cad/open-document", params={"file_path": "a.FCStd"}, headers=a)
+    client.get("/api/cad/open-document", params={"file_path": "b.FCStd"}, headers=b)
+    response = client.get("/api/cad/create-shape", headers=a)
+
+    assert response.json()["data"]["document"] == "a.FCStd"
+    # Сессии не переключают документы друг друга
+    assert worker.service_calls("/api/cad/save-document") == []
+    assert worker.current == {"session-a": "a.FCStd", "session-b": "b.FCStd"}
+
+
+def test_router_switches_documents_within_the_session_that_opened_them(routed):
+    client, state, workers = routed
+    worker = workers["w1"]
+    a = {"X-CAD-Session": "session-a"}
+
+    client.get("/api/cad/open-document", params={"file_path": "a.FCStd"}, headers=a)
+    client.get("/api/cad/open-document", params={"file_path": "b.FCStd"}, headers=a)
+    # Документ a задан явно: роутер сохраняет b и снова открывает a в той же сессии
+    response = client.get("/api/cad/create-shape", headers={**a, "X-CAD-Document": "a.FCStd"})
+
+    assert response.json()["data"]["document"] == "a.FCStd"
+    assert ("/api/cad/save-document", "session-a", "b.FCStd") in worker.calls
+    assert worker.calls[-2] == ("/api/cad/open-document", "session-a", "a.FCStd")
+
+
+def test_router_rebalance_moves_session_documents_with_session_header(routed, monkeypatch):
+    import router
+
+    monkeypatch.setenv("CAD_ADMIN_TOKEN", "s3cret")
+    client, state, workers = routed
+    moving = _moving_file(router, "doc")
+    s = {"X-CAD-Session": "session-a"}
+    client.get("/api/cad/open-document", params={"file_path": moving}, headers=s)
+
+    joined = client.post("/router/workers", params={"url": "http://w2"}, headers={"X-Admin-Token": "s3cret"}).json()
+    response = client.get("/api/cad/create-shape", headers=s)
+
+    assert joined["moved"] == [{"document": moving, "from": "http://w1", "to": "http://w2"}]
+    assert ("/api/cad/save-document", "session-a", moving) in workers["w1"].calls
+    assert ("/api/cad/close-document", "session-a", None) in workers["w1"].calls
+    assert workers["w1"].current == {}
+    assert response.headers["X-CAD-Worker"] == "http://w2"
+    assert response.json()["data"]["document"] == moving
+
+
+def test_router_worker_management_requires_admin_token(routed, monkeypatch):
+    client, state, workers = routed
+
+    monkeypatch.delenv("CAD_ADMIN_TOKEN", raising=False)
+    disabled = client.post("/router/workers", params={"url": "http://evil"})
+    monkeypatch.setenv("CAD_ADMIN_TOKEN", "s3cret")
+    joined = client.post("/router/workers", params={"url": "http://evil"}, headers={"X-Admin-Token": "wrong"})
+    drained = client.delete("/router/workers", params={"url": "http://w1"})
+
+    assert disabled.status_code == 404
+    assert joined.status_code == 403
+    assert drained.status_code == 403
+    assert [worker["url"] for worker in client.get("/router/status").json()["workers"]] == ["http://w1"]
+
+
+def test_hash_ring_placement_is_stable_and_moves_few_keys():
+    import router
+
+    ring = router.HashRing()
+    for node in ("a", "b", "c"):
+        ring.add(node)
+    keys = [f"doc{i}.FCStd" for i in range(3000)]
+    before = {key: ring.get(key) for key in keys}
+
+    ring.add("d")
+    after_add = {key: ring.get(key) for key in keys}
+    ring.remove("d")
+    after_remove = {key: ring.get(key) for key in keys}
+
+    assert set(before.values()) == {"a", "b", "c"}
+    moved = [key for key in keys if after_add[key] != before[key]]
+    # Переезжают только ключи нового узла, примерно 1/4 от всех
+    assert all(after_add[key] == "d" for key in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+    assert after_remove == before
+    assert router.HashRing().get("doc") is None
+
+
+def test_router_fails_request_when_worker_cannot_open_document(routed):
+    client, state, workers = routed
+    worker = workers["w1"]
+    client.get("/api/cad/open-document", params={"file_path": "a.FCStd"})
+    client.get("/api/cad/open-document", params={"file_path": "b.FCStd"})
+    worker.failing.add("a.FCStd")
+
+    failed = client.get("/api/cad/create-shape", headers={"X-CAD-Document": "a.FCStd"})
+
+    assert failed.status_code == 502
+    assert "/api/cad/create-shape" not in [call[0] for call in worker.calls]
+    assert state.workers["http://w1"].in_flight == 0
+    worker.failing.clear()
+    assert client.get("/api/cad/create-shape", headers={"X-CAD-Document": "a.FCStd"}).json() == {
+        "data": {"document": "a.FCStd"}
+    }
+
+
+def test_router_returns_503_when_worker_is_unreachable(routed):
+    client, state, workers = routed
+    client.get("/api/cad/open-document", params={"file_path": "a.FCStd"})
+    client.get("/api/cad/open-document", params={"file_path": "b.FCStd"})
+    workers["w1"].down = True
+
+    response = client.get("/api/cad/create-shape", headers={"X-CAD-Document": "a.FCStd"})
+
+    assert response.status_code == 503
+    assert state.workers["http://w1"].in_flight == 0
+    assert client.get("/api/cad/documents").status_code == 503
+
+
+def test_router_header_only_document_does_not_reuse_previous_document(routed):
+    client, state, workers = routed
+    worker = workers["w1"]
+    client.get("/api/cad/open-document", params={"file_path": "a.FCStd"})
+
+    response = client.get("/api/cad/create-shape", headers={"X-CAD-Document": "draft"})
+
+    # Документ a сохранен и закрыт; draft еще не открыт клиентом - ошибка воркера, а не документ a
+    assert response.status_code == 404
+    assert ("/api/cad/save-document", None, "a.FCStd") in worker.calls
+    assert ("/api/cad/close-document", None, None) in worker.calls
+    opened = client.get("/api/cad/open-document", params={"file_path": "draft.FCStd"}, headers={"X-CAD-Document": "draft"})
+    assert opened.status_code == 200
+    assert client.get("/api/cad/create-shape", headers={"X-CAD-Document": "draft"}).json()["data"]["document"] == "draft.FCStd"
+
+
+# ============ Idempotency-Key ============
+
+def _create_with_key(client, key, size=10, **headers):
+    # Хранилище ключей живет в приложении между тестами - ключи уникальны на тест
+    key = f"{key}-{os.environ.get('PYTEST_CURRENT_TEST')}"
+    return client.get(
+        "/api/cad/create-shape", params={"shape_type": "cube", "size": size},
+        headers={"Idempotency-Key": key, **headers}
+    )
+
+
+def test_idempotency_key_replays_response_without_repeating_operation(client, freecad):
+    client.get("/api/cad/open-document", params={"file_path": "model.FCStd"})
+
+    first = _create_with_key(client, "k1")
+    second = _create_with_key(client, "k1")
+
+    assert second.headers.get("idempotent-replayed") == "true"
+    assert second.json() == first.json()
+    assert len(freecad.listDocuments()["model"].Objects) == 1
+
+
+def test_idempotency_key_with_different_parameters_is_rejected(client, freecad):
+    client.get("/api/cad/open-document", params={"file_path": "model.FCStd"})
+    _create_with_key(client, "k1", size=10)
+
+    conflict = _create_with_key(client, "k1", size=20)
+
+    assert conflict.status_code == 422
+    assert len(freecad.listDocuments()["model"].Objects) == 1
+
+
+def test_idempotency_keys_are_scoped_per_session(client, freecad):
+    for session in ("session-a", "session-b"):
+        client.get("/api/cad/open-document", params={"file_path": "model.FCStd"}, headers={"X-CAD-Session": session})
+
+    first = _create_with_key(client, "same", **{"X-CAD-Session": "session-a"})
+    other = _create_with_key(client, "same", **{"X-CAD-Session": "session-b"})
+
+    # Тот же ключ другой сессии - другая операция, а не повтор чужого ответа
+    assert "idempotent-replayed" not in other.headers
+    assert other.json()["data"]["object_name"] != first.json()["data"]["object_name"]
+    assert len(freecad.listDocuments()["model"].Objects) == 2
+
+
+def test_concurrent_duplicate_waits_for_first_request(freecad, monkeypatch):
+    from common_logic import core
+
+    make_box = core.part.makeBox
+
+    def slow_box(*args):
+        time.sleep(0.2)
+        return make_box(*args)
+
+    monkeypatch.setattr(core.part, "makeBox", slow_box)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as http:
+            await http.get("/api/cad/open-document", params={"file_path": "model.FCStd"})
+            key = f"concurrent-{time.time()}"
+            request = lambda: http.get(
+                "/api/cad/create-shape", params={"shape_type": "cube", "size": 10},
+                headers={"Idempotency-Key": key}
+            )
+            return await asyncio.gather(request(), request())
+
+    first, second = asyncio.run(scenario())
+
+    assert first.json() == second.json()
+    assert [first.headers.get("idempotent-replayed"), second.headers.get("idempotent-replayed")].count("true") == 1
+    assert len(freecad.listDocuments()["model"].Objects) == 1
+
+
+# ============ Контроль допуска ============
+
+def _admission_client(limit, host="203.0.113.7", app=None):
+    """Клиент к приложению за AdmissionControlMiddleware (один класс "mutate" на все пути)."""
+    from middleware.custom_middleware import AdmissionControlMiddleware
+
+    async def ok(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = AdmissionControlMiddleware(app or ok, classify=lambda method, path: "mutate", limits={"mutate": limit})
+    transport = httpx.ASGITransport(app=middleware, client=(host, 1234))
+    return httpx.AsyncClient(transport=transport, base_url="http://gateway")
+
+
+@pytest.mark.parametrize("value", ["0/1/1", "-1/1/1", "1/0.5/1", "1/1/0", "1/1", "много/1/1"])
+def test_admission_limit_rejects_invalid_values(value):
+    from middleware.custom_middleware import Limit
+
+    with pytest.raises(ValueError):
+        Limit.parse(value)
+
+
+def test_admission_rejects_over_rate_with_retry_after():
+    from middleware.custom_middleware import Limit
+
+    async def scenario():
+        async with _admission_client(Limit(rate=0.5, burst=2, concurrency=4)) as http:
+            return [await http.get("/api/cad/create-shape") for _ in range(3)]
+
+    responses = asyncio.run(scenario())
+
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[2].headers["retry-after"] == "2"
+    assert responses[2].json()["detail"] == "Превышен лимит запросов"
+
+
+def test_admission_ignores_unverified_identity_headers():
+    from middleware.custom_middleware import Limit
+
+    async def scenario():
+        async with _admission_client(Limit(rate=0.5, burst=1, concurrency=4)) as http:
+            first = await http.get("/api/cad/create-shape")
+            # Новый "клиент" в заголовках с того же недоверенного адреса - тот же лимит
+            spoofed = [
+                await http.get("/api/cad/create-shape", headers={"X-CAD-Client": f"client-{i}"})
+                for i in range(3)
+            ] + [await http.get("/api/cad/create-shape", headers={"X-API-Key": "guess"})]
+            return first, spoofed
+
+    first, spoofed = asyncio.run(scenario())
+
+    assert first.status_code == 200
+    assert [r.status_code for r in spoofed] == [429] * 4
+
+
+def test_admission_trusts_configured_api_keys_and_local_clients(monkeypatch):
+    from middleware import custom_middleware
+    from middleware.custom_middleware import Limit
+
+    monkeypatch.setattr(custom_middleware, "API_KEY_DIGESTS", frozenset([custom_middleware._key_digest(b"secret")]))
+
+    async def scenario():
+        limit = Limit(rate=0.5, burst=1, concurrency=4)
+        async with _admission_client(limit) as remote, _admission_client(limit, host="127.0.0.1") as local:
+            keyed = [await remote.get("/api/cad/create-shape", headers={"X-API-Key": "secret"}) for _ in range(2)]
+            anonymous = await remote.get("/api/cad/create-shape")
+            sessions = [
+                await local.get("/api/cad/create-shape", headers={"X-CAD-Client": f"session-{i}"})
+                for i in range(3)
+            ]
+            return keyed, anonymous, sessions
+
+    keyed, anonymous, sessions = asyncio.run(scenario())
+
+    assert [r.status_code for r in keyed] == [200, 429]
+    assert anonymous.status_code == 200
+    assert [r.status_code for r in sessions] == [200] * 3
+
+
+def test_admission_limits_concurrent_requests():
+    from middleware.custom_middleware import Limit
+
+    release = asyncio.Event()
+
+    async def slow(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def scenario():
+        async with _admission_client(Limit(rate=100, burst=100, concurrency=1), app=slow) as http:
+            first = asyncio.create_task(http.get("/api/cad/create-shape"))
+            await asyncio.sleep(0.05)
+            second = await http.get("/api/cad/create-shape")
+            release.set()
+            return await first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert second.headers["retry-after"] == "1"
+
+
+# ============ /api/admin/profile ============
+
+@pytest.fixture
+def admin_client(freecad, request):
+    """Клиент со своим адресом: лимиты admission control живут в приложении между тестами."""
+    host = f"198.51.100.{len(request.node.name) % 250}"
+    with TestClient(main.app, client=(host, 50000)) as test_client:
+        yield test_client
+
+
+def test_profile_endpoint_is_disabled_without_admin_token(admin_client, monkeypatch):
+    monkeypatch.delenv("CAD_ADMIN_TOKEN", raising=False)
+
+    response = admin_client.get("/api/admin/profile", params={"seconds": 0.01})
+
+    assert response.status_code == 404
+
+
+def test_profile_endpoint_requires_admin_token_and_is_rate_limited(admin_client, monkeypatch):
+    monkeypatch.setenv("CAD_ADMIN_TOKEN", "s3cret")
+    params = {"seconds": 0.02, "interval_ms": 5}
+
+    forbidden = admin_client.get("/api/admin/profile", params=params, headers={"X-Admin-Token": "wrong"})
+    allowed = admin_client.get("/api/admin/profile", params=params, headers={"X-Admin-Token": "s3cret"})
+    limited = admin_client.get("/api/admin/profile", params=params, headers={"X-Admin-Token": "s3cret"})
+
+    assert forbidden.status_code == 403
+    assert allowed.status_code == 200
+    # Класс admin: всплеск 2 запроса, дальше - 429
+    assert main.classify_endpoint("GET", "/api/admin/profile") == "admin"
+    assert limited.status_code == 429
+    assert "retry-after" in limited.headers
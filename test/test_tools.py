@@ -1 +1,628 @@
-# здесь должны быть тесты
\ No newline at end of file
+"""Тесты FreeCADCore и вспомогательных модулей сервера (FreeCAD - тестовый двойник)."""
+
+import asyncio
+import json
+
+import pytest
+
+from common_logic import core
+from tools import models
+
+
+def _open(path="model.FCStd"):
+    return asyncio.run(core.open_document(path))
+
+
+def _cube(size=10.0, x=0.0):
+    return asyncio.run(core.create_simple_shape("cube", size, x))
+
+
+# ============ update_object / delete_object ============
+
+def test_update_object_recomputes_object_and_dependents(freecad):
+    _open()
+    base = _cube()
+    other = _cube(x=50.0)
+    doc = core.current_doc
+    obj = doc.getObject(base.object_name)
+    dependent = doc.addObject("Part::Feature", "Fusion")
+    obj.InListRecursive = [dependent]
+    doc.recomputed.clear()
+
+    result = asyncio.run(core.update_object(base.object_name, size=20.0))
+
+    assert result.action == "updated"
+    assert result.recomputed == 2
+    assert result.changes == {"size": 20.0}
+    assert doc.recomputed == [[base.object_name, "Fusion"]]
+    assert other.object_name not in doc.recomputed[0]
+    assert core._get_shape_params(obj) == ("cube", {"size": 20.0, "x": 0.0, "y": 0.0, "z": 0.0})
+
+
+def test_update_object_rejects_unknown_and_foreign_objects(freecad):
+    _open()
+    core.current_doc.addObject("Part::Feature", "Imported")
+
+    missing = asyncio.run(core.update_object("Nope", size=5.0))
+    foreign = asyncio.run(core.update_object("Imported", size=5.0))
+
+    assert models.is_error(missing) and missing.code == "not_found"
+    assert models.is_error(foreign) and foreign.code == "not_editable"
+
+
+def test_update_object_validates_merged_params(freecad):
+    _open()
+    cube = _cube()
+
+    result = asyncio.run(core.update_object(cube.object_name, size=-1.0))
+
+    assert models.is_error(result) and result.code == "invalid_params"
+    obj = core.current_doc.getObject(cube.object_name)
+    assert core._get_shape_params(obj)[1]["size"] == 10.0
+
+
+def test_delete_object_recomputes_only_dependents(freecad):
+    _open()
+    base = _cube()
+    _cube(x=50.0)
+    doc = core.current_doc
+    dependent = doc.addObject("Part::Feature", "Fusion")
+    doc.getObject(base.object_name).InListRecursive = [dependent]
+    doc.recomputed.clear()
+
+    result = asyncio.run(core.delete_object(base.object_name))
+
+    assert result.action == "deleted"
+    assert result.recomputed == 1
+    assert doc.getObject(base.object_name) is None
+    assert doc.recomputed == [["Fusion"]]
+
+
+def test_delete_object_without_dependents_skips_recompute(freecad):
+    _open()
+    cube = _cube()
+    doc = core.current_doc
+    doc.recomputed.clear()
+
+    result = asyncio.run(core.delete_object(cube.object_name))
+
+    assert result.recomputed == 0
+    assert doc.recomputed == []
+
+
+# ============ bulk_loader ============
+
+def test_bulk_load_settles_in_flight_batch_when_reader_fails(freecad):
+    import bulk_loader
+
+    _open()
+
+    async def lines():
+        yield b'{"shape_type": "cube", "size": 1}'
+        yield b'{"shape_type": "cube", "size": 2}'
+        raise ValueError("Строка длиннее 65536 байт")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await bulk_loader.bulk_load(lines(), batch_size=1)
+        # Ни одной незавершенной пачки не осталось
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_bulk_load_reports_validation_errors_per_line(freecad):
+    import bulk_loader
+
+    _open()
+
+    async def lines():
+        for line in (b'{"shape_type": "cube", "size": 1}', b'not json', b'{"shape_type": "cube", "size": -1}'):
+            yield line
+
+    summary = asyncio.run(bulk_loader.bulk_load(lines(), batch_size=10))
+
+    assert summary["added"] == 1
+    assert [error["line"] for error in summary["errors"]] == [2, 3]
+
+
+# ============ Типизированные модели ============
+
+def test_models_from_dict_restores_nested_models_and_drops_unknown_keys():
+    plan = models.PlanResult(
+        "rolled_back",
+        [models.PlanStep(0, "create_shape", "error", {"code": "invalid_params", "message": "плохо"})],
+        "План отменен",
+        failed_step=0
+    )
+
+    restored = models.from_dict(models.PlanResult, {**json.loads(models.dumps(plan)), "unknown": 1})
+
+    assert restored == plan
+    assert isinstance(restored.steps[0], models.PlanStep)
+    documents = models.from_dict(models.DocumentList, {"documents": [{"name": "a", "object_count": 2}]})
+    assert documents.documents == [models.DocumentInfo("a", 2)]
+    with pytest.raises(TypeError):
+        models.from_dict(models.DocumentResult, {"message": "нет action"})
+
+
+# ============ execute_plan: откат ============
+
+def _plan(*steps):
+    return asyncio.run(core.execute_plan(list(steps)))
+
+
+def test_plan_rollback_after_open_document_keeps_unsaved_edits(freecad, tmp_path):
+    _open()
+    kept = _cube()
+    saved_on_disk = (tmp_path / "model.FCStd").read_text()
+
+    result = _plan(
+        ("create_shape", {"shape_type": "cube", "size": 5.0}),
+        ("open_document", {"file_path": "other.FCStd"}),
+        ("create_shape", {"shape_type": "sphere", "size": 3.0}),
+        ("save_document", {"file_path": "copy.FCStd"}),
+        ("delete_object", {"name": "missing"}),
+    )
+
+    assert result.status == "rolled_back"
+    assert result.failed_step == 4
+    # Текущим снова стал исходный документ - с несохраненным кубом, без куба плана
+    assert core.current_doc is freecad.listDocuments()["model"]
+    assert [obj.Name for obj in core.current_doc.Objects] == [kept.object_name]
+    assert set(freecad.listDocuments()) == {"model"}
+    # Файлы, созданные планом, удалены; файл исходного документа не тронут
+    assert not (tmp_path / "other.FCStd").exists()
+    assert not (tmp_path / "copy.FCStd").exists()
+    assert (tmp_path / "model.FCStd").read_text() == saved_on_disk
+
+
+def test_plan_rollback_restores_overwritten_file_and_removes_new_save(freecad, tmp_path):
+    _open()
+    _cube()
+    before = (tmp_path / "model.FCStd").read_text()
+
+    result = _plan(
+        ("save_document", {}),
+        ("save_document", {"file_path": "new.FCStd"}),
+        ("update_object", {"name": "missing", "size": 1.0}),
+    )
+
+    assert result.status == "rolled_back"
+    assert (tmp_path / "model.FCStd").read_text() == before
+    assert not (tmp_path / "new.FCStd").exists()
+
+
+def test_plan_rollback_publishes_every_closed_document(freecad, tmp_path):
+    from changes import feed
+
+    _open("existing.FCStd")
+    asyncio.run(core.close_document())
+    _open()
+    revision = feed.revision()
+
+    result = _plan(
+        ("open_document", {"file_path": "existing.FCStd"}),
+        ("delete_object", {"name": "missing"}),
+    )
+
+    events, _ = feed.since(revision)
+    assert result.status == "rolled_back"
+    assert set(freecad.listDocuments()) == {"model"}
+    # Список документов изменился обратно - ревизия и ETag /api/cad/documents тоже
+    assert ("document_closed", "existing") in [(e["event"], e["document"]) for e in events]
+
+
+def test_open_document_publishes_created_document_even_if_save_fails(freecad, monkeypatch):
+    import fakes
+    from changes import feed
+
+    def fail(self, path):
+        raise OSError("диск заполнен")
+
+    monkeypatch.setattr(fakes.Document, "saveAs", fail)
+    revision = feed.revision()
+
+    result = _open("broken.FCStd")
+
+    assert models.is_error(result)
+    assert "broken" in freecad.listDocuments()
+    assert [e["document"] for e in feed.since(revision)[0]] == ["broken"]
+
+
+def test_plan_commit_closes_documents_released_by_its_steps(freecad):
+    _open()
+    _cube()
+
+    result = _plan(
+        ("open_document", {"file_path": "other.FCStd"}),
+        ("create_shape", {"shape_type": "cube", "size": 5.0}),
+    )
+
+    assert result.status == "committed"
+    assert set(freecad.listDocuments()) == {"other"}
+    assert core.current_doc.Name == "other"
+    assert len(core.current_doc.Objects) == 1
+
+
+def test_plan_validates_shape_params_before_building(freecad):
+    _open()
+
+    negative = _plan(("create_shape", {"shape_type": "cube", "size": -5.0}))
+    not_numeric = _plan(("create_shape", {"shape_type": "sphere", "size": "большой"}))
+    bad_star = _plan(
+        ("create_shape", {"shape_type": "cube", "size": 5.0}),
+        ("create_complex_shape", {"shape_type": "star", "num_points": 4, "inner_radius": 1, "outer_radius": 2, "height": 1}),
+    )
+
+    for result in (negative, not_numeric, bad_star):
+        assert result.status == "rolled_back"
+        assert result.steps[result.failed_step].result.code == "invalid_params"
+    assert core.current_doc.Objects == []
+
+
+# ============ Пул соединений к гейтвею ============
+
+def test_gateway_pool_counts_new_unix_socket_connections(tmp_path, monkeypatch):
+    import threading
+
+    import uvicorn
+
+    import metrics
+    from tools import gateway
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    socket_path = str(tmp_path / "gateway.sock")
+    server = uvicorn.Server(uvicorn.Config(app, uds=socket_path, log_level="error", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        for _ in range(100):
+            if server.started:
+                break
+            threading.Event().wait(0.05)
+        # Гейтвей не подключен в процессе: запросы идут через общий пул в Unix socket
+        assert not gateway.is_local()
+        monkeypatch.setattr(gateway, "GATEWAY_UDS", socket_path)
+        new = metrics.MCP_GATEWAY_REQUESTS.labels("new", "HTTP/1.1").value
+        reused = metrics.MCP_GATEWAY_REQUESTS.labels("reused", "HTTP/1.1").value
+
+        async def scenario():
+            await gateway.open_pool()
+            try:
+                async with gateway.client() as client:
+                    return [(await client.get("/api/cad/documents")).status_code for _ in range(2)]
+            finally:
+                await gateway.close_pool()
+
+        assert asyncio.run(scenario()) == [200, 200]
+    finally:
+        server.should_exit = True
+        thread.join(5)
+
+    assert metrics.MCP_GATEWAY_REQUESTS.labels("new", "HTTP/1.1").value == new + 1
+    assert metrics.MCP_GATEWAY_REQUESTS.labels("reused", "HTTP/1.1").value == reused + 1
+
+
+# ============ Кеш ответов ============
+
+def test_cached_read_skips_caching_when_revision_changes_during_build():
+    from types import SimpleNamespace
+
+    from fastapi import Response
+
+    import response_cache
+
+    revision = {"value": 1}
+    builds = []
+    request = SimpleNamespace(headers={})
+
+    async def build():
+        builds.append(revision["value"])
+        # Мутация завершилась, пока ответ строился
+        revision["value"] += 1
+        return Response(content=b"[]", media_type="application/json")
+
+    async def read():
+        return await response_cache.cached_read(request, "test", "test:race", lambda: revision["value"], build)
+
+    racy = asyncio.run(read())
+    assert "etag" not in racy.headers
+    assert response_cache.cache.get("test:race", 1) is None
+
+    async def stable_build():
+        builds.append(revision["value"])
+        return Response(content=b"[1]", media_type="application/json")
+
+    build = stable_build
+    first = asyncio.run(read())
+    second = asyncio.run(read())
+
+    assert builds == [1, 2]
+    assert first.headers["etag"] == second.headers["etag"]
+    assert second.body == b"[1]"
+
+
+# ============ Асинхронные задачи ============
+
+def test_job_manager_rejects_over_queue_limit_and_cancels_queued_jobs():
+    import jobs
+
+    manager = jobs.JobManager(max_concurrent=1, max_queued=1)
+    done = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow(job):
+            job.set_progress(1, 2)
+            await release.wait()
+            return "ok"
+
+        running = manager.submit("slow", slow)
+        await asyncio.sleep(0)
+        queued = manager.submit("slow", slow, on_done=done.append)
+        with pytest.raises(jobs.QueueFullError) as full:
+            manager.submit("slow", slow)
+        await asyncio.sleep(0)
+
+        manager.cancel(queued.job_id)
+        await asyncio.gather(queued.task, return_exceptions=True)
+        release.set()
+        await running.task
+        return running, queued, full.value
+
+    running, queued, full = asyncio.run(scenario())
+
+    assert full.retry_after >= 1
+    assert queued.status == jobs.CANCELLED and done == [queued]
+    assert running.status == jobs.SUCCEEDED and running.result == "ok"
+    assert running.info().progress == {"done": 1, "total": 2}
+    assert manager._queued == 0
+
+
+def test_job_manager_records_handler_errors():
+    import jobs
+
+    manager = jobs.JobManager()
+
+    async def failing(job):
+        raise RuntimeError("нет документа")
+
+    async def scenario():
+        job = manager.submit("export", failing)
+        await job.task
+        return job
+
+    job = asyncio.run(scenario())
+
+    assert job.status == jobs.FAILED
+    assert job.info().message == "Задача завершилась с ошибкой: нет документа"
+
+
+# ============ Single-flight ============
+
+def test_singleflight_runs_concurrent_calls_once_and_survives_waiter_cancellation():
+    from singleflight import SingleFlight
+
+    flights = SingleFlight()
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def build():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        leader = asyncio.create_task(flights.do("test", "key", build))
+        waiter = asyncio.create_task(flights.do("test", "key", build))
+        other = asyncio.create_task(flights.do("test", "other", build))
+        await asyncio.sleep(0)
+        # Лидер отключился - ожидающий все равно получает результат
+        leader.cancel()
+        release.set()
+        results = await asyncio.gather(waiter, other)
+        return results, flights.in_flight()
+
+    results, in_flight = asyncio.run(scenario())
+
+    assert results == ["result", "result"]
+    assert len(calls) == 2
+    assert in_flight == 0
+
+
+def test_singleflight_shares_exceptions_with_waiters():
+    from singleflight import SingleFlight
+
+    flights = SingleFlight()
+
+    async def scenario():
+        async def build():
+            await asyncio.sleep(0)
+            raise ValueError("ошибка построения")
+
+        return await asyncio.gather(
+            flights.do("test", "key", build), flights.do("test", "key", build), return_exceptions=True
+        )
+
+    first, second = asyncio.run(scenario())
+
+    assert isinstance(first, ValueError) and first is second
+
+
+# ============ Сессии ============
+
+def _in_session(session_id, fn, *args):
+    import sessions
+
+    token = sessions.current_session.set(session_id)
+    try:
+        return fn(*args)
+    finally:
+        sessions.current_session.reset(token)
+
+
+def test_sessions_keep_separate_current_documents(freecad):
+    _in_session("alpha", _open, "a.FCStd")
+    _in_session("beta", _open, "b.FCStd")
+    _in_session("alpha", _cube)
+
+    assert _in_session("alpha", lambda: core.current_doc.Name) == "a"
+    assert _in_session("beta", lambda: core.current_doc.Name) == "b"
+    assert len(freecad.listDocuments()["a"].Objects) == 1
+    assert freecad.listDocuments()["b"].Objects == []
+    assert core.current_doc is None
+
+
+def test_session_release_keeps_document_held_by_another_session(freecad):
+    import sessions
+
+    _in_session("alpha", _open, "shared.FCStd")
+    _in_session("beta", _open, "shared.FCStd")
+
+    state = sessions.registry.pop("alpha")
+    kept = asyncio.run(core.release_session("alpha", state.document))
+    state = sessions.registry.pop("beta")
+    closed = asyncio.run(core.release_session("beta", state.document))
+
+    assert kept is None
+    assert closed == "shared"
+    assert freecad.listDocuments() == {}
+
+
+def test_session_registry_expires_idle_sessions_and_limits_count():
+    import sessions
+
+    registry = sessions.SessionRegistry(idle_timeout=60.0, max_sessions=2)
+    registry.touch("idle").last_seen -= 120
+    registry.touch("active")
+
+    with pytest.raises(RuntimeError):
+        registry.touch("third")
+    expired = registry.expired()
+
+    assert [session_id for session_id, _ in expired] == ["idle"]
+    assert [info["session"] for info in registry.info()] == ["active"]
+    registry.touch("third")
+
+
+def test_session_registry_limits_sessions_per_client():
+    import sessions
+
+    registry = sessions.SessionRegistry(max_per_client=2)
+    registry.touch("a1", "ip:203.0.113.7")
+    registry.touch("a2", "ip:203.0.113.7")
+
+    with pytest.raises(sessions.TooManySessionsError):
+        registry.touch("a3", "ip:203.0.113.7")
+    # Существующие сессии клиента и сессии других клиентов работают
+    registry.touch("a1", "ip:203.0.113.7")
+    registry.touch("b1", "client:mcp-session")
+    assert len(registry.info()) == 3
+
+
+# ============ Агент: очередь документа ============
+
+@pytest.fixture
+def agent_module(tmp_path, monkeypatch):
+    pytest.importorskip("langchain_classic")
+    # При импорте агент создает agent.log в текущем каталоге
+    monkeypatch.chdir(tmp_path)
+    from ai_agent import agent
+    return agent
+
+
+def test_document_lane_runs_shared_calls_together_and_exclusive_in_order(agent_module):
+    log = []
+
+    async def call(lane, name, ordering, delay):
+        async with lane.ticket(ordering):
+            log.append(f"{name}:start")
+            await asyncio.sleep(delay)
+            log.append(f"{name}:end")
+
+    async def scenario():
+        lane = agent_module.DocumentLane()
+        # Билеты берутся в порядке вызовов LLM, задачи стартуют в том же порядке
+        await asyncio.gather(
+            call(lane, "open", "exclusive", 0.02),
+            call(lane, "cube", "shared", 0.02),
+            call(lane, "sphere", "shared", 0.01),
+            call(lane, "status", None, 0),
+            call(lane, "save", "exclusive", 0),
+        )
+
+    asyncio.run(scenario())
+
+    assert log.index("status:end") < log.index("open:end")
+    assert log.index("open:end") < log.index("cube:start")
+    # Фигуры строятся одновременно
+    assert log.index("sphere:start") < log.index("cube:end")
+    assert log.index("cube:end") < log.index("save:start")
+    assert log.index("sphere:end") < log.index("save:start")
+
+
+def test_agent_process_closes_gateway_client_and_refuses_running_loop(agent_module, monkeypatch):
+    clients = []
+
+    async def aprocess(self, query, conversation_id=None, use_cache=True):
+        clients.append(agent_module._gateway())
+        return {"response": query}
+
+    monkeypatch.setattr(agent_module.FullCADAgent, "aprocess", aprocess)
+    agent = object.__new__(agent_module.FullCADAgent)
+
+    assert agent.process("куб") == {"response": "куб"}
+    assert clients[0].is_closed and agent_module._http is None
+
+    async def inside_loop():
+        with pytest.raises(RuntimeError):
+            agent.process("куб")
+
+    asyncio.run(inside_loop())
+
+
+# ============ Агент: кеш LLM ============
+
+def test_llm_cache_normalizes_prompts_and_keys_on_tools(tmp_path):
+    pytest.importorskip("diskcache")
+    pytest.importorskip("langchain_core")
+    from langchain_core.outputs import Generation
+    from langchain_core.tools import tool
+
+    from ai_agent import llm_cache
+
+    @tool
+    def create_cube(size: float) -> str:
+        """Создать куб."""
+        return ""
+
+    @tool
+    def create_sphere(size: float) -> str:
+        """Создать сферу."""
+        return ""
+
+    prompt = json.dumps([{"role": "user", "content": "Создай  куб 20мм", "id": "run-1"}], ensure_ascii=False)
+    same = json.dumps([{"role": "user", "content": "Создай куб 20мм ", "id": "run-2"}], ensure_ascii=False)
+    cache = llm_cache.LLMResponseCache("model", [create_cube], directory=str(tmp_path / "a"))
+    other_tools = llm_cache.LLMResponseCache("model", [create_cube, create_sphere], directory=str(tmp_path / "a"))
+
+    cache.update(prompt, "", [Generation(text="куб создан")])
+
+    assert cache.lookup(same, "") == [Generation(text="куб создан")]
+    assert other_tools.lookup(same, "") is None
+    token = llm_cache.use_cache.set(False)
+    try:
+        assert cache.lookup(same, "") is None
+    finally:
+        llm_cache.use_cache.reset(token)
+    assert cache.counts == {"hit": 1, "miss": 0, "bypass": 1}
+    assert cache.stats()["entries"] == 1
+
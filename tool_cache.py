@@ -0,0 +1,98 @@
+"""
+Кеш результатов read-only инструментов MCP.
+
+Ключ - имя инструмента, аргументы и ревизия ленты изменений гейтвея
+(changes.py): пока ревизия не изменилась, повторный вызов в том же ходе
+агента возвращает прежний результат без запроса к гейтвею. Ревизия
+известна, когда гейтвей в том же процессе (tools/gateway.py); для
+удаленного гейтвея запись живет TTL секунд. Вызов любого мутирующего
+инструмента очищает кеш явно.
+
+Кеш живет в event loop MCP сервера, поэтому блокировки не нужны.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+
+from metrics import MCP_TOOL_CACHE_REQUESTS
+
+# Инструменты, результат которых кешируется целиком (MCPToolCacheMiddleware)
+CACHED_TOOLS = ("get_documents",)
+# Инструменты, которые не меняют документы и не сбрасывают кеш
+NEUTRAL_TOOLS = ("get_mcp_status", "get_documents", "get_job", "cancel_job", "export_document")
+
+
+class ToolResultCache:
+    """LRU с TTL; запись действительна, пока не изменилась ревизия и не было сброса."""
+
+    def __init__(self, ttl=5.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._counts = {}
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(tool, arguments):
+        return tool, json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+    def _count(self, tool, result):
+        counts = self._counts.setdefault(tool, {"hit": 0, "miss": 0})
+        counts[result] += 1
+        MCP_TOOL_CACHE_REQUESTS.labels(tool, result).inc()
+
+    async def get_or_call(self, tool, arguments, revision, call, cacheable=lambda result: True):
+        """
+        Вернуть результат из кеша или выполнить call() и запомнить результат.
+
+        Args:
+            tool: Имя инструмента
+            arguments: Аргументы вызова
+            revision: Ревизия гейтвея (None - неизвестна, действует только TTL)
+            call: Корутинная функция, выполняющая инструмент
+            cacheable: Можно ли запомнить результат (ошибки не кешируются)
+        """
+        key = self._key(tool, arguments)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, entry_revision, generation, result = entry
+            if expires > time.monotonic() and entry_revision == revision and generation == self._generation:
+                self._entries.move_to_end(key)
+                self._count(tool, "hit")
+                return result
+            del self._entries[key]
+
+        self._count(tool, "miss")
+        generation = self._generation
+        result = await call()
+        # Если во время вызова был сброс, результат мог устареть
+        if generation == self._generation and cacheable(result):
+            self._entries[key] = (time.monotonic() + self.ttl, revision, generation, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self):
+        """Сбросить все записи (после мутирующего инструмента)."""
+        self._entries.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def stats(self):
+        """Попадания по инструментам - для get_mcp_status."""
+        tools = {}
+        for tool, counts in self._counts.items():
+            total = counts["hit"] + counts["miss"]
+            tools[tool] = {**counts, "hit_rate": round(counts["hit"] / total, 3) if total else 0.0}
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "invalidations": self.invalidations,
+            "tools": tools
+        }
+
+
+cache = ToolResultCache(ttl=float(os.getenv("CAD_TOOL_CACHE_TTL", "5")))
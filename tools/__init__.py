@@ -8,4 +8,13 @@ from .tool_open_document import open_document as tool_open_document
 from .tool_save_document import save_document as tool_save_document
 from .tool_close_document import close_document as tool_close_document
 from .tool_create_complex_shape import create_complex_shape as tool_create_complex_shape
-from .tool_test_shape import create_test_shape as tool_test_shape
\ No newline at end of file
+from .tool_test_shape import create_test_shape as tool_test_shape
+from .tool_update_object import update_object as tool_update_object
+from .tool_delete_object import delete_object as tool_delete_object
+from .tool_get_job import get_job as tool_get_job
+from .tool_cancel_job import cancel_job as tool_cancel_job
+from .tool_create_shapes_batch import create_shapes_batch as tool_create_shapes_batch
+from .tool_create_pattern import create_pattern as tool_create_pattern
+from .tool_export_document import export_document as tool_export_document
+from .tool_execute_plan import execute_plan as tool_execute_plan
+from .resource_documents import documents as resource_documents
\ No newline at end of file
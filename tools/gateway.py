@@ -0,0 +1,337 @@
+"""
+Транспорт запросов инструментов MCP к CAD гейтвею.
+
+Когда MCP сервер запущен внутри main.py (в соседнем потоке), запросы
+инструментов передаются ASGI приложению гейтвея напрямую, в его event
+loop, без TCP соединения и HTTP разбора на loopback. Проходят те же
+middleware (идемпотентность, admission control, метрики), что и у
+сетевых запросов. Если гейтвей удаленный (server.py отдельно или задан
+CAD_GATEWAY_URL), используется HTTP - по TCP или через Unix socket
+CAD_GATEWAY_UDS (supervisor.py) - через общий пул keep-alive соединений,
+который открывается и закрывается вместе с MCP сервером (lifespan в
+mcp_instance.py).
+
+Запросы вызова инструмента несут id сессии MCP (MCPSessionMiddleware) в
+заголовках X-CAD-Session - у каждой сессии свой текущий документ
+(sessions.py) - и X-CAD-Client - лимиты admission control на сессию.
+Внутри span'а инструмента (MCPTracingMiddleware) каждый запрос - дочерний
+span http.<маршрут> с заголовками трассы; стадии гейтвея из его
+Server-Timing попадают в атрибуты span'а.
+
+Инструменты пишут пути относительно гейтвея:
+    async with gateway.client() as client:
+        response = await client.get("/api/cad/documents")
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Optional
+from urllib.parse import unquote
+
+import httpx
+
+import metrics
+import tracing
+
+logger = logging.getLogger("MCPGateway")
+
+GATEWAY_URL = os.getenv("CAD_GATEWAY_URL", "http://localhost:8001").rstrip("/")
+# Unix socket гейтвея (supervisor.py): запросы идут в него, GATEWAY_URL - только для Host
+GATEWAY_UDS = os.getenv("CAD_GATEWAY_UDS")
+
+# Адрес клиента в scope для внутренних запросов (admission control, логи)
+LOCAL_CLIENT = ("127.0.0.1", 0)
+
+_local = None
+
+# id сессии MCP текущего вызова (MCPSessionMiddleware); None - общий документ гейтвея
+current_session = contextvars.ContextVar("mcp_session", default=None)
+
+
+def session_headers() -> dict:
+    """Заголовки сессии MCP для запроса к гейтвею."""
+    session = current_session.get()
+    if session is None:
+        return {}
+    return {"X-CAD-Session": session, "X-CAD-Client": session}
+
+
+class LocalTransport(httpx.AsyncBaseTransport):
+    """
+    httpx транспорт, который выполняет запрос ASGI приложением в event
+    loop гейтвея. Тело ответа передается частями по мере отправки
+    (потоковые ответы и heartbeat работают как по сети).
+    """
+
+    def __init__(self, app, loop: asyncio.AbstractEventLoop):
+        self.app = app
+        self.loop = loop
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        raw_path, _, _ = request.url.raw_path.partition(b"?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "scheme": request.url.scheme,
+            "path": unquote(raw_path.decode("ascii")),
+            "raw_path": raw_path,
+            "query_string": request.url.query,
+            "root_path": "",
+            "headers": [(key.lower(), value) for key, value in request.headers.raw],
+            "client": LOCAL_CLIENT,
+            "server": (request.url.host, request.url.port or 80),
+        }
+        caller = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        # Event создается здесь, но ждут его только в loop гейтвея
+        disconnected = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            caller.call_soon_threadsafe(messages.put_nowait, message)
+
+        async def run_app():
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                caller.call_soon_threadsafe(messages.put_nowait, {"type": "error", "error": e})
+            finally:
+                caller.call_soon_threadsafe(messages.put_nowait, {"type": "done"})
+
+        def disconnect():
+            self.loop.call_soon_threadsafe(disconnected.set)
+
+        asyncio.run_coroutine_threadsafe(run_app(), self.loop)
+        try:
+            message = await messages.get()
+        except BaseException:
+            disconnect()
+            raise
+        if message["type"] == "error":
+            raise message["error"]
+        if message["type"] != "http.response.start":
+            raise RuntimeError("Гейтвей завершил запрос без ответа")
+        return httpx.Response(
+            status_code=message["status"],
+            headers=message.get("headers", []),
+            stream=_LocalStream(messages, disconnect),
+            request=request,
+        )
+
+
+class _LocalStream(httpx.AsyncByteStream):
+    """Тело ответа из очереди сообщений http.response.body."""
+
+    def __init__(self, messages: asyncio.Queue, disconnect):
+        self.messages = messages
+        self.disconnect = disconnect
+        self.finished = False
+
+    async def __aiter__(self):
+        while not self.finished:
+            message = await self.messages.get()
+            if message["type"] == "error":
+                self.finished = True
+                raise message["error"]
+            if message["type"] == "done":
+                self.finished = True
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    yield message["body"]
+                self.finished = not message.get("more_body", False)
+
+    async def aclose(self):
+        # Закрытие потока до конца ответа = отключение клиента
+        self.disconnect()
+
+
+def attach(app, loop: Optional[asyncio.AbstractEventLoop] = None):
+    """Подключить ASGI приложение гейтвея этого процесса (вызывается при старте main.py)."""
+    global _local
+    if os.getenv("CAD_GATEWAY_URL"):
+        logger.info(f"Гейтвей удаленный ({GATEWAY_URL}), инструменты работают через HTTP")
+        return
+    _local = (app, loop or asyncio.get_running_loop())
+    logger.info("Инструменты MCP вызывают гейтвей внутри процесса")
+
+
+def detach():
+    global _local
+    _local = None
+
+
+def is_local() -> bool:
+    return _local is not None
+
+
+def revision() -> Optional[int]:
+    """Ревизия ленты изменений гейтвея, если он в этом процессе, иначе None."""
+    if _local is None:
+        return None
+    from changes import feed
+    return feed.revision()
+
+
+# ============ ОБЩИЙ ПУЛ СОЕДИНЕНИЙ ============
+# Настройки пула для удаленного гейтвея
+POOL_MAX_CONNECTIONS = int(os.getenv("CAD_GATEWAY_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("CAD_GATEWAY_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("CAD_GATEWAY_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 согласуется через ALPN, то есть только для https:// гейтвея (например, за
+# прокси); сам гейтвей (uvicorn) говорит только HTTP/1.1, поэтому по умолчанию выключено
+POOL_HTTP2 = os.getenv("CAD_GATEWAY_HTTP2", "0") == "1"
+
+_pool = None
+_pool_users = 0
+
+
+def _http2_available() -> bool:
+    if not POOL_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("CAD_GATEWAY_HTTP2=1, но пакет h2 не установлен: используется HTTP/1.1")
+        return False
+    return True
+
+
+def _new_pool() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=GATEWAY_URL,
+        transport=httpx.AsyncHTTPTransport(
+            uds=GATEWAY_UDS,
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+            )
+        ),
+        event_hooks={"request": [_on_request, _trace_request], "response": [_on_response, _trace_response]}
+    )
+
+
+async def _on_request(request: httpx.Request):
+    request.extensions["trace"] = _request_trace(request)
+
+
+# События httpcore об установке нового соединения: TCP или Unix socket (CAD_GATEWAY_UDS)
+_CONNECT_EVENTS = ("connection.connect_tcp.complete", "connection.connect_unix_socket.complete")
+
+
+def _request_trace(request: httpx.Request):
+    async def trace(event_name, info):
+        if event_name in _CONNECT_EVENTS:
+            request.extensions["cad_new_connection"] = True
+    return trace
+
+
+async def _on_response(response: httpx.Response):
+    connection = "new" if response.request.extensions.get("cad_new_connection") else "reused"
+    metrics.MCP_GATEWAY_REQUESTS.labels(connection, response.http_version).inc()
+
+
+async def _trace_request(request: httpx.Request):
+    """Span запроса к гейтвею - дочерний к текущему; гейтвей продолжает трассу по заголовкам."""
+    if tracing.current_span() is None:
+        return
+    s = tracing.start_span(f"http.{request.url.path.rsplit('/', 1)[-1]}", method=request.method)
+    request.extensions["cad_span"] = s
+    request.headers[tracing.TRACE_HEADER] = s.trace_id
+    request.headers[tracing.PARENT_HEADER] = s.span_id
+
+
+async def _trace_response(response: httpx.Response):
+    s = response.request.extensions.get("cad_span")
+    if s is not None:
+        s.attributes["server_timing"] = tracing.parse_server_timing(
+            response.headers.get(tracing.SERVER_TIMING_HEADER)
+        )
+        s.finish()
+
+
+_TRACE_HOOKS = {"request": [_trace_request], "response": [_trace_response]}
+
+
+async def open_pool():
+    """Открыть общий клиент (вызывается из lifespan MCP сервера; вложенные вызовы считаются)."""
+    global _pool, _pool_users
+    _pool_users += 1
+    if _pool is None:
+        _pool = _new_pool()
+
+
+async def close_pool():
+    """Закрыть общий клиент, когда его отпустил последний владелец."""
+    global _pool, _pool_users
+    _pool_users = max(0, _pool_users - 1)
+    if _pool_users == 0 and _pool is not None:
+        pool, _pool = _pool, None
+        await pool.aclose()
+
+
+class _ClientView:
+    """Общий клиент с таймаутом вызова по умолчанию; закрывается только пулом."""
+
+    def __init__(self, pool: httpx.AsyncClient, timeout):
+        self._pool = pool
+        self._timeout = timeout
+
+    def _with_timeout(self, kwargs):
+        kwargs.setdefault("timeout", self._timeout)
+        headers = session_headers()
+        if headers:
+            kwargs["headers"] = {**headers, **(kwargs.get("headers") or {})}
+        return kwargs
+
+    async def request(self, method, url, **kwargs):
+        return await self._pool.request(method, url, **self._with_timeout(kwargs))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    def stream(self, method, url, **kwargs):
+        return self._pool.stream(method, url, **self._with_timeout(kwargs))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def client(timeout=30.0):
+    """
+    Клиент к гейтвею: внутри процесса, если гейтвей подключен, иначе по HTTP.
+    Заголовки сессии MCP берутся в момент вызова client() (или запроса для общего клиента).
+    Для удаленного гейтвея, пока MCP сервер запущен, это общий клиент с
+    пулом keep-alive соединений; вне его (скрипты, тесты) - клиент на вызов.
+    """
+    if _local is not None:
+        return httpx.AsyncClient(
+            base_url=GATEWAY_URL, timeout=timeout, headers=session_headers(), transport=LocalTransport(*_local),
+            event_hooks=_TRACE_HOOKS
+        )
+    if _pool is not None:
+        return _ClientView(_pool, timeout)
+    return httpx.AsyncClient(
+        base_url=GATEWAY_URL, timeout=timeout, headers=session_headers(),
+        transport=httpx.AsyncHTTPTransport(uds=GATEWAY_UDS), event_hooks=_TRACE_HOOKS
+    )
@@ -0,0 +1,183 @@
+"""
+Типизированные результаты операций CAD.
+
+Одни и те же модели возвращает FreeCADCore, отдают маршруты FastAPI и
+кладут в ToolResult.structured_content инструменты MCP (ответ гейтвея
+восстанавливается в модель через from_dict), поэтому клиентам не нужно
+разбирать текстовые сообщения. Поле message - человекочитаемый
+текст для чата.
+
+Сериализация - dumps(): orjson, если установлен (нативно понимает
+dataclass), иначе компактный json из стандартной библиотеки. Модели
+намеренно без __slots__: orjson сериализует dataclass через __dict__ в
+несколько раз быстрее.
+"""
+
+import dataclasses
+import json
+import typing
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+
+@dataclass
+class ErrorResult:
+    """Ошибка операции: машинный код и текст для пользователя."""
+    code: str
+    message: str
+
+
+@dataclass
+class DocumentInfo:
+    """Открытый документ FreeCAD."""
+    name: str
+    object_count: int
+
+
+@dataclass
+class DocumentList:
+    """Список открытых документов."""
+    documents: List[DocumentInfo]
+    message: str = ""
+
+
+@dataclass
+class DocumentResult:
+    """Результат открытия, создания, сохранения или закрытия документа."""
+    action: str
+    message: str
+    document: Optional[str] = None
+    file_path: Optional[str] = None
+
+
+@dataclass
+class ShapeResult:
+    """Созданная фигура."""
+    object_name: str
+    shape_type: str
+    document: str
+    params: Dict[str, Any]
+    message: str
+
+
+@dataclass
+class ObjectInfo:
+    """Объект документа и параметры его построения (если создан через CAD API)."""
+    name: str
+    label: str
+    shape_type: Optional[str] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ObjectList:
+    """Объекты текущего документа."""
+    document: str
+    objects: List[ObjectInfo]
+    message: str = ""
+
+
+@dataclass
+class ObjectUpdateResult:
+    """Результат изменения или удаления объекта."""
+    action: str
+    object_name: str
+    recomputed: int
+    message: str
+    changes: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class JobInfo:
+    """Состояние асинхронной задачи."""
+    job_id: str
+    kind: str
+    status: str
+    progress: Dict[str, Any]
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    message: str = ""
+
+
+@dataclass
+class PlanStep:
+    """Результат шага плана: ok, error или skipped (не выполнялся после ошибки)."""
+    index: int
+    op: str
+    status: str
+    result: Any = None
+
+
+@dataclass
+class PlanResult:
+    """Результат плана: committed - все шаги выполнены, rolled_back - изменения отменены."""
+    status: str
+    steps: List[PlanStep]
+    message: str
+    failed_step: Optional[int] = None
+
+
+def to_dict(model):
+    """Модель (или вложенные модели) в обычные dict/list."""
+    if dataclasses.is_dataclass(model) and not isinstance(model, type):
+        return dataclasses.asdict(model)
+    if isinstance(model, dict):
+        return {key: to_dict(value) for key, value in model.items()}
+    if isinstance(model, list):
+        return [to_dict(value) for value in model]
+    return model
+
+
+def from_dict(cls, data):
+    """
+    Модель из словаря (JSON ответа гейтвея): вложенные модели и списки
+    моделей восстанавливаются, неизвестные ключи отбрасываются.
+    
+    Raises:
+        TypeError: если data не словарь или в нем нет обязательных полей модели
+    """
+    if not isinstance(data, dict):
+        raise TypeError(f"{cls.__name__}: ожидался объект, получено {type(data).__name__}")
+    hints = typing.get_type_hints(cls)
+    values = {}
+    for f in dataclasses.fields(cls):
+        if f.name in data:
+            values[f.name] = _from_value(hints[f.name], data[f.name])
+    return cls(**values)
+
+
+def _from_value(hint, value):
+    if dataclasses.is_dataclass(hint) and isinstance(value, dict):
+        return from_dict(hint, value)
+    if typing.get_origin(hint) is list and isinstance(value, list):
+        (item,) = typing.get_args(hint)
+        return [_from_value(item, v) for v in value]
+    if typing.get_origin(hint) is typing.Union:
+        for arg in typing.get_args(hint):
+            if dataclasses.is_dataclass(arg) and isinstance(value, dict):
+                return from_dict(arg, value)
+    return value
+
+
+def _default(obj):
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Тип {type(obj).__name__} не сериализуется в JSON")
+
+
+def dumps(obj) -> bytes:
+    """Компактная сериализация в JSON (UTF-8, без отступов)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def is_error(result) -> bool:
+    return isinstance(result, ErrorResult)
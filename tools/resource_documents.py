@@ -0,0 +1,174 @@
+"""
+Ресурсы MCP: документы, объекты документа и лента изменений.
+
+    cad://revision                   - ревизии (дешевая проверка, изменилось ли что-то)
+    cad://documents                  - список документов
+    cad://documents/{name}/objects   - объекты документа (только текущего)
+    cad://changes/{since}            - события после ревизии since (инкрементальный diff)
+
+Клиент может подписаться (resources/subscribe) на любой из ресурсов: при
+изменении документа сервер присылает notifications/resources/updated, а
+сами изменения клиент забирает из cad://changes/{ревизия}, которую он
+видел последней (она есть в каждом ресурсе).
+
+Изменения отслеживаются long-poll запросами к /api/cad/changes через тот
+же транспорт, что и у инструментов, поэтому работает и при удаленном
+гейтвее. Наблюдатель запущен, пока есть хотя бы одна подписка.
+"""
+
+import asyncio
+import json
+import logging
+
+from mcp_instance import mcp
+from . import gateway
+
+logger = logging.getLogger("MCPResources")
+
+# Сколько гейтвей держит long-poll запрос без событий
+WATCH_WAIT_SECONDS = 25.0
+WATCH_RETRY_SECONDS = 5.0
+
+# URI -> множество сессий MCP, подписанных на него
+_subscriptions = {}
+_watcher = None
+
+
+async def _get(path, **params):
+    async with gateway.client(timeout=WATCH_WAIT_SECONDS + 10) as client:
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+@mcp.resource(
+    "cad://revision",
+    name="revision",
+    description="Глобальная ревизия и ревизии документов. Меняется при каждом изменении.",
+    mime_type="application/json"
+)
+async def revision() -> str:
+    data = await _get("/api/cad/changes")
+    return json.dumps({"revision": data["revision"], "documents": data["documents"]}, ensure_ascii=False)
+
+
+@mcp.resource(
+    "cad://documents",
+    name="documents",
+    description="Открытые документы FreeCAD и число объектов в каждом.",
+    mime_type="application/json"
+)
+async def documents() -> str:
+    changes = await _get("/api/cad/changes")
+    data = await _get("/api/cad/documents")
+    return json.dumps(
+        {"revision": changes["revision"], **data.get("data", {})},
+        ensure_ascii=False
+    )
+
+
+@mcp.resource(
+    "cad://documents/{name}/objects",
+    name="document_objects",
+    description="Объекты документа и параметры их построения (доступен текущий документ).",
+    mime_type="application/json"
+)
+async def document_objects(name: str) -> str:
+    changes = await _get("/api/cad/changes")
+    data = (await _get("/api/cad/objects")).get("data", {})
+    if data.get("document") != name:
+        raise ValueError(f"Документ {name} не текущий; объекты доступны для текущего документа")
+    return json.dumps(
+        {"revision": changes["documents"].get(name, 0), **data},
+        ensure_ascii=False
+    )
+
+
+@mcp.resource(
+    "cad://changes/{since}",
+    name="changes",
+    description="События изменений после ревизии since. resync=true - перечитайте ресурсы целиком.",
+    mime_type="application/json"
+)
+async def changes(since: str) -> str:
+    data = await _get("/api/cad/changes", since=int(since))
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _affected_uris(event):
+    """URI ресурсов, которые меняет событие ленты."""
+    uris = {"cad://revision", "cad://documents"}
+    if event.get("document"):
+        uris.add(f"cad://documents/{event['document']}/objects")
+    return uris
+
+
+async def _notify(uris):
+    for uri in uris:
+        for session in list(_subscriptions.get(uri, ())):
+            try:
+                await session.send_resource_updated(uri)
+            except Exception:
+                # Сессия закрыта - подписки больше нет
+                _subscriptions[uri].discard(session)
+
+
+async def _watch():
+    """Long-poll ленты изменений и рассылка уведомлений подписчикам."""
+    global _watcher
+    # Задача создана в вызове subscribe: наблюдатель общий и не продлевает сессию подписчика
+    gateway.current_session.set(None)
+    since = None
+    try:
+        while any(_subscriptions.values()):
+            try:
+                if since is None:
+                    since = (await _get("/api/cad/changes"))["revision"]
+                data = await _get("/api/cad/changes", since=since, wait=WATCH_WAIT_SECONDS)
+            except Exception as e:
+                logger.warning(f"Лента изменений недоступна: {e}")
+                await asyncio.sleep(WATCH_RETRY_SECONDS)
+                continue
+            if data["resync"]:
+                await _notify(list(_subscriptions))
+            else:
+                uris = set()
+                for event in data["events"]:
+                    uris |= _affected_uris(event)
+                await _notify(uris)
+            since = data["revision"]
+    finally:
+        _watcher = None
+
+
+# Подписки обрабатывает низкоуровневый сервер MCP: в FastMCP для них нет декораторов
+_server = mcp._mcp_server
+
+
+@_server.subscribe_resource()
+async def subscribe(uri) -> None:
+    global _watcher
+    _subscriptions.setdefault(str(uri), set()).add(_server.request_context.session)
+    if _watcher is None:
+        _watcher = asyncio.create_task(_watch())
+
+
+@_server.unsubscribe_resource()
+async def unsubscribe(uri) -> None:
+    _subscriptions.get(str(uri), set()).discard(_server.request_context.session)
+
+
+# mcp 1.22 всегда объявляет resources.subscribe=False, даже с обработчиком
+# подписки, и клиенты не подписываются. Версии fastmcp/mcp закреплены в
+# requirements.txt: при обновлении проверить, не объявляет ли mcp это сам.
+_get_capabilities = _server.get_capabilities
+
+
+def _get_capabilities_with_subscribe(notification_options, experimental_capabilities):
+    capabilities = _get_capabilities(notification_options, experimental_capabilities)
+    if capabilities.resources is not None:
+        capabilities.resources = capabilities.resources.model_copy(update={"subscribe": True})
+    return capabilities
+
+
+_server.get_capabilities = _get_capabilities_with_subscribe
@@ -0,0 +1,69 @@
+"""Инструмент для отмены асинхронной задачи гейтвея."""
+
+import httpx
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway, models
+from .utils import ToolResult
+
+@mcp.tool(
+    name="cancel_job",
+    description="""
+    Отменить асинхронную задачу гейтвея. Задача останавливается между
+    пачками; уже созданные объекты остаются в документе.
+    """
+)
+async def cancel_job(
+    job_id: str = Field(
+        ...,
+        description="ID задачи"
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Отменить задачу.
+    
+    Args:
+        job_id: ID задачи
+        ctx: Контекст для логирования
+    
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    """
+    if ctx:
+        await ctx.info(f"⏹️ Отменяем задачу: {job_id}")
+    
+    try:
+        async with gateway.client(timeout=30.0) as client:
+            response = await client.post(f"/api/jobs/{job_id}/cancel")
+            response.raise_for_status()
+            data = response.json()
+            
+            if ctx:
+                await ctx.info(f"🎯 {data.get('result')}")
+            
+            return ToolResult(
+                content=[TextContent(type="text", text=data.get("result", ""))],
+                structured_content=models.from_dict(models.JobInfo, data["data"]),
+                meta={"status": "success", "job_id": job_id}
+            )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при отмене задачи: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
@@ -3,7 +3,8 @@ from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
-from .utils import ToolResult
+from . import gateway, models
+from .utils import ToolResult, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
 
 @mcp.tool(
     name="close_document",
@@ -14,12 +15,17 @@ from .utils import ToolResult
     """
 )
 async def close_document(
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
     ctx: Context = None
 ) -> ToolResult:
     """
     Закрыть текущий открытый документ FreeCAD.
     
     Args:
+        idempotency_key: Ключ идемпотентности для повторов
         ctx: Контекст для логирования
     
     Returns:
@@ -33,8 +39,11 @@ async def close_document(
         await ctx.info("🚪 Закрываем документ")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get("http://localhost:8001/api/cad/close-document")
+        async with gateway.client(timeout=30.0) as client:
+            response = await client.get(
+                "/api/cad/close-document",
+                headers=idempotency_headers(idempotency_key)
+            )
             response.raise_for_status()
             data = response.json()
             
@@ -43,7 +52,7 @@ async def close_document(
             
             return ToolResult(
                 content=[TextContent(type="text", text=data.get("result", "успешно"))],
-                structured_content=data,
+                structured_content=models.from_dict(models.DocumentResult, data["data"]),
                 meta={"status": "success"}
             )
     except httpx.HTTPStatusError as e:
@@ -5,7 +5,8 @@ from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
-from .utils import ToolResult
+from . import gateway, models
+from .utils import ToolResult, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
 
 async def _create_complex_shape_impl(
     shape_type: str,
@@ -17,7 +18,8 @@ async def _create_complex_shape_impl(
     module: float = None,
     major_radius: float = None,
     minor_radius: float = None,
-    ctx: Context = None
+    ctx: Context = None,
+    idempotency_key: str = None
 ) -> ToolResult:
     """
     Внутренняя реализация создания сложной 3D-фигуры.
@@ -33,6 +35,7 @@ async def _create_complex_shape_impl(
         major_radius: Для torus: большой радиус (>0)
         minor_radius: Для torus: малый радиус (>0, < major_radius)
         ctx: Контекст для логирования
+        idempotency_key: Ключ идемпотентности (передается гейтвею в Idempotency-Key)
     
     Returns:
         ToolResult: Результат выполнения инструмента
@@ -180,10 +183,11 @@ async def _create_complex_shape_impl(
         await ctx.info(f"🔧 Параметры: {params}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with gateway.client(timeout=30.0) as client:
             response = await client.get(
-                "http://localhost:8001/api/cad/create-complex-shape",
-                params=params
+                "/api/cad/create-complex-shape",
+                params=params,
+                headers=idempotency_headers(idempotency_key)
             )
             response.raise_for_status()
             data = response.json()
@@ -199,7 +203,7 @@ async def _create_complex_shape_impl(
             
             return ToolResult(
                 content=[TextContent(type="text", text=result_text)],
-                structured_content=data,
+                structured_content=models.from_dict(models.ShapeResult, data["data"]),
                 meta={
                     "shape_type": shape_type,
                     "status": "success"
@@ -273,10 +277,14 @@ async def create_complex_shape(
         None,
         description="Для torus: малый радиус в мм (>0)"
     ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
     ctx: Context = None
 ) -> ToolResult:
     """Обертка для MCP-инструмента создания сложной фигуры."""
     return await _create_complex_shape_impl(
         shape_type, num_points, inner_radius, outer_radius, height,
-        teeth, module, major_radius, minor_radius, ctx
+        teeth, module, major_radius, minor_radius, ctx, idempotency_key
     )
\ No newline at end of file
@@ -3,7 +3,7 @@
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
-from .utils import ToolResult
+from .utils import ToolResult, IDEMPOTENCY_KEY_DESCRIPTION
 from mcp_instance import mcp
 from .tool_create_shapes import _create_shape_impl
 
@@ -32,6 +32,10 @@ async def create_cylinder(
         0.0,
         description="Z-координата центра основания цилиндра (в мм)"
     ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
     ctx: Context = None
 ) -> ToolResult:
     """
@@ -45,4 +49,4 @@ async def create_cylinder(
     Returns:
         ToolResult: Результат выполнения инструмента
     """
-    return await _create_shape_impl("cylinder", size, x, y, z, ctx)
\ No newline at end of file
+    return await _create_shape_impl("cylinder", size, x, y, z, ctx, idempotency_key)
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""Инструмент для создания массива копий объекта с прогрессом."""
+
+import httpx
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway
+from .utils import ToolResult, run_streaming, idempotency_headers, STREAM_READ_TIMEOUT, IDEMPOTENCY_KEY_DESCRIPTION
+
+@mcp.tool(
+    name="create_pattern",
+    description="""
+    Создать массив копий объекта текущего документа.
+    linear - копии со сдвигом dx, dy, dz (мм) на каждую следующую копию;
+    polar - копии с поворотом вокруг вертикальной оси через точку (cx, cy).
+    count - число экземпляров вместе с исходным объектом.
+    """
+)
+async def create_pattern(
+    source: str = Field(..., description="Имя копируемого объекта"),
+    pattern_type: str = Field("linear", description="Тип массива: linear или polar"),
+    count: int = Field(2, description="Число экземпляров, включая исходный (2-1000)"),
+    dx: float = Field(0.0, description="Шаг по X для linear, мм"),
+    dy: float = Field(0.0, description="Шаг по Y для linear, мм"),
+    dz: float = Field(0.0, description="Шаг по Z для linear, мм"),
+    angle: float = Field(None, description="Шаг поворота для polar в градусах (по умолчанию 360/count)"),
+    cx: float = Field(0.0, description="X оси поворота для polar, мм"),
+    cy: float = Field(0.0, description="Y оси поворота для polar, мм"),
+    idempotency_key: str = Field(None, description=IDEMPOTENCY_KEY_DESCRIPTION),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Создать массив копий объекта.
+    
+    Args:
+        source: Имя копируемого объекта
+        pattern_type: linear или polar
+        count: Число экземпляров, включая исходный
+        dx, dy, dz: Шаг для linear
+        angle: Шаг поворота для polar
+        cx, cy: Ось поворота для polar
+        idempotency_key: Ключ идемпотентности для повторов
+        ctx: Контекст для логирования и прогресса
+    
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    """
+    params = {"source": source, "pattern_type": pattern_type, "count": count,
+              "dx": dx, "dy": dy, "dz": dz, "cx": cx, "cy": cy}
+    if angle is not None:
+        params["angle"] = angle
+    
+    if ctx:
+        await ctx.info(f"🔧 Создаем массив {pattern_type} из {source}: {count} экз.")
+    
+    try:
+        async with gateway.client(timeout=httpx.Timeout(30.0, read=STREAM_READ_TIMEOUT)) as client:
+            final = await run_streaming(
+                client, "GET", "/api/cad/pattern/stream",
+                ctx=ctx, params=params,
+                headers=idempotency_headers(idempotency_key)
+            )
+        
+        if final["event"] == "error":
+            raise RuntimeError(final["message"])
+        
+        summary = final["summary"]
+        message = f"Создан массив {pattern_type} из {source}: копий {summary['added']}, ошибок {summary['failed']}"
+        if ctx:
+            await ctx.info(f"🎯 {message}")
+        
+        return ToolResult(
+            content=[TextContent(type="text", text=message)],
+            structured_content=summary,
+            meta={"status": "success" if not summary["failed"] else "partial"}
+        )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при создании массива: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
@@ -5,7 +5,8 @@ from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
-from .utils import ToolResult, validate_shape_type, validate_size
+from . import gateway, models
+from .utils import ToolResult, validate_shape_type, validate_size, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
 
 async def _create_shape_impl(
     shape_type: str,
@@ -13,7 +14,8 @@ async def _create_shape_impl(
     x: float = 0.0,
     y: float = 0.0,
     z: float = 0.0,
-    ctx: Context = None
+    ctx: Context = None,
+    idempotency_key: str = None
 ) -> ToolResult:
     """
     Внутренняя реализация создания 3D-фигуры (без декоратора для прямого вызова).
@@ -23,6 +25,7 @@ async def _create_shape_impl(
         size: Размер фигуры в миллиметрах (положительное число)
         x, y, z: Координаты центра фигуры в миллиметрах
         ctx: Контекст для логирования
+        idempotency_key: Ключ идемпотентности (передается гейтвею в Idempotency-Key)
     
     Returns:
         ToolResult: Результат выполнения инструмента
@@ -57,7 +60,7 @@ async def _create_shape_impl(
         await ctx.info(f"🔧 Параметры: тип={shape_type}, размер={size}мм, координаты=({x}, {y}, {z})")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with gateway.client(timeout=30.0) as client:
             params = {
                 "shape_type": shape_type.lower(), 
                 "size": size,
@@ -66,8 +69,9 @@ async def _create_shape_impl(
                 "z": z
             }
             response = await client.get(
-                "http://localhost:8001/api/cad/create-shape",
-                params=params
+                "/api/cad/create-shape",
+                params=params,
+                headers=idempotency_headers(idempotency_key)
             )
             response.raise_for_status()
             data = response.json()
@@ -85,7 +89,7 @@ async def _create_shape_impl(
             
             return ToolResult(
                 content=[TextContent(type="text", text=result_text)],
-                structured_content=data,
+                structured_content=models.from_dict(models.ShapeResult, data["data"]),
                 meta={
                     "shape_type": shape_type,
                     "size": size,
@@ -147,7 +151,11 @@ async def create_shape(
         0.0,
         description="Z-координата центра фигуры (в мм)"
     ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
     ctx: Context = None
 ) -> ToolResult:
     """Обертка для MCP-инструмента."""
-    return await _create_shape_impl(shape_type, size, x, y, z, ctx)
\ No newline at end of file
+    return await _create_shape_impl(shape_type, size, x, y, z, ctx, idempotency_key)
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""Инструмент для создания нескольких фигур одним запросом с прогрессом."""
+
+import httpx
+from typing import Any, Dict, List
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway
+from .utils import ToolResult, run_streaming, idempotency_headers, STREAM_READ_TIMEOUT, IDEMPOTENCY_KEY_DESCRIPTION
+
+@mcp.tool(
+    name="create_shapes_batch",
+    description="""
+    Создать несколько фигур в текущем документе одним вызовом.
+    Каждая фигура - объект с shape_type (cube, sphere, cylinder, star, gear, torus)
+    и параметрами: size, x, y, z для простых фигур или параметры сложной фигуры.
+    Прогресс передается по мере построения фигур.
+    """
+)
+async def create_shapes_batch(
+    shapes: List[Dict[str, Any]] = Field(
+        ...,
+        description='Фигуры, например [{"shape_type": "cube", "size": 10, "x": 0}, {"shape_type": "torus", "major_radius": 20, "minor_radius": 5}]'
+    ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Создать пачку фигур.
+    
+    Args:
+        shapes: Спецификации фигур
+        idempotency_key: Ключ идемпотентности для повторов
+        ctx: Контекст для логирования и прогресса
+    
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    """
+    if ctx:
+        await ctx.info(f"🔧 Создаем фигур: {len(shapes)}")
+    
+    try:
+        async with gateway.client(timeout=httpx.Timeout(30.0, read=STREAM_READ_TIMEOUT)) as client:
+            final = await run_streaming(
+                client, "POST", "/api/cad/batch/stream",
+                ctx=ctx, json={"shapes": shapes},
+                headers=idempotency_headers(idempotency_key)
+            )
+        
+        if final["event"] == "error":
+            raise RuntimeError(final["message"])
+        
+        summary = final["summary"]
+        message = f"Создано фигур: {summary['added']}, ошибок: {summary['failed']}"
+        if ctx:
+            await ctx.info(f"🎯 {message}")
+        
+        return ToolResult(
+            content=[TextContent(type="text", text=message)],
+            structured_content=summary,
+            meta={"status": "success" if not summary["failed"] else "partial"}
+        )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при создании фигур: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
@@ -0,0 +1,89 @@
+"""Инструмент для удаления объекта из документа CAD системы."""
+
+import httpx
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway, models
+from .utils import ToolResult, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
+
+@mcp.tool(
+    name="delete_object",
+    description="""
+    Удалить объект из текущего открытого документа FreeCAD.
+    Имя объекта возвращается при создании фигуры.
+    Пересчитываются только объекты, которые зависели от удаленного.
+    """
+)
+async def delete_object(
+    name: str = Field(
+        ...,
+        description="Имя объекта в документе"
+    ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Удалить объект из текущего документа.
+    
+    Args:
+        name: Имя объекта в текущем документе
+        idempotency_key: Ключ идемпотентности для повторов
+        ctx: Контекст для логирования
+    
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    """
+    if not name:
+        error_msg = "Ошибка: имя объекта обязательно"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": "missing_name"},
+            meta={"status": "validation_error"}
+        )
+    
+    if ctx:
+        await ctx.info(f"🗑️ Удаляем объект: {name}")
+    
+    try:
+        async with gateway.client(timeout=30.0) as client:
+            response = await client.get(
+                "/api/cad/delete-object",
+                params={"name": name},
+                headers=idempotency_headers(idempotency_key)
+            )
+            response.raise_for_status()
+            data = response.json()
+            
+            if ctx:
+                await ctx.info(f"🎯 {data.get('result')}")
+            
+            return ToolResult(
+                content=[TextContent(type="text", text=data.get("result", "успешно"))],
+                structured_content=models.from_dict(models.ObjectUpdateResult, data["data"]),
+                meta={"status": "success", "name": name}
+            )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при удалении объекта: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
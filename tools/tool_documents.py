@@ -5,6 +5,7 @@ from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
+from . import gateway, models
 from .utils import ToolResult
 
 @mcp.tool(
@@ -26,29 +27,28 @@ async def get_documents(
     Returns:
         ToolResult: Результат выполнения инструмента
     """
-    import httpx
-    
     if ctx:
         await ctx.info("🔍 Получаем список документов из CAD системы")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get("http://localhost:8001/api/cad/documents")
+        async with gateway.client(timeout=30.0) as client:
+            response = await client.get("/api/cad/documents")
             response.raise_for_status()
             data = response.json()
             
-            documents = data.get('result', [])
+            result = models.from_dict(models.DocumentList, data["data"])
+            documents = result.documents
             formatted_result = f"📋 Найдено документов: {len(documents)}\n\n"
             
             for doc in documents:
-                formatted_result += f"• {doc}\n"
+                formatted_result += f"• {doc.name} (объектов: {doc.object_count})\n"
             
             if ctx:
                 await ctx.info(f"✅ Получено {len(documents)} документов")
             
             return ToolResult(
                 content=[TextContent(type="text", text=formatted_result)],
-                structured_content={"documents": documents},
+                structured_content=result,
                 meta={"count": len(documents)}
             )
             
@@ -0,0 +1,99 @@
+"""Инструмент для выполнения нескольких CAD операций одной транзакцией."""
+
+import httpx
+from typing import Any, Dict, List
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway, models
+from .utils import ToolResult, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
+
+@mcp.tool(
+    name="execute_plan",
+    description="""
+    Выполнить несколько CAD операций подряд одним вызовом, как одну транзакцию.
+    Операции (op): open_document, create_shape, create_complex_shape,
+    update_object, delete_object, save_document, close_document; остальные поля
+    шага - параметры операции. Если шаг завершится ошибкой, изменения всех
+    шагов отменяются. Возвращает результат каждого шага.
+    """
+)
+async def execute_plan(
+    steps: List[Dict[str, Any]] = Field(
+        ...,
+        description=(
+            'Шаги, например [{"op": "open_document", "file_path": "cube.FCStd"}, '
+            '{"op": "create_shape", "shape_type": "cube", "size": 20}, '
+            '{"op": "save_document"}, {"op": "close_document"}]'
+        )
+    ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Выполнить план операций.
+
+    Args:
+        steps: Шаги плана
+        idempotency_key: Ключ идемпотентности для повторов
+        ctx: Контекст для логирования
+
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    """
+    if ctx:
+        await ctx.info(f"📋 Выполняем план: шагов {len(steps)}")
+
+    try:
+        async with gateway.client(timeout=120.0) as client:
+            response = await client.post(
+                "/api/cad/plan",
+                json={"steps": steps},
+                headers=idempotency_headers(idempotency_key)
+            )
+            if response.status_code == 409:
+                # План выполнялся, но откатился: результаты шагов в data
+                data = response.json()
+                if ctx:
+                    await ctx.error(f"↩️ {data.get('detail')}")
+                detail = data.get("detail", "План отменен")
+                plan = models.to_dict(models.from_dict(models.PlanResult, data["data"]))
+                # error - признак неудачного вызова для метрик и кеша инструментов
+                return ToolResult(
+                    content=[TextContent(type="text", text=detail)],
+                    structured_content={**plan, "error": detail},
+                    meta={"status": "rolled_back"}
+                )
+            response.raise_for_status()
+            data = response.json()
+
+            if ctx:
+                await ctx.info(f"🎯 {data.get('result')}")
+
+            return ToolResult(
+                content=[TextContent(type="text", text=data.get("result", "успешно"))],
+                structured_content=models.from_dict(models.PlanResult, data["data"]),
+                meta={"status": "success", "steps": len(steps)}
+            )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при выполнении плана: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
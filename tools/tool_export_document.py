@@ -0,0 +1,90 @@
+"""Инструмент для экспорта документа в STEP/IGES/BREP/STL."""
+
+import httpx
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway, models
+from .utils import ToolResult, run_streaming, idempotency_headers, STREAM_READ_TIMEOUT, IDEMPOTENCY_KEY_DESCRIPTION
+
+@mcp.tool(
+    name="export_document",
+    description="""
+    Экспортировать текущий документ FreeCAD в файл STEP, IGES, BREP или STL.
+    Формат определяется расширением file_path (.step, .iges, .brep, .stl).
+    По умолчанию экспортируются все объекты с геометрией.
+    """
+)
+async def export_document(
+    file_path: str = Field(
+        ...,
+        description="Путь к файлу экспорта, например model.step"
+    ),
+    objects: str = Field(
+        None,
+        description="Имена объектов через запятую (по умолчанию все)"
+    ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Экспортировать документ.
+    
+    Args:
+        file_path: Путь к файлу экспорта
+        objects: Имена объектов через запятую
+        idempotency_key: Ключ идемпотентности для повторов
+        ctx: Контекст для логирования и прогресса
+    
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    """
+    params = {"file_path": file_path}
+    if objects:
+        params["objects"] = objects
+    
+    if ctx:
+        await ctx.info(f"📤 Экспортируем документ в {file_path}")
+    
+    try:
+        async with gateway.client(timeout=httpx.Timeout(30.0, read=STREAM_READ_TIMEOUT)) as client:
+            final = await run_streaming(
+                client, "GET", "/api/cad/export/stream",
+                ctx=ctx, params=params,
+                headers=idempotency_headers(idempotency_key)
+            )
+        
+        if final["event"] == "error":
+            raise RuntimeError(final["message"])
+        
+        data = final["data"]
+        if ctx:
+            await ctx.info(f"🎯 {data['message']}")
+        
+        return ToolResult(
+            content=[TextContent(type="text", text=data["message"])],
+            structured_content=models.from_dict(models.DocumentResult, data),
+            meta={"status": "success", "file_path": file_path}
+        )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при экспорте: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
@@ -0,0 +1,68 @@
+"""Инструмент для получения состояния асинхронной задачи гейтвея."""
+
+import httpx
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway, models
+from .utils import ToolResult
+
+@mcp.tool(
+    name="get_job",
+    description="""
+    Получить состояние, прогресс и (для завершенной задачи) результат
+    асинхронной задачи гейтвея: пачки фигур, загрузки JSONL или экспорта.
+    ID задачи возвращается при ее постановке в очередь.
+    """
+)
+async def get_job(
+    job_id: str = Field(
+        ...,
+        description="ID задачи"
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Получить состояние задачи.
+    
+    Args:
+        job_id: ID задачи
+        ctx: Контекст для логирования
+    
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    """
+    try:
+        async with gateway.client(timeout=30.0) as client:
+            response = await client.get(f"/api/jobs/{job_id}/result")
+            response.raise_for_status()
+            data = response.json()
+            
+            info = data.get("data", {})
+            if ctx:
+                await ctx.info(f"📋 {data.get('result')}: {info.get('progress')}")
+            
+            return ToolResult(
+                content=[TextContent(type="text", text=data.get("result", ""))],
+                structured_content={"job": models.from_dict(models.JobInfo, info), "output": data.get("output")},
+                meta={"status": "success", "job_status": info.get("status")}
+            )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при получении задачи: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
@@ -5,7 +5,8 @@ from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
-from .utils import ToolResult
+from . import gateway, models
+from .utils import ToolResult, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
 
 @mcp.tool(
     name="open_document",
@@ -22,6 +23,10 @@ async def open_document(
         ...,
         description="Путь к файлу FreeCAD (.FCStd). Если не существует, будет создан новый."
     ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
     ctx: Context = None
 ) -> ToolResult:
     """
@@ -29,6 +34,7 @@ async def open_document(
     
     Args:
         file_path: Путь к файлу FreeCAD (.FCStd). Обязательный параметр.
+        idempotency_key: Ключ идемпотентности для повторов
         ctx: Контекст для логирования
     
     Returns:
@@ -53,11 +59,12 @@ async def open_document(
         await ctx.info(f"📂 Открываем или создаем документ: {file_path}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with gateway.client(timeout=30.0) as client:
             params = {"file_path": file_path}
             response = await client.get(
-                "http://localhost:8001/api/cad/open-document",
-                params=params
+                "/api/cad/open-document",
+                params=params,
+                headers=idempotency_headers(idempotency_key)
             )
             response.raise_for_status()
             data = response.json()
@@ -67,7 +74,7 @@ async def open_document(
             
             return ToolResult(
                 content=[TextContent(type="text", text=data.get("result", "успешно"))],
-                structured_content=data,
+                structured_content=models.from_dict(models.DocumentResult, data["data"]),
                 meta={"status": "success", "file_path": file_path}
             )
     except httpx.HTTPStatusError as e:
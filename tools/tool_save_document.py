@@ -3,7 +3,8 @@ from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
-from .utils import ToolResult
+from . import gateway, models
+from .utils import ToolResult, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
 
 @mcp.tool(
     name="save_document",
@@ -18,6 +19,10 @@ async def save_document(
         None,
         description="Опциональный новый путь для сохранения (save as). Если не указан, сохраняет в текущий файл."
     ),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
     ctx: Context = None
 ) -> ToolResult:
     """
@@ -25,6 +30,7 @@ async def save_document(
     
     Args:
         file_path: Опциональный новый путь для сохранения.
+        idempotency_key: Ключ идемпотентности для повторов
         ctx: Контекст для логирования
     
     Returns:
@@ -38,13 +44,14 @@ async def save_document(
         await ctx.info(f"💾 Сохраняем документ{' как ' + file_path if file_path else ''}")
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with gateway.client(timeout=30.0) as client:
             params = {}
             if file_path:
                 params["file_path"] = file_path
             response = await client.get(
-                "http://localhost:8001/api/cad/save-document",
-                params=params
+                "/api/cad/save-document",
+                params=params,
+                headers=idempotency_headers(idempotency_key)
             )
             response.raise_for_status()
             data = response.json()
@@ -54,7 +61,7 @@ async def save_document(
             
             return ToolResult(
                 content=[TextContent(type="text", text=data.get("result", "успешно"))],
-                structured_content=data,
+                structured_content=models.from_dict(models.DocumentResult, data["data"]),
                 meta={"status": "success", "file_path": file_path}
             )
     except httpx.HTTPStatusError as e:
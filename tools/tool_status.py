@@ -4,7 +4,9 @@
 from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
+import tool_cache
 from mcp_instance import mcp
+from . import gateway
 from .utils import ToolResult
 
 @mcp.tool(
@@ -25,33 +27,42 @@ async def get_mcp_status(
     Returns:
         ToolResult: Результат выполнения инструмента
     """
-    import httpx
-    
     if ctx:
         await ctx.info("📊 Запрашиваем статус MCP сервера")
     
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get("http://localhost:8001/api/mcp/status")
+    async def fetch_status():
+        async with gateway.client(timeout=30.0) as client:
+            response = await client.get("/api/mcp/status")
             response.raise_for_status()
-            data = response.json()
-            
-            tools_list = "\n".join([f"  - {tool}" for tool in data.get("tools", [])])
-            result_text = (f"📊 Статус MCP сервера:\n"
-                          f"Состояние: {data.get('status', 'unknown')}\n"
-                          f"Доступные инструменты:\n{tools_list}")
-            
-            if ctx:
-                await ctx.info("✅ Статус получен успешно")
-            
-            return ToolResult(
-                content=[TextContent(type="text", text=result_text)],
-                structured_content=data,
-                meta={"status": "success"}
-            )
-            
+            return response.json()
+    
+    try:
+        # Статус гейтвея не меняется за время его жизни - кешируется на TTL;
+        # статистика кеша ниже всегда свежая
+        data = await tool_cache.cache.get_or_call("get_mcp_status", {}, 0, fetch_status)
+        cache_stats = tool_cache.cache.stats()
+        
+        tools_list = "\n".join([f"  - {tool}" for tool in data.get("tools", [])])
+        hit_rates = "\n".join(
+            f"  - {tool}: {stats['hit_rate']:.0%} ({stats['hit']} из {stats['hit'] + stats['miss']})"
+            for tool, stats in cache_stats["tools"].items()
+        ) or "  - обращений еще не было"
+        result_text = (f"📊 Статус MCP сервера:\n"
+                      f"Состояние: {data.get('status', 'unknown')}\n"
+                      f"Доступные инструменты:\n{tools_list}\n"
+                      f"Кеш read-only инструментов (попадания):\n{hit_rates}")
+        
+        if ctx:
+            await ctx.info("✅ Статус получен успешно")
+        
+        return ToolResult(
+            content=[TextContent(type="text", text=result_text)],
+            structured_content={**data, "tool_cache": cache_stats},
+            meta={"status": "success"}
+        )
+        
     except Exception as e:
-        error_text = f"Не удалось получить статус: {str(e)}\nУбедитесь, что FastAPI сервер запущен на http://localhost:8001"
+        error_text = f"Не удалось получить статус: {str(e)}\nУбедитесь, что FastAPI сервер запущен на {gateway.GATEWAY_URL}"
         if ctx:
             await ctx.error(f"❌ {error_text}")
         
@@ -7,6 +7,7 @@ from fastmcp import Context
 from pydantic import Field
 from mcp.types import TextContent
 from mcp_instance import mcp
+from . import gateway
 from .utils import ToolResult, validate_shape_type, validate_size
 
 async def _create_test_shape_impl(
@@ -69,10 +70,10 @@ async def _create_test_shape_impl(
     
     try:
         # 1. Открываем/создаем документ
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with gateway.client(timeout=30.0) as client:
             # Открываем или создаем документ
             open_response = await client.get(
-                "http://localhost:8001/api/cad/open-document",
+                "/api/cad/open-document",
                 params={"file_path": file_name}
             )
             open_response.raise_for_status()
@@ -90,7 +91,7 @@ async def _create_test_shape_impl(
                 "z": z
             }
             create_response = await client.get(
-                "http://localhost:8001/api/cad/create-shape",
+                "/api/cad/create-shape",
                 params=params
             )
             create_response.raise_for_status()
@@ -98,7 +99,7 @@ async def _create_test_shape_impl(
             
             # 3. Сохраняем документ
             save_response = await client.get(
-                "http://localhost:8001/api/cad/save-document",
+                "/api/cad/save-document",
                 params={"file_path": file_name}
             )
             save_response.raise_for_status()
@@ -106,7 +107,7 @@ async def _create_test_shape_impl(
             
             # 4. Закрываем документ
             close_response = await client.get(
-                "http://localhost:8001/api/cad/close-document"
+                "/api/cad/close-document"
             )
             close_response.raise_for_status()
             close_result = close_response.json()
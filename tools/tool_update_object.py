@@ -0,0 +1,127 @@
+"""Инструмент для изменения параметров существующего объекта в CAD системе."""
+
+import httpx
+from fastmcp import Context
+from pydantic import Field
+from mcp.types import TextContent
+from mcp_instance import mcp
+from . import gateway, models
+from .utils import ToolResult, idempotency_headers, IDEMPOTENCY_KEY_DESCRIPTION
+
+@mcp.tool(
+    name="update_object",
+    description="""
+    Изменить параметры уже созданного объекта (размер, координаты, радиусы и т.д.)
+    без пересоздания документа.
+    Для cube/sphere/cylinder: size, x, y, z.
+    Для star: num_points, inner_radius, outer_radius, height.
+    Для gear: teeth, module, outer_radius, height.
+    Для torus: major_radius, minor_radius.
+    Указывайте только те параметры, которые нужно изменить.
+    Пересчитываются только сам объект и зависящие от него объекты.
+    """
+)
+async def update_object(
+    name: str = Field(
+        ...,
+        description="Имя объекта в документе (возвращается при создании фигуры)"
+    ),
+    size: float = Field(None, description="Новый размер в мм (cube/sphere/cylinder)"),
+    x: float = Field(None, description="Новая X-координата в мм (cube/sphere/cylinder)"),
+    y: float = Field(None, description="Новая Y-координата в мм (cube/sphere/cylinder)"),
+    z: float = Field(None, description="Новая Z-координата в мм (cube/sphere/cylinder)"),
+    num_points: int = Field(None, description="Для star: количество лучей (нечетное число >=5)"),
+    inner_radius: float = Field(None, description="Для star: внутренний радиус в мм"),
+    outer_radius: float = Field(None, description="Для star/gear: внешний радиус в мм"),
+    height: float = Field(None, description="Для star/gear: высота в мм"),
+    teeth: int = Field(None, description="Для gear: количество зубьев (>=3)"),
+    module: float = Field(None, description="Для gear: модуль в мм"),
+    major_radius: float = Field(None, description="Для torus: большой радиус в мм"),
+    minor_radius: float = Field(None, description="Для torus: малый радиус в мм"),
+    idempotency_key: str = Field(
+        None,
+        description=IDEMPOTENCY_KEY_DESCRIPTION
+    ),
+    ctx: Context = None
+) -> ToolResult:
+    """
+    Изменить параметры существующего объекта.
+    
+    Args:
+        name: Имя объекта в текущем документе
+        size, x, y, z, ...: Новые значения параметров (None - не менять)
+        idempotency_key: Ключ идемпотентности для повторов
+        ctx: Контекст для логирования
+    
+    Returns:
+        ToolResult: Результат выполнения инструмента
+    
+    Валидация: Проверка итоговых параметров выполняется на стороне core.
+    Обработка ошибок: Возвращает ошибку если объект не найден или параметры недопустимы.
+    """
+    if not name:
+        error_msg = "Ошибка: имя объекта обязательно"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": "missing_name"},
+            meta={"status": "validation_error"}
+        )
+    
+    params = {
+        "name": name,
+        "size": size,
+        "x": x,
+        "y": y,
+        "z": z,
+        "num_points": num_points,
+        "inner_radius": inner_radius,
+        "outer_radius": outer_radius,
+        "height": height,
+        "teeth": teeth,
+        "module": module,
+        "major_radius": major_radius,
+        "minor_radius": minor_radius
+    }
+    params = {k: v for k, v in params.items() if v is not None}
+    
+    if ctx:
+        await ctx.info(f"✏️ Изменяем объект {name}: {params}")
+    
+    try:
+        async with gateway.client(timeout=30.0) as client:
+            response = await client.get(
+                "/api/cad/update-object",
+                params=params,
+                headers=idempotency_headers(idempotency_key)
+            )
+            response.raise_for_status()
+            data = response.json()
+            
+            if ctx:
+                await ctx.info(f"🎯 {data.get('result')}")
+            
+            return ToolResult(
+                content=[TextContent(type="text", text=data.get("result", "успешно"))],
+                structured_content=models.from_dict(models.ObjectUpdateResult, data["data"]),
+                meta={"status": "success", "name": name}
+            )
+    except httpx.HTTPStatusError as e:
+        error_msg = f"HTTP ошибка: {e.response.status_code} - {e.response.text}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "http_error"}
+        )
+    except Exception as e:
+        error_msg = f"Ошибка при изменении объекта: {str(e)}"
+        if ctx:
+            await ctx.error(f"❌ {error_msg}")
+        return ToolResult(
+            content=[TextContent(type="text", text=error_msg)],
+            structured_content={"error": str(e)},
+            meta={"status": "error"}
+        )
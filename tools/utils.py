@@ -2,14 +2,28 @@
 Общие утилиты для CAD MCP сервера.
 """
 
+import json
+from fastmcp.tools.tool import ToolResult as FastMCPToolResult
 from mcp.types import TextContent
 from typing import List, Dict, Any, Optional
+from . import models
 
+IDEMPOTENCY_KEY_DESCRIPTION = (
+    "Необязательный ключ идемпотентности (любая уникальная строка). Повторный вызов "
+    "с тем же ключом вернет прежний результат, не выполняя операцию заново"
+)
 
-class ToolResult:
+# Таймаут чтения потокового ответа: гейтвей шлет heartbeat каждые 10 с
+STREAM_READ_TIMEOUT = 60.0
+
+
+class ToolResult(FastMCPToolResult):
     """
     Результат выполнения инструмента.
     
+    Наследник ToolResult FastMCP: клиенты MCP получают structured_content
+    в structuredContent и meta в _meta, а не текст, полученный из объекта.
+    
     Attributes:
         content: Текстовое содержимое для отображения пользователю
         structured_content: Структурированные данные для дальнейшей обработки
@@ -22,9 +36,16 @@ class ToolResult:
         structured_content: Optional[Dict[str, Any]] = None,
         meta: Optional[Dict[str, Any]] = None
     ):
-        self.content = content
-        self.structured_content = structured_content or {}
-        self.meta = meta or {}
+        # Модели из tools.models превращаются в обычные словари
+        super().__init__(
+            content=content,
+            structured_content=models.to_dict(structured_content) or {},
+            meta=meta or {}
+        )
+    
+    def to_json(self) -> bytes:
+        """Компактный JSON структурированного результата и метаданных."""
+        return models.dumps({"structured_content": self.structured_content, "meta": self.meta})
     
     def __str__(self) -> str:
         """Преобразует ToolResult в строку для отображения."""
@@ -47,6 +68,44 @@ class ToolResult:
         return f"ToolResult(content={self.content})"
 
 
+def idempotency_headers(idempotency_key: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Заголовки запроса к гейтвею с Idempotency-Key (если ключ задан)."""
+    headers = dict(headers or {})
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    return headers
+
+
+async def run_streaming(client, method: str, url: str, ctx=None, **kwargs) -> Dict[str, Any]:
+    """
+    Выполнить потоковый (NDJSON) запрос к гейтвею, передавая прогресс
+    событий item в ctx.report_progress.
+    
+    Returns:
+        dict: Последнее событие done или error
+    
+    Raises:
+        httpx.HTTPStatusError: если гейтвей отклонил запрос до начала потока
+    """
+    params = dict(kwargs.pop("params", None) or {}, format="ndjson")
+    final = {"event": "error", "message": "Поток завершился без результата"}
+    async with client.stream(method, url, params=params, **kwargs) as response:
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["event"] in ("item", "start") and ctx:
+                await ctx.report_progress(event["done"], event["total"])
+            elif event["event"] in ("done", "error"):
+                final = event
+    if final["event"] == "done" and ctx and "total" in final:
+        await ctx.report_progress(final["done"], final["total"])
+    return final
+
+
 def validate_shape_type(shape_type: str) -> bool:
     """
     Проверяет, является ли тип фигуры допустимым.
@@ -0,0 +1,206 @@
+"""
+Сквозная трассировка: MCP инструмент → HTTP гейтвей → FreeCADCore.
+
+Span - именованный интервал времени внутри трассы. Текущий span хранится в
+contextvars, поэтому вложенные span'ы автоматически получают родителя.
+Между процессами/слоями трасса передается заголовками X-CAD-Trace-Id и
+X-CAD-Parent-Span, а длительности стадий гейтвея возвращаются клиенту в
+стандартном заголовке Server-Timing.
+
+Экспорт завершенных span'ов (по одному JSON на строку) включается
+переменными окружения:
+    CAD_SPANS_FILE=spans.jsonl               - в файл
+    CAD_SPANS_COLLECTOR_URL=http://host/...  - POST пачками в локальный коллектор
+    CAD_SPANS_IN_META=1                      - отдавать разбивку по стадиям в ToolResult.meta
+"""
+
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+
+TRACE_HEADER = "X-CAD-Trace-Id"
+PARENT_HEADER = "X-CAD-Parent-Span"
+SERVER_TIMING_HEADER = "Server-Timing"
+
+INCLUDE_TIMINGS_IN_META = os.getenv("CAD_SPANS_IN_META", "").lower() in ("1", "true", "yes")
+
+_current_span = contextvars.ContextVar("cad_current_span", default=None)
+
+
+class Span:
+    """Один интервал трассы."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes",
+                 "start", "duration_ms", "_started", "_finished")
+
+    def __init__(self, name, trace_id, parent_id=None, finished=None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration_ms = None
+        self._started = time.perf_counter()
+        # Общий для всей трассы (в пределах процесса) список завершенных span'ов
+        self._finished = finished if finished is not None else []
+
+    def elapsed_ms(self):
+        """Длительность span'а: итоговая, либо прошедшая на данный момент."""
+        if self.duration_ms is not None:
+            return self.duration_ms
+        return round((time.perf_counter() - self._started) * 1000, 3)
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        self._finished.append(self)
+        _exporter.export(self)
+
+    def finished_spans(self):
+        """Завершенные span'ы этой трассы в текущем процессе."""
+        return list(self._finished)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes
+        }
+
+
+def current_span():
+    """Текущий span или None вне трассы."""
+    return _current_span.get()
+
+
+def start_span(name, trace_id=None, parent_id=None, **attributes):
+    """
+    Создать span: дочерний к текущему, либо корневой для trace_id
+    (новая трасса, если trace_id не передан).
+    """
+    parent = _current_span.get()
+    if parent is not None and trace_id is None:
+        return Span(name, parent.trace_id, parent.span_id, parent._finished, **attributes)
+    return Span(name, trace_id or uuid.uuid4().hex, parent_id, **attributes)
+
+
+@contextmanager
+def span(name, trace_id=None, parent_id=None, **attributes):
+    """Контекстный менеджер span'а; внутри блока он становится текущим."""
+    s = start_span(name, trace_id, parent_id, **attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    finally:
+        _current_span.reset(token)
+        s.finish()
+
+
+def record_span(name, duration_ms, **attributes):
+    """Добавить уже завершенный дочерний span (например, время ожидания в очереди)."""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    s = Span(name, parent.trace_id, parent.span_id, parent._finished, **attributes)
+    s.start -= duration_ms / 1000
+    s.duration_ms = round(duration_ms, 3)
+    s._finished.append(s)
+    _exporter.export(s)
+    return s
+
+
+def inject_headers(headers=None):
+    """Добавить заголовки трассировки текущего span'а для исходящего запроса."""
+    headers = dict(headers or {})
+    s = _current_span.get()
+    if s is not None:
+        headers[TRACE_HEADER] = s.trace_id
+        headers[PARENT_HEADER] = s.span_id
+    return headers
+
+
+def server_timing(spans):
+    """Заголовок Server-Timing из списка span'ов."""
+    return ", ".join(f"{s.name};dur={s.duration_ms}" for s in spans if s.duration_ms is not None)
+
+
+def parse_server_timing(value):
+    """Разобрать Server-Timing в {стадия: миллисекунды}."""
+    timings = {}
+    for item in (value or "").split(","):
+        name, _, rest = item.strip().partition(";")
+        for param in rest.split(";"):
+            key, _, dur = param.strip().partition("=")
+            if name and key == "dur":
+                try:
+                    timings[name] = timings.get(name, 0.0) + float(dur)
+                except ValueError:
+                    pass
+    return timings
+
+
+def timings_meta(s):
+    """
+    Разбивка по стадиям для ToolResult.meta: span'ы трассы в этом процессе
+    плюс стадии, которые вернул гейтвей (атрибут server_timing HTTP span'а).
+    """
+    # Незавершенный корневой span еще не попал в список завершенных
+    timings = {} if s.duration_ms is not None else {s.name: s.elapsed_ms()}
+    remote = {}
+    for finished in s.finished_spans():
+        timings[finished.name] = round(timings.get(finished.name, 0.0) + finished.duration_ms, 3)
+        remote.update(finished.attributes.get("server_timing", {}))
+    for name, duration in remote.items():
+        timings.setdefault(name, duration)
+    return {"trace_id": s.trace_id, "timings_ms": timings}
+
+
+class _Exporter:
+    """Фоновая выгрузка span'ов в файл и/или коллектор."""
+
+    BATCH_SIZE = 100
+
+    def __init__(self, file_path=None, collector_url=None):
+        self.file_path = file_path
+        self.collector_url = collector_url
+        self.enabled = bool(file_path or collector_url)
+        if self.enabled:
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._loop, name="span-exporter", daemon=True).start()
+
+    def export(self, s):
+        if self.enabled:
+            self._queue.put(s.to_dict())
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get())
+            if self.file_path:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in batch)
+            if self.collector_url:
+                try:
+                    request = urllib.request.Request(
+                        self.collector_url,
+                        data=json.dumps(batch).encode("utf-8"),
+                        headers={"Content-Type": "application/json"}
+                    )
+                    urllib.request.urlopen(request, timeout=5).close()
+                except OSError:
+                    # Коллектор недоступен - span'ы этой пачки теряются, запросы не страдают
+                    pass
+
+
+_exporter = _Exporter(os.getenv("CAD_SPANS_FILE"), os.getenv("CAD_SPANS_COLLECTOR_URL"))
@@ -0,0 +1,294 @@
+"""
+WebSocket сессия для интерактивного моделирования.
+
+Одно постоянное соединение вместо HTTP запроса на каждую мелкую операцию.
+Протокол - JSON сообщения в текстовых кадрах:
+
+    запрос:  {"id": "1", "op": "create_shape", "params": {"shape_type": "cube", "size": 10}}
+    ответ:   {"id": "1", "ok": true, "result": "...", "data": {...}}
+    ошибка:  {"id": "1", "ok": false, "error": {"code": "...", "message": "..."}}
+    событие: {"event": "objects_created", "document": "...", "objects": [...], "ts": ...}
+
+Запросы мультиплексируются: клиент может отправлять следующие, не дожидаясь
+ответов, и сопоставляет ответы по id. Операции FreeCAD уходят в очередь
+потока FreeCAD в порядке поступления, поэтому порядок мутаций сессии
+сохраняется. Одновременно в работе не больше MAX_IN_FLIGHT запросов -
+дальше сессия перестает читать сокет (обратное давление на клиента).
+
+До open_document операции работают с общим текущим документом гейтвея.
+open_document привязывает соединение к своей сессии (sessions.py): дальше
+документ берется из сессии в том же вызове потока FreeCAD, что и сама
+операция, поэтому другой клиент не может подменить его между проверкой и
+изменением. С заголовком X-CAD-Session соединение сразу работает в этой
+сессии (общей с HTTP-запросами клиента). Собственная сессия соединения
+завершается при отключении: ее документ сохраняется и закрывается.
+
+События ленты изменений (changes.py) приходят после операции subscribe
+или при подключении с ?events=true.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from starlette.websockets import WebSocketDisconnect
+
+import bulk_loader
+import sessions
+import tracing
+from changes import feed
+from common_logic import core, SIMPLE_SHAPES
+from middleware.custom_middleware import client_identity
+from metrics import WS_SESSIONS, WS_OPERATIONS, WS_OPERATION_SECONDS
+from tools import models
+from tools.models import ErrorResult
+
+logger = logging.getLogger("WebSocket")
+
+MAX_IN_FLIGHT = 64
+
+
+class ProtocolError(Exception):
+    """Некорректный запрос клиента."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class Session:
+    """Одна WebSocket сессия."""
+
+    def __init__(self, websocket, max_in_flight=MAX_IN_FLIGHT):
+        self.websocket = websocket
+        # Сессия документов (None - общий текущий документ гейтвея)
+        self.session = websocket.headers.get(sessions.SESSION_HEADER)
+        self.owns_session = False
+        self._send_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+        self._subscription = None
+        self._events_task = None
+        self._event_filter = None
+
+    async def run(self, subscribe=False):
+        """Принять соединение и обслуживать его до отключения клиента."""
+        await self.websocket.accept()
+        WS_SESSIONS.inc()
+        if subscribe:
+            self._subscribe(None)
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                await self._slots.acquire()
+                task = asyncio.create_task(self._handle(text))
+                self._tasks.add(task)
+                task.add_done_callback(self._task_done)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            WS_SESSIONS.dec()
+            self._unsubscribe()
+            for task in self._tasks:
+                task.cancel()
+            if self.owns_session:
+                # Документ сохраняется, даже если обработчик соединения отменяют
+                await asyncio.shield(self._release_session())
+
+    async def _release_session(self):
+        state = sessions.registry.pop(self.session)
+        if state is None:
+            return
+        result = await core.release_session(self.session, state.document)
+        if models.is_error(result):
+            logger.warning(result.message)
+
+    def bind_session(self):
+        """Привязать соединение к собственной сессии (в контексте текущей операции)."""
+        if self.session is None:
+            session = f"ws-{uuid.uuid4().hex}"
+            try:
+                sessions.registry.touch(session, client_identity(self.websocket.scope))
+            except RuntimeError as e:
+                raise ProtocolError("too_many_sessions", str(e))
+            self.session = session
+            self.owns_session = True
+            sessions.current_session.set(session)
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _send(self, message):
+        async with self._send_lock:
+            await self.websocket.send_text(models.dumps(message).decode("utf-8"))
+
+    async def _handle(self, text):
+        request_id, op = None, "invalid"
+        started = time.perf_counter()
+        token = sessions.current_session.set(self.session)
+        try:
+            if self.session is not None:
+                try:
+                    sessions.registry.touch(self.session, client_identity(self.websocket.scope))
+                except RuntimeError as e:
+                    raise ProtocolError("too_many_sessions", str(e))
+            try:
+                request = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise ProtocolError("invalid_json", f"Некорректный JSON: {e}")
+            if not isinstance(request, dict):
+                raise ProtocolError("invalid_request", "Запрос должен быть JSON-объектом")
+            request_id = request.get("id")
+            op = request.get("op")
+            params = request.get("params") or {}
+            handler = OPERATIONS.get(op)
+            if handler is None:
+                op = "unknown"
+                raise ProtocolError("unknown_op", f"Неизвестная операция. Доступно: {', '.join(OPERATIONS)}")
+            if not isinstance(params, dict):
+                raise ProtocolError("invalid_params", "params должен быть JSON-объектом")
+            with tracing.span(f"ws.{op}"):
+                result = await handler(self, params)
+            
+            if models.is_error(result):
+                raise ProtocolError(result.code, result.message)
+            if isinstance(result, dict):
+                response = {"id": request_id, "ok": True, "data": result}
+            else:
+                response = {"id": request_id, "ok": True, "result": result.message, "data": result}
+            status = "ok"
+        except ProtocolError as e:
+            response = {"id": request_id, "ok": False, "error": {"code": e.code, "message": e.message}}
+            status = "error"
+        except (TypeError, ValueError) as e:
+            response = {"id": request_id, "ok": False, "error": {"code": "invalid_params", "message": str(e)}}
+            status = "error"
+        except Exception as e:
+            logger.exception(f"Ошибка операции {op}")
+            response = {"id": request_id, "ok": False, "error": {"code": "internal_error", "message": str(e)}}
+            status = "error"
+        finally:
+            sessions.current_session.reset(token)
+        
+        WS_OPERATIONS.labels(op, status).inc()
+        WS_OPERATION_SECONDS.labels(op).observe(time.perf_counter() - started)
+        try:
+            await self._send(response)
+        except (WebSocketDisconnect, RuntimeError):
+            # Клиент отключился, не дождавшись ответа
+            pass
+
+    def _subscribe(self, document):
+        self._event_filter = document
+        if self._subscription is None:
+            self._subscription = feed.subscribe()
+            self._events_task = asyncio.create_task(self._pump_events())
+
+    def _unsubscribe(self):
+        if self._subscription is not None:
+            feed.unsubscribe(self._subscription)
+            self._events_task.cancel()
+            self._subscription = None
+            self._events_task = None
+
+    async def _pump_events(self):
+        """Пересылать события ленты изменений клиенту."""
+        while True:
+            event = await self._subscription.get()
+            if self._event_filter and event.get("document") not in (None, self._event_filter):
+                continue
+            try:
+                await self._send(event)
+            except (WebSocketDisconnect, RuntimeError):
+                return
+
+
+# ============ ОПЕРАЦИИ ============
+async def _ping(session, params):
+    return {"pong": time.time()}
+
+
+async def _get_documents(session, params):
+    return await core.get_onshape_documents()
+
+
+async def _open_document(session, params):
+    file_path = params.get("file_path")
+    if not file_path:
+        return ErrorResult("invalid_params", "Путь к файлу обязателен")
+    session.bind_session()
+    return await core.open_document(file_path)
+
+
+async def _save_document(session, params):
+    return await core.save_document(params.get("file_path"))
+
+
+async def _close_document(session, params):
+    return await core.close_document()
+
+
+async def _list_objects(session, params):
+    return await core.list_objects()
+
+
+async def _create_shape(session, params):
+    shape_type, shape_params = bulk_loader.validate_shape_spec(params)
+    if shape_type in SIMPLE_SHAPES:
+        return await core.create_simple_shape(shape_type, **shape_params)
+    return await core.create_complex_shape(shape_type, **shape_params)
+
+
+async def _update_object(session, params):
+    params = dict(params)
+    name = params.pop("name", None)
+    if not name:
+        return ErrorResult("invalid_params", "Имя объекта обязательно")
+    return await core.update_object(name, **params)
+
+
+async def _delete_object(session, params):
+    name = params.get("name")
+    if not name:
+        return ErrorResult("invalid_params", "Имя объекта обязательно")
+    return await core.delete_object(name)
+
+
+async def _batch(session, params):
+    shapes = params.get("shapes")
+    if not isinstance(shapes, list) or not shapes:
+        return ErrorResult("invalid_params", "shapes должен быть непустым списком")
+    batch_size = int(params.get("batch_size", bulk_loader.DEFAULT_BATCH_SIZE))
+    if batch_size < 1 or batch_size > bulk_loader.MAX_BATCH_SIZE:
+        return ErrorResult("invalid_params", f"batch_size должен быть от 1 до {bulk_loader.MAX_BATCH_SIZE}")
+    return await bulk_loader.bulk_load(bulk_loader.iter_specs(shapes), batch_size, collect_names=True)
+
+
+async def _subscribe_op(session, params):
+    session._subscribe(params.get("document"))
+    return {"subscribed": True, "document": params.get("document")}
+
+
+async def _unsubscribe_op(session, params):
+    session._unsubscribe()
+    return {"subscribed": False}
+
+
+OPERATIONS = {
+    "ping": _ping,
+    "get_documents": _get_documents,
+    "open_document": _open_document,
+    "save_document": _save_document,
+    "close_document": _close_document,
+    "list_objects": _list_objects,
+    "create_shape": _create_shape,
+    "update_object": _update_object,
+    "delete_object": _delete_object,
+    "batch": _batch,
+    "subscribe": _subscribe_op,
+    "unsubscribe": _unsubscribe_op,
+}